@@ -0,0 +1,3 @@
+"""Benchmarks of the Brutus Python interface and library. Run them with ``python -m benchmarks``."""
+from ._harness import Measurement, Comparison, compare, save_results, load_results
+from ._suite import BENCHMARKS
@@ -0,0 +1,59 @@
+import argparse
+import sys
+
+from ._harness import (environment, save_results, load_results, compare, format_measurements,
+                       format_comparisons)
+from ._suite import BENCHMARKS
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Runs the Brutus benchmarks and compares them to a baseline.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'Benchmarks to run, among: {", ".join(BENCHMARKS)}. All of them by default.')
+    parser.add_argument('--quick', action='store_true', help='Run smaller problems, to check the suite works.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repeats; the best one is kept.')
+    parser.add_argument('--output', help='Save the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results to those saved in this JSON file.')
+    parser.add_argument('--results', help='Compare the results saved in this JSON file instead of running the '
+                                          'benchmarks. Requires --baseline.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Fraction by which a result may be worse than the baseline before it is reported as a '
+                             'regression (default: 0.1).')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'Unknown benchmarks: {", ".join(unknown)}. Must be among: {", ".join(BENCHMARKS)}.')
+
+    if args.results:
+        if not args.baseline:
+            parser.error('--results requires --baseline.')
+        measurements, _ = load_results(args.results)
+    else:
+        measurements = []
+        for name in args.benchmarks or BENCHMARKS:
+            print(f'Running {name}...', file=sys.stderr)
+            measurements.extend(BENCHMARKS[name](args.quick, args.repeat))
+
+        print(format_measurements(measurements))
+        if args.output:
+            save_results(args.output, measurements, {**environment(), 'quick': args.quick, 'repeat': args.repeat})
+
+    if not args.baseline:
+        return 0
+
+    baseline, _ = load_results(args.baseline)
+    comparisons = compare(measurements, baseline)
+    print()
+    print(format_comparisons(comparisons, args.threshold))
+
+    regressions = [comparison for comparison in comparisons if comparison.slowdown > args.threshold]
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) above {args.threshold:.0%}.', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
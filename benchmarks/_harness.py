@@ -0,0 +1,138 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field, asdict
+
+import numpy as np
+
+
+FORMAT = 'brutus-benchmarks'
+VERSION = 1
+
+
+@dataclass(frozen=True)
+class Measurement:
+    """The result of a benchmark for one set of parameters.
+
+    The value is the best of the repeats, so it is the least affected by other processes running on the machine.
+    """
+    name: str
+    value: float
+    unit: str
+    lower_is_better: bool = True
+    params: dict = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        """Identifies the measurement across runs: its name followed by its parameters."""
+        if not self.params:
+            return self.name
+        return f'{self.name}[{",".join(f"{name}={value}" for name, value in self.params.items())}]'
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """A measurement compared to the same measurement in a baseline run."""
+    key: str
+    baseline: float
+    value: float
+    unit: str
+    lower_is_better: bool
+
+    @property
+    def slowdown(self) -> float:
+        """How much worse the value is than the baseline, as a fraction: 0.1 means 10% worse, -0.1 10% better."""
+        if self.lower_is_better:
+            return self.value / self.baseline - 1 if self.baseline else 0.0
+        return self.baseline / self.value - 1 if self.value else float('inf')
+
+
+def best_time(function, repeat: int) -> float:
+    """Calls function repeat times and returns the shortest wall time, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def environment() -> dict:
+    """Describes the machine and the build the benchmarks ran on, to tell apart results that are not comparable."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_results(path: os.PathLike, measurements: list[Measurement], metadata: dict):
+    """Saves measurements to a JSON file, with the metadata of the run."""
+    data = {
+        'format': FORMAT,
+        'version': VERSION,
+        'metadata': metadata,
+        'measurements': [asdict(measurement) for measurement in measurements],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def load_results(path: os.PathLike) -> tuple[list[Measurement], dict]:
+    """Loads the measurements and metadata saved by :func:`save_results`."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    if data.get('format') != FORMAT:
+        raise ValueError(f'"{path}" is not a Brutus benchmark result.')
+    if data.get('version') != VERSION:
+        raise ValueError(f'Unsupported benchmark result version {data.get("version")}.')
+
+    return [Measurement(**measurement) for measurement in data['measurements']], data['metadata']
+
+
+def compare(measurements: list[Measurement], baseline: list[Measurement]) -> list[Comparison]:
+    """Compares the measurements to those of a baseline run with the same key. Others are left out."""
+    baseline_values = {measurement.key: measurement for measurement in baseline}
+    comparisons = []
+    for measurement in measurements:
+        reference = baseline_values.get(measurement.key)
+        if reference is None or reference.unit != measurement.unit:
+            continue
+        comparisons.append(Comparison(key=measurement.key,
+                                      baseline=reference.value,
+                                      value=measurement.value,
+                                      unit=measurement.unit,
+                                      lower_is_better=measurement.lower_is_better))
+    return comparisons
+
+
+def format_measurements(measurements: list[Measurement]) -> str:
+    """Formats measurements as a table, one per line."""
+    width = max((len(measurement.key) for measurement in measurements), default=0)
+    return '\n'.join(f'{measurement.key:<{width}}  {measurement.value:>14.6g} {measurement.unit}'
+                     for measurement in measurements)
+
+
+def format_comparisons(comparisons: list[Comparison], threshold: float) -> str:
+    """Formats comparisons as a table, one per line, flagging those more than threshold worse than the baseline."""
+    width = max((len(comparison.key) for comparison in comparisons), default=0)
+    lines = []
+    for comparison in comparisons:
+        flag = '  REGRESSION' if comparison.slowdown > threshold else ''
+        lines.append(f'{comparison.key:<{width}}  {comparison.baseline:>12.6g} -> {comparison.value:>12.6g} '
+                     f'{comparison.unit:<14} {comparison.slowdown:>+8.1%}{flag}')
+    return '\n'.join(lines)
@@ -0,0 +1,282 @@
+import os
+import tempfile
+import time as time_module
+
+import numpy as np
+
+from brutus import (BrutusIntegrator, Cluster, Star, Precision, OutputPolicy, StoppingConditions, RawOutput,
+                    PandasOutput, FileOutput, NumpyOutput)
+from brutus.output import Snapshot
+from brutus.simulation._simulation import BrutusInterface, _receives_snapshots
+
+from ._harness import Measurement, best_time
+
+
+def random_cluster(name: str, star_count: int, seed: int) -> Cluster:
+    """Returns a cluster of stars of equal mass with random positions and velocities, the same for the same seed."""
+    rng = np.random.default_rng(seed)
+    positions = rng.normal(size=(star_count, 3))
+    velocities = 0.3 * rng.normal(size=(star_count, 3))
+    return Cluster.from_arrays(np.arange(star_count), np.full(star_count, 1 / star_count), positions, velocities,
+                               name=name)
+
+
+def precision_for(word_length: int) -> Precision:
+    """Returns the precision settings with the smallest tolerance that Brutus uses for the given word length."""
+    return Precision(tolerance=10.0 ** -((word_length - 32) // 4), word_length=word_length)
+
+
+def _run_interface(interface: BrutusInterface, cluster: Cluster, time: float, time_step: float, precision: Precision,
+                   policy: OutputPolicy, snapshots: bool, stopping_conditions: StoppingConditions | None = None,
+                   reductions: bool = False):
+    """Simulates a cluster through the library interface, with callbacks that do nothing. Returns the handle's report
+    if reductions are enabled."""
+    handle = interface.init_cluster()
+    try:
+        interface.add_stars(handle, *cluster.to_arrays())
+        interface.set_precision(handle, precision)
+        interface.set_output_policy(handle, policy)
+        interface.set_stopping_conditions(handle, stopping_conditions)
+        interface.set_reductions(handle, reductions)
+
+        if snapshots:
+            buffer = np.zeros(Snapshot.size(len(cluster.stars)))
+            callback = interface.snapshot_callback_t(lambda: 0)
+            interface.evolve_snapshots(handle, time, time_step, buffer, callback)
+        else:
+            callback = interface.line_callback_t(lambda line: 0)
+            interface.evolve(handle, time, time_step, callback)
+
+        return interface.get_reductions(handle)
+    finally:
+        interface.cleanup(handle)
+
+
+def ffi_callback(quick: bool, repeat: int) -> list[Measurement]:
+    """Cost of one output through the library's callbacks: formatting or filling the snapshot, and calling into Python.
+
+    The same cluster is simulated with an output at every time step and with only the first and last ones. The
+    integrator stops at the same times in both cases and the energies are not computed, so the difference is the cost
+    of the outputs alone.
+    """
+    interface = BrutusInterface()
+    cluster = random_cluster('ffi', 3, seed=1)
+    precision = precision_for(64)
+    time, time_step = (0.05, 1e-3) if quick else (0.2, 1e-3)
+    every_step = OutputPolicy(energy_every=0)
+    ends_only = OutputPolicy(every=10 ** 9, energy_every=0)
+    outputs = every_step.snapshot_count(0, time, time_step) - ends_only.snapshot_count(0, time, time_step)
+
+    measurements = []
+    for path, snapshots in (('snapshot', True), ('line', False)):
+        with_outputs = best_time(lambda: _run_interface(interface, cluster, time, time_step, precision, every_step,
+                                                        snapshots), repeat)
+        without_outputs = best_time(lambda: _run_interface(interface, cluster, time, time_step, precision, ends_only,
+                                                           snapshots), repeat)
+        measurements.append(Measurement(name='ffi_callback',
+                                        value=max(with_outputs - without_outputs, 0) / outputs * 1e6,
+                                        unit='us/snapshot',
+                                        params={'path': path}))
+    return measurements
+
+
+def output_throughput(quick: bool, repeat: int) -> list[Measurement]:
+    """Snapshots per second each output handler receives, through the path the integrator uses for it: binary
+    snapshots if the handler reads them, output lines otherwise. The snapshots are synthetic, so no simulation runs."""
+    star_count = 3
+    count = 2000 if quick else 20000
+    time_step = 0.01
+
+    cluster = random_cluster('output', star_count, seed=2)
+    buffer = np.zeros(Snapshot.size(star_count))
+    snapshot = Snapshot(buffer)
+    rng = np.random.default_rng(2)
+    snapshot.identifiers[:] = cluster.identifiers
+    snapshot.states[:] = rng.normal(size=(star_count, 7))
+    buffer[1] = star_count
+    buffer[2:5] = rng.normal(size=3)
+
+    times = np.arange(count) * time_step
+    lines = []
+    for t in times:
+        buffer[0] = t
+        lines.append(snapshot.to_line())
+
+    with tempfile.TemporaryDirectory() as folder:
+        handlers = {
+            'raw': lambda: RawOutput(cluster),
+            'pandas-lists': lambda: PandasOutput(cluster),
+            'pandas-wide': lambda: PandasOutput(cluster, layout='wide'),
+            'pandas-long': lambda: PandasOutput(cluster, layout='long'),
+            'file': lambda: FileOutput(cluster, folder),
+            'file-gzip': lambda: FileOutput(cluster, folder, compression='gzip'),
+            'numpy': lambda: NumpyOutput(cluster),
+        }
+
+        def feed(handler):
+            handler.prepare(times[-1], time_step, Precision())
+            if _receives_snapshots(handler):
+                for t in times:
+                    buffer[0] = t
+                    handler.receive_snapshot(snapshot)
+            else:
+                for line in lines:
+                    handler.receive_output_line(line)
+            handler.finalize()
+            handler.result()
+
+        measurements = []
+        for name, create in handlers.items():
+            duration = best_time(lambda: feed(create()), repeat)
+            measurements.append(Measurement(name='output_throughput',
+                                            value=count / duration,
+                                            unit='snapshots/s',
+                                            lower_is_better=False,
+                                            params={'handler': name}))
+    return measurements
+
+
+def engine_step(quick: bool, repeat: int) -> list[Measurement]:
+    """Wall time of an integrator step, for clusters of increasing size and increasing word lengths.
+
+    Each cluster is simulated for a fixed wall time, with no outputs in between, and the steps are counted by the
+    simulation reports. The reports add one O(N^2) pass over the stars per step, small next to the force evaluations
+    of a Bulirsch-Stoer step.
+    """
+    interface = BrutusInterface()
+    star_counts = (3, 8) if quick else (3, 8, 16, 32)
+    word_lengths = (64, 128) if quick else (64, 128, 256)
+    wall_time = 0.2 if quick else 1.0
+    time = 1000.0
+
+    measurements = []
+    for star_count in star_counts:
+        cluster = random_cluster(f'engine_{star_count}', star_count, seed=3)
+        for word_length in word_lengths:
+            best = float('inf')
+            for _ in range(repeat):
+                start = time_module.perf_counter()
+                report = _run_interface(interface, cluster, time, time, precision_for(word_length), OutputPolicy(),
+                                        snapshots=True, stopping_conditions=StoppingConditions(wall_time=wall_time),
+                                        reductions=True)
+                duration = time_module.perf_counter() - start
+                best = min(best, duration / max(report.steps, 1))
+
+            measurements.append(Measurement(name='engine_step',
+                                            value=best * 1e3,
+                                            unit='ms/step',
+                                            params={'stars': star_count, 'bits': word_length}))
+    return measurements
+
+
+def cluster_setup(quick: bool, repeat: int) -> list[Measurement]:
+    """Wall time to build a large cluster and load it into the library, star by star from a list of :class:`Star` and
+    in bulk from arrays with :meth:`Cluster.from_arrays`."""
+    star_count = 1000 if quick else 10000
+    rng = np.random.default_rng(4)
+    identifiers = np.arange(star_count)
+    masses = np.full(star_count, 1 / star_count)
+    positions = rng.normal(size=(star_count, 3))
+    velocities = 0.3 * rng.normal(size=(star_count, 3))
+    interface = BrutusInterface()
+
+    def stars():
+        cluster = Cluster(name='setup', stars=[Star(identifier=i,
+                                                    position=positions[i].tolist(),
+                                                    velocity=velocities[i].tolist(),
+                                                    mass=masses[i]) for i in range(star_count)])
+        handle = interface.init_cluster()
+        for star in cluster.stars:
+            interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+        interface.cleanup(handle)
+
+    def arrays():
+        cluster = Cluster.from_arrays(identifiers, masses, positions, velocities, name='setup')
+        handle = interface.init_cluster()
+        interface.add_stars(handle, *cluster.to_arrays())
+        interface.cleanup(handle)
+
+    return [Measurement(name='cluster_setup',
+                        value=best_time(setup, repeat) * 1e3,
+                        unit='ms',
+                        params={'path': path, 'stars': star_count})
+            for path, setup in (('stars', stars), ('arrays', arrays))]
+
+
+def three_body_integrator(count: int, seed: int, **kwargs) -> BrutusIntegrator:
+    """Returns an integrator with count random three-body clusters, each output to a NumpyOutput. The keyword
+    arguments are passed to the integrator."""
+    integrator = BrutusIntegrator(time_step=0.1, **kwargs)
+    for i in range(count):
+        cluster = random_cluster(f'three_body_{i}', 3, seed=seed + i)
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+    return integrator
+
+
+def pool_scaling(quick: bool, repeat: int) -> list[Measurement]:
+    """Clusters per second simulated by the process pool, for increasing numbers of workers.
+
+    'cold' starts the pool in the evolve call, as a single evolve does; 'warm' reuses a pool started beforehand with
+    open(), so only the scheduling and the transfer of the clusters and results are measured on top of the work.
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = sorted(w for w in {1, 2, 4, cpu_count} if w <= max(cpu_count, 2))
+    count = 8 if quick else 32
+    time = 0.5
+
+    measurements = []
+    for worker_count in workers:
+        integrator = three_body_integrator(count, seed=100, workers=worker_count)
+        cold = best_time(lambda: integrator.evolve(time), repeat)
+
+        with integrator:
+            integrator.evolve(time)  # Loads the library in every worker
+            warm = best_time(lambda: integrator.evolve(time), repeat)
+
+        for mode, duration in (('cold', cold), ('warm', warm)):
+            measurements.append(Measurement(name='pool_scaling',
+                                            value=count / duration,
+                                            unit='clusters/s',
+                                            lower_is_better=False,
+                                            params={'workers': worker_count, 'mode': mode}))
+    return measurements
+
+
+def ensemble_evolve(quick: bool, repeat: int) -> list[Measurement]:
+    """Systems per second of a whole evolve() call on an ensemble of three-body systems, with the default integrator
+    settings and one worker per core, for each backend: added as clusters with output handlers, or as arrays with
+    :meth:`BrutusIntegrator.add_ensemble`."""
+    count = 16 if quick else 128
+    workers = os.cpu_count() or 1
+    time = 1.0
+
+    measurements = []
+    for backend in ('processes', 'threads'):
+        integrator = three_body_integrator(count, seed=1000, workers=workers, backend=backend)
+        duration = best_time(lambda: integrator.evolve(time), repeat)
+        measurements.append(Measurement(name='ensemble_evolve',
+                                        value=count / duration,
+                                        unit='clusters/s',
+                                        lower_is_better=False,
+                                        params={'backend': backend, 'clusters': count}))
+
+        integrator = BrutusIntegrator(time_step=0.1, workers=workers, backend=backend)
+        systems = [random_cluster('system', 3, seed=1000 + i).to_arrays() for i in range(count)]
+        integrator.add_ensemble(*(np.stack([arrays[k] for arrays in systems]) for k in (1, 2, 3)))
+        duration = best_time(lambda: integrator.evolve(time), repeat)
+        measurements.append(Measurement(name='ensemble_arrays',
+                                        value=count / duration,
+                                        unit='systems/s',
+                                        lower_is_better=False,
+                                        params={'backend': backend, 'systems': count}))
+    return measurements
+
+
+BENCHMARKS = {
+    'ffi': ffi_callback,
+    'output': output_throughput,
+    'engine': engine_step,
+    'setup': cluster_setup,
+    'pool': pool_scaling,
+    'ensemble': ensemble_evolve,
+}
@@ -0,0 +1,80 @@
+// Measures the cost of an integrator step: the number of GMP/MPFR allocations and the wall time per step, for a few
+// cluster sizes and word lengths.
+//
+// Usage: bench_workspace [t_end]
+//
+// Every MPFR number allocates its mantissa through the GMP memory functions, so counting the calls to them counts
+// the numbers created while integrating.
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <vector>
+
+#include <gmp.h>
+
+#include "../../brutus_code/Brutus.h"
+
+static long allocations = 0;
+
+static void *count_allocate(size_t size)
+{
+    allocations++;
+    return std::malloc(size);
+}
+
+static void *count_reallocate(void *pointer, size_t, size_t size)
+{
+    allocations++;
+    return std::realloc(pointer, size);
+}
+
+static void count_free(void *pointer, size_t)
+{
+    std::free(pointer);
+}
+
+// Initial conditions of n stars of equal mass, with positions and velocities from a fixed pseudo-random sequence
+static std::vector<mpreal> cluster(int n)
+{
+    unsigned long state = 12345;
+    auto uniform = [&state]() {
+        state = state * 6364136223846793005UL + 1442695040888963407UL;
+        return (double)(state >> 11) / (double)(1UL << 53) - 0.5;
+    };
+
+    std::vector<mpreal> data;
+    for (int i = 0; i < n; i++) {
+        data.push_back(mpreal(1.0 / n));
+        for (int k = 0; k < 3; k++) data.push_back(mpreal(2 * uniform()));
+        for (int k = 0; k < 3; k++) data.push_back(mpreal(0.5 * uniform()));
+    }
+    return data;
+}
+
+int main(int argc, char **argv)
+{
+    double t_end = argc > 1 ? std::atof(argv[1]) : 0.25;
+
+    mp_set_memory_functions(count_allocate, count_reallocate, count_free);
+
+    std::printf("%6s %6s %8s %18s %12s\n", "stars", "bits", "steps", "allocations/step", "ms/step");
+    for (int n : {3, 16, 64}) {
+        for (int bits : {64, 128, 256}) {
+            mpreal::set_default_prec(bits);
+
+            std::vector<mpreal> data = cluster(n);
+            mpreal t = "0", tolerance = "1e-10", end = t_end;
+            Brutus b(t, data, tolerance, bits);
+
+            long steps = 0;
+            allocations = 0;
+            auto start = std::chrono::steady_clock::now();
+            b.evolve(end, [&steps]() { steps++; return true; });
+            std::chrono::duration<double, std::milli> elapsed = std::chrono::steady_clock::now() - start;
+
+            std::printf("%6d %6d %8ld %18.0f %12.3f\n", n, bits, steps, (double)allocations / steps, elapsed.count() / steps);
+        }
+    }
+    return 0;
+}
@@ -1,3 +1,5 @@
-from .simulation import BrutusIntegrator
-from .common import Cluster, Star
-from .output import BaseOutput, RawOutput, PandasOutput, FileOutput
+from .simulation import BrutusIntegrator, SnapshotEvent, ClusterFinished, ScheduleReport, Checkpoint, SimulationReport
+from .simulation import StoppingConditions, StopReason, PerformanceCounters, StepTrace, EnsembleResult, ResultCache
+from .common import Cluster, Star, Precision, OutputPolicy
+from .output import BaseOutput, RawOutput, PandasOutput, FileOutput, NumpyOutput, Snapshot, Trajectory
+from .output import MemmapOutput, open_trajectory, read_trajectory_metadata
@@ -1,2 +1 @@
-
-from ._common import Star, Cluster
\ No newline at end of file
+from ._common import Star, Cluster, Precision, OutputPolicy
\ No newline at end of file
@@ -1,5 +1,9 @@
+import math
+from collections.abc import Sequence
 from dataclasses import dataclass, field
 
+import numpy as np
+
 
 @dataclass(frozen=True)
 class Star:
@@ -22,6 +26,61 @@ class Star:
             raise ValueError("Mass must be positive.")
 
 
+@dataclass(frozen=True)
+class Precision:
+    """A class to represent the precision settings of a simulation.
+
+    Holds the tolerance of the Bulirsch-Stoer integrator and the word length (number of bits of the mantissa) used by
+    all arithmetic in the simulation. If the word length is None, it is derived from the tolerance by Brutus, as
+    4 * |log10(tolerance)| + 32 bits.
+    """
+    tolerance: float = 1e-11
+    word_length: int | None = 128
+
+    def __post_init__(self):
+        """Validate the input parameters."""
+        if not 0 < self.tolerance < 1:
+            raise ValueError("Tolerance must be between 0 and 1.")
+        if self.word_length is not None and self.word_length <= 0:
+            raise ValueError("Word length must be positive.")
+
+
+class _StarArrays(Sequence):
+    """The stars of a cluster created from arrays. The arrays are kept as they are, and a :class:`Star` is only created
+    when one is accessed."""
+
+    def __init__(self, identifiers: np.ndarray, masses: np.ndarray, positions: np.ndarray, velocities: np.ndarray):
+        self.identifiers = identifiers
+        self.masses = masses
+        self.positions = positions
+        self.velocities = velocities
+
+    def __len__(self) -> int:
+        return len(self.identifiers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Star(identifier=int(self.identifiers[index]),
+                    position=self.positions[index].tolist(),
+                    velocity=self.velocities[index].tolist(),
+                    mass=float(self.masses[index]))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, _StarArrays):
+            return (np.array_equal(self.identifiers, other.identifiers) and np.array_equal(self.masses, other.masses)
+                    and np.array_equal(self.positions, other.positions)
+                    and np.array_equal(self.velocities, other.velocities))
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f'<{len(self)} stars>'
+
+
 @dataclass(frozen=True)
 class Cluster:
     """A class to represent a star cluster.
@@ -33,8 +92,137 @@ class Cluster:
 
     def __post_init__(self):
         """Validate the input"""
+        if isinstance(self.stars, _StarArrays):
+            return  # Validated by from_arrays
+
         star_ids = [star.identifier for star in self.stars]
         star_ids_unique = set(star_ids)
 
         if len(star_ids_unique) != len(star_ids):
             raise ValueError('Star identifiers must be different for all stars in cluster.')
+
+    @staticmethod
+    def from_arrays(identifiers, masses, positions, velocities, *, name: str) -> 'Cluster':
+        """Creates a cluster from arrays of identifiers (N,), masses (N,), positions (N, 3) and velocities (N, 3).
+
+        The arrays are validated as a whole and kept as read-only copies, which Brutus loads in a single call, so no
+        :class:`Star` is created for each star. They are still created when the stars of the cluster are accessed.
+        """
+        identifiers = np.asarray(identifiers)
+        if identifiers.size and not np.issubdtype(identifiers.dtype, np.integer):
+            raise ValueError("Star identifiers must be integers.")
+        identifiers = np.array(identifiers, dtype=np.int64)
+        masses = np.array(masses, dtype=np.float64)
+        positions = np.array(positions, dtype=np.float64)
+        velocities = np.array(velocities, dtype=np.float64)
+        star_count = len(identifiers)
+        if star_count == 0:  # Empty lists have no second dimension
+            positions, velocities = positions.reshape(-1, 3), velocities.reshape(-1, 3)
+
+        if identifiers.ndim != 1 or masses.shape != (star_count,):
+            raise ValueError("Identifiers and masses must be arrays with one value per star.")
+        if positions.shape != (star_count, 3):
+            raise ValueError("Positions must be 3D vectors, one per star.")
+        if velocities.shape != (star_count, 3):
+            raise ValueError("Velocities must be 3D vectors, one per star.")
+        if not np.all(masses > 0):
+            raise ValueError("Mass must be positive.")
+        if len(np.unique(identifiers)) != star_count:
+            raise ValueError('Star identifiers must be different for all stars in cluster.')
+
+        for array in (identifiers, masses, positions, velocities):
+            array.flags.writeable = False
+        return Cluster(name=name, stars=_StarArrays(identifiers, masses, positions, velocities))
+
+    @property
+    def identifiers(self) -> np.ndarray:
+        """The identifiers of the stars, in order."""
+        if isinstance(self.stars, _StarArrays):
+            return self.stars.identifiers
+        return np.array([star.identifier for star in self.stars], dtype=np.int64)
+
+    def to_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the stars as arrays: identifiers (N,), masses (N,), positions (N, 3) and velocities (N, 3).
+
+        This is the layout Brutus keeps the state in, so the arrays can be passed to it without converting each star.
+        For a cluster created with :meth:`from_arrays`, these are its own read-only arrays.
+        """
+        if isinstance(self.stars, _StarArrays):
+            return self.stars.identifiers, self.stars.masses, self.stars.positions, self.stars.velocities
+
+        identifiers = self.identifiers
+        masses = np.array([star.mass for star in self.stars], dtype=np.float64)
+        positions = np.array([star.position for star in self.stars], dtype=np.float64).reshape(-1, 3)
+        velocities = np.array([star.velocity for star in self.stars], dtype=np.float64).reshape(-1, 3)
+        return identifiers, masses, positions, velocities
+
+
+@dataclass(frozen=True)
+class OutputPolicy:
+    """A class to represent which outputs a simulation produces, independently of its time step.
+
+    The time step sets the times the integrator stops at. By default, the state of every star is output at each of
+    them, with the energies of the system. The policy is applied by Brutus itself, so skipped outputs, stars and
+    energies cost nothing:
+    - every: Output every k-th step (and the last step) only.
+    - times: Output only at these times, which must be increasing. The integrator also stops exactly at each of them,
+      even if they fall between steps. Replaces every.
+    - stars: Output only the stars with these identifiers, in this order. If None, every star is output.
+    - energy_every: Compute the energies (an O(N^2) operation) for every k-th output only. The energies of the other
+      outputs are NaN. 0 never computes them.
+
+    Cancelled simulations stop at their next output, so sparse outputs also make cancellation less responsive.
+    """
+    every: int = 1
+    times: tuple[float, ...] | None = None
+    stars: tuple[int, ...] | None = None
+    energy_every: int = 1
+
+    def __post_init__(self):
+        """Validate the input parameters."""
+        if self.every < 1:
+            raise ValueError("Output interval must be at least 1.")
+        if self.energy_every < 0:
+            raise ValueError("Energy interval must not be negative.")
+
+        if self.times is not None:
+            object.__setattr__(self, 'times', tuple(float(t) for t in self.times))
+            if any(t < 0 for t in self.times):
+                raise ValueError("Output times must not be negative.")
+            if any(a >= b for a, b in zip(self.times, self.times[1:])):
+                raise ValueError("Output times must be increasing.")
+
+        if self.stars is not None:
+            object.__setattr__(self, 'stars', tuple(int(identifier) for identifier in self.stars))
+            if not self.stars:
+                raise ValueError("At least one star must be output.")
+            if len(set(self.stars)) != len(self.stars):
+                raise ValueError("Output star identifiers must be different.")
+
+    @staticmethod
+    def log_spaced(start: float, stop: float, count: int, **kwargs) -> 'OutputPolicy':
+        """Returns a policy that outputs at count times evenly spaced on a log scale between start and stop.
+
+        Any other settings of the policy can be passed as keyword arguments.
+        """
+        if not 0 < start < stop:
+            raise ValueError("Log-spaced output times must satisfy 0 < start < stop.")
+        if count < 2:
+            raise ValueError("At least 2 log-spaced output times are needed.")
+
+        ratio = (stop / start) ** (1 / (count - 1))
+        times = [start * ratio ** i for i in range(count - 1)] + [stop]
+        return OutputPolicy(times=tuple(times), **kwargs)
+
+    @property
+    def is_default(self) -> bool:
+        """Whether the policy outputs every star with its energies at every step."""
+        return self == OutputPolicy()
+
+    def snapshot_count(self, start: float, time: float, time_step: float) -> int:
+        """Returns the number of snapshots output when evolving from t = start to t = time in steps of time_step."""
+        if self.times is not None:
+            return sum(1 for t in self.times if start <= t <= time)
+
+        steps = max(math.ceil(round((time - start) / time_step, 9)), 1)
+        return 1 + steps // self.every + (1 if steps % self.every else 0)
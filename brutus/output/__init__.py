@@ -1,2 +1,3 @@
 
-from ._output import BaseOutput, RawOutput, PandasOutput, FileOutput
+from ._output import BaseOutput, RawOutput, PandasOutput, FileOutput, NumpyOutput, Snapshot, Trajectory
+from ._memmap import MemmapOutput, open_trajectory, read_trajectory_metadata
\ No newline at end of file
@@ -0,0 +1,141 @@
+import json
+import os
+
+import numpy as np
+
+from ..common import Cluster, Precision, OutputPolicy
+from ._output import BaseOutput, Snapshot, Trajectory
+
+
+FORMAT = 'brutus-trajectory'
+VERSION = 1
+COLUMNS = ['time', 'total_energy', 'kinetic_energy', 'potential_energy']  # Followed by the 7 state values of each star
+
+
+class MemmapOutput(BaseOutput):
+    """Saves the simulation output to a binary trajectory file that can be memory-mapped.
+
+    Snapshots are appended to <folder>/<cluster name>.bin as rows of float64 values (time, total energy, kinetic
+    energy, potential energy, then x, y, z, vx, vy, vz and mass of each star), as the simulation runs. A JSON sidecar,
+    <folder>/<cluster name>.json, describes the file: cluster name, star identifiers, time grid, explicit output times,
+    precision settings and number of snapshots.
+
+    Use :func:`open_trajectory` to open the result without loading it into memory. The result of this handler is the
+    path of the sidecar.
+    """
+    def __init__(self, cluster: Cluster, folder: os.PathLike):
+        super().__init__(cluster)
+
+        self.path = os.path.join(folder, f'{self.cluster.name}.bin')
+        self.metadata_path = os.path.join(folder, f'{self.cluster.name}.json')
+        self.metadata = {
+            'format': FORMAT,
+            'version': VERSION,
+            'cluster': self.cluster.name,
+            'star_identifiers': self.cluster.identifiers.tolist(),
+            'columns': COLUMNS,
+            'dtype': 'float64',
+            'snapshot_count': 0,
+            'end_time': None,
+            'time_step': None,
+            'output_times': None,  # Set if the snapshots are only output at these times (see OutputPolicy)
+            'precision': None,
+        }
+
+        self.row = np.empty(len(COLUMNS) + 7 * len(self.cluster.stars))
+        self.file = None  # Opened on the first snapshot, in the process that runs the simulation
+
+    def prepare(self, time: float, time_step: float, precision: Precision):
+        self.metadata.update({
+            'end_time': time,
+            'time_step': time_step,
+            'precision': {'tolerance': precision.tolerance, 'word_length': precision.word_length},
+        })
+
+    def apply_output_policy(self, policy: OutputPolicy, snapshot_count: int):
+        super().apply_output_policy(policy, snapshot_count)
+        self.metadata['star_identifiers'] = self.cluster.identifiers.tolist()
+        self.metadata['output_times'] = list(policy.times) if policy.times is not None else None
+        self.row = np.empty(len(COLUMNS) + 7 * len(self.cluster.stars))
+
+    def receive_output_line(self, line: str):
+        self.receive_snapshot(Snapshot.from_line(line))
+
+    def receive_snapshot(self, snapshot: Snapshot):
+        if self.file is None:
+            self._open()
+
+        self.row[0] = snapshot.buffer[0]
+        self.row[1:4] = snapshot.buffer[2:5]
+        self.row[4:].reshape(-1, 7)[:] = snapshot.states
+        self.file.write(self.row.tobytes())
+        self.metadata['snapshot_count'] += 1
+
+    def finalize(self):
+        if self.file is None:
+            self._open()
+
+        self.file.close()
+        self.file = None
+        self._write_metadata()
+
+    def result(self):
+        return self.metadata_path
+
+    def _open(self):
+        self.file = open(self.path, 'wb')
+        self.metadata['snapshot_count'] = 0
+        self._write_metadata()  # Describes the file even if the simulation is interrupted
+
+    def _write_metadata(self):
+        with open(self.metadata_path, 'w') as f:
+            json.dump(self.metadata, f, indent=2)
+
+
+def read_trajectory_metadata(path: os.PathLike) -> dict:
+    """Reads the JSON sidecar of a trajectory saved by :class:`MemmapOutput`.
+
+    The path can point to the sidecar (.json) or to the binary file (.bin).
+    """
+    with open(_metadata_path(path), 'r') as f:
+        metadata = json.load(f)
+
+    if metadata.get('format') != FORMAT:
+        raise ValueError(f'"{path}" is not a Brutus trajectory.')
+    if metadata.get('version') != VERSION:
+        raise ValueError(f'Unsupported trajectory version {metadata.get("version")}.')
+
+    return metadata
+
+
+def open_trajectory(path: os.PathLike, mode: str = 'r') -> Trajectory:
+    """Opens a trajectory saved by :class:`MemmapOutput` without loading it into memory.
+
+    The arrays of the returned :class:`Trajectory` are memory-mapped views of the binary file, so slicing a single
+    star or time window only reads that part of the file. The path can point to the sidecar (.json) or to the binary
+    file (.bin). If the simulation was interrupted, the snapshots written so far are returned.
+    """
+    metadata = read_trajectory_metadata(path)
+    metadata_path = _metadata_path(path)
+    data_path = os.path.splitext(metadata_path)[0] + '.bin'
+
+    identifiers = np.array(metadata['star_identifiers'], dtype=np.int64)
+    row_size = len(COLUMNS) + 7 * len(identifiers)
+    snapshot_count = os.path.getsize(data_path) // (row_size * 8)
+
+    if snapshot_count == 0:
+        data = np.empty((0, row_size))
+    else:
+        data = np.memmap(data_path, dtype=np.float64, mode=mode, shape=(snapshot_count, row_size))
+
+    return Trajectory(time=data[:, 0],
+                      identifiers=identifiers,
+                      states=data[:, 4:].reshape(snapshot_count, len(identifiers), 7),
+                      total_energy=data[:, 1],
+                      kinetic_energy=data[:, 2],
+                      potential_energy=data[:, 3])
+
+
+def _metadata_path(path: os.PathLike) -> str:
+    root, extension = os.path.splitext(os.fspath(path))
+    return root + '.json' if extension == '.bin' else os.fspath(path)
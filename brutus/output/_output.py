@@ -1,8 +1,139 @@
-import pandas as pd
+import numpy as np
 import os
 import ctypes
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-from ..common import Cluster
+from ..common import Cluster, Precision, OutputPolicy
+
+if TYPE_CHECKING:
+    import pandas as pd  # Imported by PandasOutput when it builds a DataFrame, as it is slow to import
+
+
+# Layout of the snapshot buffer filled by the Brutus library (see evolveSnapshots in main.cpp)
+SNAPSHOT_HEADER_SIZE = 5  # time, star count, total energy, kinetic energy, potential energy
+SNAPSHOT_STAR_SIZE = 8  # identifier, x, y, z, vx, vy, vz, mass
+
+
+class Snapshot:
+    """A zero-copy view over the state of the simulation at a single time step.
+
+    The simulation writes each step into a contiguous buffer of doubles and exposes it through this class as NumPy
+    views, without formatting or parsing any text. The buffer is reused for every step, so its contents are only valid
+    until the next step. Handlers that keep the data must copy it (see :meth:`copy`).
+
+    The buffer layout is: time, star count, total energy, kinetic energy, potential energy, followed by the
+    identifier, x, y, z, vx, vy, vz and mass of each star.
+    """
+    def __init__(self, buffer: np.ndarray):
+        self.buffer = buffer
+
+        stars = buffer[SNAPSHOT_HEADER_SIZE:].reshape(-1, SNAPSHOT_STAR_SIZE)
+        self.identifiers = stars[:, 0]
+        self.states = stars[:, 1:]  # x, y, z, vx, vy, vz, mass
+        self.positions = stars[:, 1:4]
+        self.velocities = stars[:, 4:7]
+        self.masses = stars[:, 7]
+
+    def __reduce__(self):
+        # Pickle the buffer once, rather than each of the views
+        return Snapshot, (self.buffer,)
+
+    @staticmethod
+    def size(star_count: int) -> int:
+        """Returns the number of doubles in the buffer of a snapshot with star_count stars."""
+        return SNAPSHOT_HEADER_SIZE + SNAPSHOT_STAR_SIZE * star_count
+
+    @property
+    def time(self) -> float:
+        return float(self.buffer[0])
+
+    @property
+    def star_count(self) -> int:
+        return int(self.buffer[1])
+
+    @property
+    def total_energy(self) -> float:
+        return float(self.buffer[2])
+
+    @property
+    def kinetic_energy(self) -> float:
+        return float(self.buffer[3])
+
+    @property
+    def potential_energy(self) -> float:
+        return float(self.buffer[4])
+
+    @staticmethod
+    def from_line(line: str) -> 'Snapshot':
+        """Creates a snapshot from an output line (see :meth:`BaseOutput.receive_output_line`)."""
+        values = np.array(line.strip().split(','), dtype=np.float64)
+        return Snapshot(np.concatenate([values[:2], values[-3:], values[2:-3]]))
+
+    def copy(self) -> 'Snapshot':
+        """Returns a snapshot backed by a copy of the buffer, which is not overwritten by the simulation."""
+        return Snapshot(self.buffer.copy())
+
+    def to_line(self) -> str:
+        """Formats the snapshot as an output line (see :meth:`BaseOutput.receive_output_line`)."""
+        values = [f'{self.time:f}', str(self.star_count)]
+        for star in self.buffer[SNAPSHOT_HEADER_SIZE:].reshape(-1, SNAPSHOT_STAR_SIZE).tolist():
+            values.append(str(int(star[0])))
+            values.extend(f'{value:f}' for value in star[1:])
+        values.extend(f'{value:f}' for value in self.buffer[2:SNAPSHOT_HEADER_SIZE].tolist())
+        return ','.join(values)
+
+
+def snapshot_count(time: float, time_step: float) -> int:
+    """Returns the number of snapshots the simulation outputs when evolving to t = time in steps of time_step.
+
+    This includes the initial state and the final state, which is output even if it is not a multiple of time_step.
+    """
+    return max(math.ceil(round(time / time_step, 9)), 1) + 1
+
+
+@dataclass(frozen=True)
+class Trajectory:
+    """A class to represent the trajectory of a cluster as columnar arrays.
+
+    Holds the state of every star at every output time step, with no Python objects per row:
+    - time: The output times, with shape (T,)
+    - identifiers: The star identifiers, with shape (N,)
+    - states: The x, y, z, vx, vy, vz and mass of each star at each time, with shape (T, N, 7)
+    - total_energy, kinetic_energy, potential_energy: The energies of the system, with shape (T,)
+
+    The snapshots of an ensemble (see :class:`brutus.EnsembleResult`) have an extra leading axis, with one trajectory
+    per system: (B, T) times and (B, T, N, 7) states.
+    """
+    time: np.ndarray
+    identifiers: np.ndarray
+    states: np.ndarray
+    total_energy: np.ndarray
+    kinetic_energy: np.ndarray
+    potential_energy: np.ndarray
+
+    @property
+    def positions(self) -> np.ndarray:
+        """The positions of the stars, with shape (T, N, 3)."""
+        return self.states[..., 0:3]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        """The velocities of the stars, with shape (T, N, 3)."""
+        return self.states[..., 3:6]
+
+    @property
+    def masses(self) -> np.ndarray:
+        """The masses of the stars, with shape (T, N)."""
+        return self.states[..., 6]
+
+    def star(self, identifier: int) -> np.ndarray:
+        """Returns the states of the star with the given identifier, with shape (T, 7)."""
+        index = np.flatnonzero(self.identifiers == identifier)
+        if len(index) == 0:
+            raise KeyError(f'No star with identifier {identifier}.')
+        return self.states[..., index[0], :]
 
 
 class BaseOutput:
@@ -16,6 +147,28 @@ class BaseOutput:
     def __init__(self, cluster: Cluster):
         self.cluster = cluster
 
+    def prepare(self, time: float, time_step: float, precision: Precision):
+        """Method that is called right before the simulation starts.
+
+        It receives the end time and time step of the simulation, and the precision settings of the cluster.
+        Output handlers can use it to allocate their data structures up front. By default, it does nothing.
+        """
+        pass
+
+    def apply_output_policy(self, policy: OutputPolicy, snapshot_count: int):
+        """Method that is called after prepare when the simulation uses an output policy other than the default.
+
+        It receives the policy and the number of snapshots the simulation will output. Snapshots then only hold the
+        stars selected by the policy, and their energies are NaN when they were not computed. By default, it replaces
+        the cluster of the handler by a cluster with only the selected stars.
+        """
+        if policy.stars is not None:
+            identifiers, masses, positions, velocities = self.cluster.to_arrays()
+            rows = {identifier: row for row, identifier in enumerate(identifiers.tolist())}
+            selected = [rows[identifier] for identifier in policy.stars]
+            self.cluster = Cluster.from_arrays(identifiers[selected], masses[selected], positions[selected],
+                                               velocities[selected], name=self.cluster.name)
+
     def receive_output_line(self, line: str):
         """Method that processes a single line of output from the simulation.
 
@@ -24,6 +177,16 @@ class BaseOutput:
         """
         raise NotImplementedError()
 
+    def receive_snapshot(self, snapshot: Snapshot):
+        """Method that processes the state of the simulation at a single time step, as binary data.
+
+        Handlers that override this method read the snapshot's arrays directly and skip text formatting and parsing
+        altogether. Handlers that do not override it receive output lines formatted by the simulation library instead.
+        By default, it formats the snapshot as an output line and passes it to receive_output_line.
+        The snapshot is only valid during this call, so its data must be copied if it is to be kept.
+        """
+        self.receive_output_line(snapshot.to_line())
+
     def finalize(self):
         """Method that finalizes the output processing.
 
@@ -60,30 +223,184 @@ class RawOutput(BaseOutput):
         return self.data
     
 
+class NumpyOutput(BaseOutput):
+    """Output handler that stores the simulation output in preallocated NumPy arrays.
+
+    The arrays are sized from the end time and time step of the simulation, and each snapshot is written in place,
+    without creating any Python objects per row. The result is a :class:`Trajectory`.
+    """
+    def __init__(self, cluster: Cluster):
+        super().__init__(cluster)
+
+        self.identifiers = cluster.identifiers
+        self.count = 0  # Number of snapshots received so far
+        self.trajectory: Trajectory | None = None
+        self._allocate(2)
+
+    def prepare(self, time: float, time_step: float, precision: Precision):
+        self._allocate(snapshot_count(time, time_step))
+
+    def apply_output_policy(self, policy: OutputPolicy, snapshot_count: int):
+        super().apply_output_policy(policy, snapshot_count)
+        self.identifiers = self.cluster.identifiers
+        self._allocate(max(snapshot_count, 1))
+
+    def receive_output_line(self, line: str):
+        self.receive_snapshot(Snapshot.from_line(line))
+
+    def receive_snapshot(self, snapshot: Snapshot):
+        if self.count == len(self.time):
+            self._allocate(2 * self.count)  # More snapshots than expected, grow the arrays
+
+        i = self.count
+        self.time[i] = snapshot.buffer[0]
+        self.energies[i] = snapshot.buffer[2:5]
+        self.states[i] = snapshot.states
+        self.count += 1
+
+    def finalize(self):
+        n = self.count
+        time, energies, states = self.time[:n], self.energies[:n], self.states[:n]
+        if n < len(self.time):
+            time, energies, states = time.copy(), energies.copy(), states.copy()  # Release the unused capacity
+
+        self.trajectory = Trajectory(time=time,
+                                     identifiers=self.identifiers,
+                                     states=states,
+                                     total_energy=energies[:, 0],
+                                     kinetic_energy=energies[:, 1],
+                                     potential_energy=energies[:, 2])
+
+    def result(self):
+        if self.trajectory is None:
+            raise ValueError('No output data available. Make sure to call finalize before retrieving the results.')
+        return self.trajectory
+
+    def _allocate(self, capacity: int):
+        """Resizes the arrays to hold capacity snapshots, keeping the ones already received."""
+        time = np.empty(capacity)
+        energies = np.empty((capacity, 3))
+        states = np.empty((capacity, len(self.identifiers), 7))
+
+        if self.count:
+            time[:self.count] = self.time[:self.count]
+            energies[:self.count] = self.energies[:self.count]
+            states[:self.count] = self.states[:self.count]
+
+        self.time, self.energies, self.states = time, energies, states
+
+
 class FileOutput(BaseOutput):
-    """Saves the simulation output to a CSV file."""
+    """Saves the simulation output to a CSV file.
 
-    def __init__(self, cluster, folder: os.PathLike):
+    Output lines are streamed to the file as the simulation runs: they are buffered in memory until they reach
+    flush_size characters and then written, so memory use does not grow with the length of the simulation and the
+    output is on disk even if the simulation is interrupted.
+
+    The file can optionally be compressed with one of the COMPRESSIONS codecs, in which case the matching extension
+    is added to its name, and start with a header row naming the columns after the cluster's star identifiers.
+    """
+    COMPRESSIONS = {None: '', 'gzip': '.gz', 'bz2': '.bz2', 'lzma': '.xz', 'zstd': '.zst'}
+
+    def __init__(self,
+                 cluster,
+                 folder: os.PathLike,
+                 *,
+                 compression: str | None = None,
+                 header: bool = False,
+                 flush_size: int = 1 << 20):
         super().__init__(cluster)
 
-        self.path = os.path.join(folder, f'{self.cluster.name}.csv')
-        self.data = list()
+        if compression not in FileOutput.COMPRESSIONS:
+            raise ValueError(f'Unknown compression "{compression}". '
+                             f'Must be one of: {", ".join(str(c) for c in FileOutput.COMPRESSIONS)}.')
+        if compression == 'zstd':
+            try:
+                from compression import zstd  # noqa: F401
+            except ImportError:
+                raise ValueError('zstd compression requires Python 3.14 or later.') from None
+        if flush_size <= 0:
+            raise ValueError('Flush size must be positive.')
+
+        self.path = os.path.join(folder, f'{self.cluster.name}.csv{FileOutput.COMPRESSIONS[compression]}')
+        self.compression = compression
+        self.header = header
+        self.flush_size = flush_size
+
+        self.buffer = list()  # Lines waiting to be written
+        self.buffer_size = 0  # Number of characters in the buffer
+        self.lines_written = 0
+        self.file = None  # Opened on the first write, in the process that runs the simulation
 
     def receive_output_line(self, line):
-        self.data.append( line )
+        if self.file is None:
+            self._open()
+
+        self.buffer.append(line)
+        self.buffer_size += len(line) + 1
+
+        if self.buffer_size >= self.flush_size:
+            self._flush()
 
     def finalize(self):
-        with open(self.path, 'w') as f:
-            f.write('\n'.join(self.data))
+        if self.file is None:
+            self._open()
+
+        self._flush()
+        self.file.close()
+        self.file = None
 
     def result(self):
         pass
 
+    def header_line(self) -> str:
+        """Returns the names of the columns of the output lines, separated by commas."""
+        columns = ['time', 'star_count']
+        for identifier in self.cluster.identifiers.tolist():
+            columns.extend(f'star_{identifier}_{name}'
+                           for name in ('identifier', 'x', 'y', 'z', 'vx', 'vy', 'vz', 'mass'))
+        columns.extend(['total_energy', 'kinetic_energy', 'potential_energy'])
+        return ','.join(columns)
+
+    def _open(self):
+        if self.compression is None:
+            self.file = open(self.path, 'w')
+        elif self.compression == 'gzip':
+            import gzip
+            self.file = gzip.open(self.path, 'wt')
+        elif self.compression == 'bz2':
+            import bz2
+            self.file = bz2.open(self.path, 'wt')
+        elif self.compression == 'lzma':
+            import lzma
+            self.file = lzma.open(self.path, 'wt')
+        else:
+            from compression import zstd  # Python 3.14+
+            self.file = zstd.open(self.path, 'wt')
+
+        self.lines_written = 0
+        if self.header:
+            self.buffer.insert(0, self.header_line())
+
+    def _flush(self):
+        """Writes the buffered lines to the file. Lines are separated by newlines, with no newline at the end."""
+        if not self.buffer:
+            return
+
+        text = '\n'.join(self.buffer)
+        self.file.write('\n' + text if self.lines_written else text)
+        self.file.flush()
+
+        self.lines_written += len(self.buffer)
+        self.buffer.clear()
+        self.buffer_size = 0
+
 
 class PandasOutput(BaseOutput):
     """Output handler that generates a pandas DataFrame from the simulation output.
 
-    The output columns will be as follows:
+    The layout of the DataFrame depends on the layout argument. With the default 'lists' layout, the output columns
+    will be as follows:
     - time: The time at which the state was recorded
     - star_count: The number of stars in the cluster
     - star_<identifier>_pos: The position of star <identifier> as a list [x, y, z]
@@ -92,26 +409,142 @@ class PandasOutput(BaseOutput):
     - total_energy: The total energy of the system
     - kinetic_energy: The kinetic energy of the system
     - potential_energy: The potential energy of the system
+
+    The 'lists' layout creates Python objects for every cell, so its columns cannot be vectorized. The other layouts
+    buffer the raw output and parse it all at once on finalize, producing float64 columns:
+    - 'wide': One row per time step, like 'lists', but with the columns star_<identifier>_x, star_<identifier>_y,
+      star_<identifier>_z, star_<identifier>_vx, star_<identifier>_vy, star_<identifier>_vz and star_<identifier>_mass
+    - 'long': One row per star and time step (tidy data), with the columns time, identifier, x, y, z, vx, vy, vz,
+      mass, total_energy, kinetic_energy and potential_energy
     """
-    def __init__(self, cluster: Cluster):
+    LAYOUTS = ('lists', 'wide', 'long')
+    STATE_COLUMNS = ('x', 'y', 'z', 'vx', 'vy', 'vz', 'mass')
+
+    def __init__(self, cluster: Cluster, *, layout: str = 'lists'):
         super().__init__(cluster)
 
+        if layout not in PandasOutput.LAYOUTS:
+            raise ValueError(f'Unknown layout "{layout}". Must be one of: {", ".join(PandasOutput.LAYOUTS)}.')
+
+        self.layout = layout
         self.data = []  # Stores the output data as a list of dictionaries, which will be converted to a DataFrame on finalize
-        self.df: pd.DataFrame | None = None  # Stores the final DataFrame
+        self.lines = []  # Stores the raw output lines, for the vectorized layouts
+        self.snapshots = []  # Stores copies of the snapshot buffers, for the vectorized layouts
+        self.df: 'pd.DataFrame | None' = None  # Stores the final DataFrame
 
     def receive_output_line(self, line: str):
+        if self.layout != 'lists':
+            self.lines.append(line)
+            return
+
         values = line.strip().split(',')
         row = PandasOutput._parse_output_line(values)
         self.data.append(row)
 
+    def receive_snapshot(self, snapshot: Snapshot):
+        if self.layout != 'lists':
+            self.snapshots.append(snapshot.buffer.copy())
+            return
+
+        self.data.append(PandasOutput._parse_snapshot(snapshot))
+
     def finalize(self):
-        self.df = pd.DataFrame(self.data)
+        if self.layout == 'lists':
+            import pandas as pd
+            self.df = pd.DataFrame(self.data)
+            return
+
+        if self.snapshots:
+            buffers = np.stack(self.snapshots)
+        else:
+            buffers = PandasOutput._parse_output_lines(self.lines)
+
+        if self.layout == 'wide':
+            self.df = PandasOutput._wide_dataframe(buffers)
+        else:
+            self.df = PandasOutput._long_dataframe(buffers)
 
     def result(self):
         if self.df is None:
             raise ValueError('No output data available. Make sure to call finalize before retrieving the results.')
         return self.df
 
+    @staticmethod
+    def _parse_output_lines(lines: list[str]) -> np.ndarray:
+        """Parses all output lines at once, returning one snapshot buffer per row."""
+        if not lines:
+            return np.empty((0, SNAPSHOT_HEADER_SIZE))
+
+        values = np.array(','.join(line.strip() for line in lines).split(','), dtype=np.float64)
+        values = values.reshape(len(lines), -1)
+
+        # Move the energies from the end of the line to the header of the snapshot buffer
+        return np.hstack([values[:, :2], values[:, -3:], values[:, 2:-3]])
+
+    @staticmethod
+    def _stars(buffers: np.ndarray) -> np.ndarray:
+        """Returns the star blocks of the snapshot buffers, with shape (T, N, SNAPSHOT_STAR_SIZE)."""
+        star_count = (buffers.shape[1] - SNAPSHOT_HEADER_SIZE) // SNAPSHOT_STAR_SIZE
+        return buffers[:, SNAPSHOT_HEADER_SIZE:].reshape(len(buffers), star_count, SNAPSHOT_STAR_SIZE)
+
+    @staticmethod
+    def _wide_dataframe(buffers: np.ndarray) -> 'pd.DataFrame':
+        import pandas as pd
+
+        stars = PandasOutput._stars(buffers)
+        identifiers = stars[0, :, 0].astype(int).tolist() if len(buffers) else []
+
+        columns = {
+            'time': buffers[:, 0],
+            'star_count': buffers[:, 1].astype(int),
+            'total_energy': buffers[:, 2],
+            'kinetic_energy': buffers[:, 3],
+            'potential_energy': buffers[:, 4],
+        }
+        for i, identifier in enumerate(identifiers):
+            for j, name in enumerate(PandasOutput.STATE_COLUMNS):
+                columns[f'star_{identifier}_{name}'] = stars[:, i, j + 1]
+
+        return pd.DataFrame(columns)
+
+    @staticmethod
+    def _long_dataframe(buffers: np.ndarray) -> 'pd.DataFrame':
+        import pandas as pd
+
+        stars = PandasOutput._stars(buffers)
+        star_count = stars.shape[1]
+
+        columns = {
+            'time': np.repeat(buffers[:, 0], star_count),
+            'identifier': stars[:, :, 0].ravel().astype(int),
+        }
+        for j, name in enumerate(PandasOutput.STATE_COLUMNS):
+            columns[name] = stars[:, :, j + 1].ravel()
+        columns['total_energy'] = np.repeat(buffers[:, 2], star_count)
+        columns['kinetic_energy'] = np.repeat(buffers[:, 3], star_count)
+        columns['potential_energy'] = np.repeat(buffers[:, 4], star_count)
+
+        return pd.DataFrame(columns)
+
+    @staticmethod
+    def _parse_snapshot(snapshot: Snapshot):
+        row = {
+            'time': snapshot.time,
+            'star_count': snapshot.star_count,
+            'total_energy': snapshot.total_energy,
+            'kinetic_energy': snapshot.kinetic_energy,
+            'potential_energy': snapshot.potential_energy,
+        }
+
+        for identifier, state in zip(snapshot.identifiers.astype(int).tolist(), snapshot.states.tolist()):
+            row.update({
+                f'star_{identifier}_pos': state[0:3],
+                f'star_{identifier}_vel': state[3:6],
+                f'star_{identifier}_mass': state[6]
+            })
+
+        return row
+
     @staticmethod
     def _parse_output_line(values):
         t, star_count = values[0], values[1]
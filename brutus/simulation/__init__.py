@@ -1,2 +1,9 @@
-
-from ._simulation import BrutusIntegrator
\ No newline at end of file
+from ._simulation import BrutusIntegrator
+from ._events import SnapshotEvent, ClusterFinished
+from ._scheduling import ScheduleReport
+from ._checkpoint import Checkpoint
+from ._report import SimulationReport
+from ._stopping import StoppingConditions, StopReason
+from ._counters import PerformanceCounters, StepTrace
+from ._ensemble import EnsembleResult
+from ._cache import ResultCache
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time as time_module
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+from ._report import SimulationReport
+from ._stopping import StopReason
+
+
+# Every cache file starts with MAGIC, followed by the length of its JSON header as a little-endian uint64, the header
+# and the snapshots as little-endian float64 values
+MAGIC = b'BRUTUSC\x01'
+HEADER_LENGTH = struct.Struct('<Q')
+SUFFIX = '.brc'
+
+
+@dataclass
+class _CachedRun:
+    """Everything needed to rebuild the outcome of a simulation without running it again: the snapshots it output,
+    which are replayed through the output handler, and the state, report and stop reason it ended with."""
+    snapshots: np.ndarray  # One snapshot buffer per row
+    state: str  # Full precision state reached, in the format of Checkpoint.state_string
+    report: SimulationReport | None
+    stop_reason: StopReason
+
+
+def cache_key(task, build: str) -> str | None:
+    """Returns the key of the result of a task, a hash of everything that determines it: the stars and the state they
+    start from, the precision, time step and end time, the output policy, reports, stopping conditions and force
+    threads, and the build of the library. The output handler and the cluster name are left out, as cached results are
+    replayed through the output handler of each cluster.
+
+    Returns None if the result cannot be cached, because it depends on the wall time.
+    """
+    if task.stopping_conditions is not None and task.stopping_conditions.wall_time is not None:
+        return None
+
+    digest = hashlib.sha256()
+    digest.update(build.encode())
+    for array in task.cluster.to_arrays():
+        digest.update(np.ascontiguousarray(array).tobytes())
+
+    settings = [task.start.state_string() if task.start is not None else None,
+                repr(float(task.precision.tolerance)), task.precision.word_length, repr(float(task.time)),
+                repr(float(task.time_step)), repr(task.output_policy), task.reports, repr(task.stopping_conditions),
+                task.force_threads]
+    digest.update(json.dumps(settings).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """A content-addressed cache of simulation results on disk.
+
+    Brutus is deterministic for a given precision, so a cluster evolved again with the same stars and settings gives
+    the same result. Each result is stored in its own file in folder, named after a hash of its inputs (see
+    :func:`cache_key`), with the snapshots in binary. Files are evicted least recently used first once the cache
+    grows beyond max_size bytes, and after max_age seconds without being used.
+    """
+    def __init__(self, folder: os.PathLike, *, max_size: int | None = 2 ** 30, max_age: float | None = None):
+        if max_size is not None and max_size <= 0:
+            raise ValueError('The maximum cache size must be positive.')
+        if max_age is not None and max_age <= 0:
+            raise ValueError('The maximum cache age must be positive.')
+
+        self.folder = os.fspath(folder)
+        self.max_size = max_size
+        self.max_age = max_age
+        os.makedirs(self.folder, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f'ResultCache({self.folder!r}, max_size={self.max_size}, max_age={self.max_age})'
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + SUFFIX)
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """Returns the (last use, size, path) of each file of the cache."""
+        entries = []
+        with os.scandir(self.folder) as files:
+            for file in files:
+                if file.name.endswith(SUFFIX):
+                    try:
+                        stat = file.stat()
+                    except FileNotFoundError:
+                        continue  # Evicted by another process
+                    entries.append((stat.st_mtime, stat.st_size, file.path))
+        return entries
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached results, in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def load(self, key: str) -> _CachedRun | None:
+        """Returns the cached result with the given key, or None if there is none, and marks it as used."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        if not data.startswith(MAGIC):
+            return None
+        start = len(MAGIC) + HEADER_LENGTH.size
+        header_length, = HEADER_LENGTH.unpack_from(data, len(MAGIC))
+        header = json.loads(data[start:start + header_length])
+
+        if self.max_age is not None and time_module.time() - header['stored'] > self.max_age:
+            self._remove(path)
+            return None
+
+        snapshots = np.frombuffer(data, dtype='<f8', offset=start + header_length).reshape(header['shape'])
+        report = SimulationReport(**header['report']) if header['report'] is not None else None
+        return _CachedRun(snapshots=snapshots.astype(np.float64),
+                          state=header['state'],
+                          report=report,
+                          stop_reason=StopReason(header['stop_reason']))
+
+    def store(self, key: str, run: _CachedRun):
+        """Stores a result under the given key, then evicts the results beyond the size and age limits."""
+        header = json.dumps({
+            'shape': list(run.snapshots.shape),
+            'state': run.state,
+            'report': asdict(run.report) if run.report is not None else None,
+            'stop_reason': int(run.stop_reason),
+            'stored': time_module.time(),
+        }).encode()
+
+        if self.max_size is not None and len(header) + run.snapshots.nbytes > self.max_size:
+            return  # It would evict everything else, and itself
+
+        # Written to a temporary file first, so other processes never read a partial result
+        fd, temporary_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC)
+                f.write(HEADER_LENGTH.pack(len(header)))
+                f.write(header)
+                f.write(np.ascontiguousarray(run.snapshots, dtype='<f8').tobytes())
+            os.replace(temporary_path, self._path(key))
+        except BaseException:
+            self._remove(temporary_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Removes the results that were not used for max_age seconds, then the least recently used ones until the
+        cache is no larger than max_size."""
+        entries = sorted(self._entries())
+        if self.max_age is not None:
+            oldest = time_module.time() - self.max_age
+            for entry in [entry for entry in entries if entry[0] < oldest]:
+                self._remove(entry[2])
+                entries.remove(entry)
+
+        if self.max_size is not None:
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_size:
+                    break
+                self._remove(path)
+                total -= size
+
+    def clear(self):
+        """Removes every cached result."""
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,90 @@
+import json
+import os
+from dataclasses import dataclass
+
+from ..common import Cluster, Star, Precision
+
+
+FORMAT = 'brutus-checkpoint'
+VERSION = 1
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """The full precision state of a cluster at a given time, from which its simulation can be resumed.
+
+    The time and the mass, position and velocity of each star are kept as decimal strings, with enough digits to
+    restore the exact values used by Brutus, whatever the word length. Resuming from a checkpoint gives the same
+    trajectory as a simulation that was never interrupted.
+    """
+    cluster: str
+    identifiers: tuple[int, ...]
+    time: str
+    state: tuple[str, ...]  # m, x, y, z, vx, vy, vz of each star
+    precision: Precision
+    time_step: float
+
+    def __post_init__(self):
+        """Validate the input parameters."""
+        if len(self.state) != 7 * len(self.identifiers):
+            raise ValueError("State must have 7 values per star.")
+
+    @staticmethod
+    def from_state_string(cluster: Cluster, state: str, precision: Precision, time_step: float) -> 'Checkpoint':
+        """Creates a checkpoint from a state string of the Brutus library (see :meth:`state_string`)."""
+        time, *values = state.split()
+        return Checkpoint(cluster=cluster.name,
+                          identifiers=tuple(cluster.identifiers.tolist()),
+                          time=time,
+                          state=tuple(values),
+                          precision=precision,
+                          time_step=time_step)
+
+    def state_string(self) -> str:
+        """Formats the checkpoint in the format of the Brutus library: the time followed by the state of each star."""
+        return ' '.join([self.time, *self.state])
+
+    def to_cluster(self) -> Cluster:
+        """Returns the cluster at the time of the checkpoint, with its values rounded to double precision."""
+        stars = []
+        for index, identifier in enumerate(self.identifiers):
+            m, x, y, z, vx, vy, vz = (float(value) for value in self.state[7 * index:7 * index + 7])
+            stars.append(Star(identifier=identifier, position=[x, y, z], velocity=[vx, vy, vz], mass=m))
+
+        return Cluster(name=self.cluster, stars=stars)
+
+    def save(self, path: os.PathLike):
+        """Saves the checkpoint to a JSON file. The file is replaced at once, so it is never left half written."""
+        data = {
+            'format': FORMAT,
+            'version': VERSION,
+            'cluster': self.cluster,
+            'identifiers': list(self.identifiers),
+            'time': self.time,
+            'state': list(self.state),
+            'precision': {'tolerance': self.precision.tolerance, 'word_length': self.precision.word_length},
+            'time_step': self.time_step,
+        }
+
+        temporary_path = f'{os.fspath(path)}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path: os.PathLike) -> 'Checkpoint':
+        """Loads a checkpoint saved by :meth:`save`."""
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        if data.get('format') != FORMAT:
+            raise ValueError(f'"{path}" is not a Brutus checkpoint.')
+        if data.get('version') != VERSION:
+            raise ValueError(f'Unsupported checkpoint version {data.get("version")}.')
+
+        return Checkpoint(cluster=data['cluster'],
+                          identifiers=tuple(data['identifiers']),
+                          time=data['time'],
+                          state=tuple(data['state']),
+                          precision=Precision(**data['precision']),
+                          time_step=data['time_step'])
@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+# Number of values written by the getCounters function of the library, and per step by getTrace (see main.cpp)
+COUNTERS_SIZE = 9
+TRACE_RECORD_SIZE = 6
+
+
+@dataclass(frozen=True)
+class StepTrace:
+    """A record of each accepted integrator step of an evolve call, as arrays with one value per step."""
+    time: np.ndarray  # Time reached by the step
+    time_step: np.ndarray  # Time step taken, after the rejections
+    depth: np.ndarray  # Substeps n of the last Bulirsch-Stoer extrapolation level
+    rejections: np.ndarray  # Times the step was retried with a smaller time step
+    force_evaluations: np.ndarray
+    duration: np.ndarray  # Wall time of the step, in seconds
+
+    @staticmethod
+    def from_values(values: np.ndarray) -> 'StepTrace':
+        """Creates a trace from the records written by the library, one row per step."""
+        values = values.reshape(-1, TRACE_RECORD_SIZE)
+        return StepTrace(time=values[:, 0].copy(),
+                         time_step=values[:, 1].copy(),
+                         depth=values[:, 2].astype(np.int64),
+                         rejections=values[:, 3].astype(np.int64),
+                         force_evaluations=values[:, 4].astype(np.int64),
+                         duration=values[:, 5].copy())
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+
+@dataclass(frozen=True)
+class PerformanceCounters:
+    """The work done by Brutus for a cluster in an evolve call, and where its time went.
+
+    Many rejections or a depth close to the maximum (32) mean that the time step is too large for the tolerance, while
+    output and energy times close to the integration time mean that the outputs are too frequent for the time step.
+    """
+    steps: int  # Accepted integrator steps
+    rejections: int  # Steps retried with a smaller time step, because the extrapolation did not converge
+    force_evaluations: int
+    max_depth: int  # Largest number of substeps n of the last Bulirsch-Stoer extrapolation level of a step
+    mean_depth: float
+    integration_time: float  # Wall time of the integrator steps, in seconds
+    energy_time: float  # Wall time computing the energies of the outputs, in seconds
+    output_time: float  # Wall time formatting the outputs and handing them to Python, in seconds
+    diagnostics_time: float  # Wall time updating the reports and checking the stopping conditions, in seconds
+    trace: StepTrace | None = None  # Set if the integrator records traces
+
+    @staticmethod
+    def from_values(values, trace: StepTrace | None = None) -> 'PerformanceCounters':
+        """Creates counters from the values written by the library."""
+        (steps, rejections, force_evaluations, max_depth, mean_depth,
+         integration_time, energy_time, output_time, diagnostics_time) = values
+        return PerformanceCounters(steps=int(steps),
+                                   rejections=int(rejections),
+                                   force_evaluations=int(force_evaluations),
+                                   max_depth=int(max_depth),
+                                   mean_depth=float(mean_depth),
+                                   integration_time=float(integration_time),
+                                   energy_time=float(energy_time),
+                                   output_time=float(output_time),
+                                   diagnostics_time=float(diagnostics_time),
+                                   trace=trace)
@@ -0,0 +1,157 @@
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from ..common import Precision, OutputPolicy
+from ..output import Snapshot, Trajectory
+from ..output._output import SNAPSHOT_HEADER_SIZE, SNAPSHOT_STAR_SIZE
+from ._stopping import StoppingConditions
+
+
+# Largest number of systems sent to a worker at once, so the batches of large ensembles stay small to pickle and still
+# balance the load between the workers
+MAX_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class EnsembleResult:
+    """The states reached by the B systems of an ensemble, as arrays with the systems along the first axis:
+    - time: The time each system reached, with shape (B,). It is the end time unless a stopping condition was met.
+    - identifiers: The star identifiers, with shape (N,)
+    - masses, positions, velocities: The final state of the stars, with shapes (B, N), (B, N, 3) and (B, N, 3), in the
+      layout taken by :meth:`BrutusIntegrator.add_ensemble`
+    - stop_reasons: The :class:`StopReason` code of each system, with shape (B,)
+    - snapshots: The outputs of each system, if they were requested, as a :class:`Trajectory` with (B, T) times and
+      energies and (B, T, N, 7) states. Outputs after a system stopped early are NaN.
+    """
+    name: str
+    time: np.ndarray
+    identifiers: np.ndarray
+    masses: np.ndarray
+    positions: np.ndarray
+    velocities: np.ndarray
+    stop_reasons: np.ndarray
+    snapshots: Trajectory | None = None
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+
+@dataclass
+class _Ensemble:
+    """An ensemble added to the integrator, with its settings."""
+    name: str
+    identifiers: np.ndarray
+    masses: np.ndarray
+    positions: np.ndarray
+    velocities: np.ndarray
+    precision: Precision | None
+    output_policy: OutputPolicy | None  # None if only the final states are returned
+    batch_size: int | None
+
+    @staticmethod
+    def from_arrays(name: str, identifiers, masses, positions, velocities, **settings) -> '_Ensemble':
+        """Validates the arrays of the systems as a whole, without copying them if they are already float64."""
+        masses = np.ascontiguousarray(masses, dtype=np.float64)
+        positions = np.ascontiguousarray(positions, dtype=np.float64)
+        velocities = np.ascontiguousarray(velocities, dtype=np.float64)
+        if masses.ndim != 2:
+            raise ValueError('Masses must have shape (B, N), with one row per system.')
+
+        system_count, star_count = masses.shape
+        if positions.shape != (system_count, star_count, 3):
+            raise ValueError(f'Positions must have shape ({system_count}, {star_count}, 3).')
+        if velocities.shape != (system_count, star_count, 3):
+            raise ValueError(f'Velocities must have shape ({system_count}, {star_count}, 3).')
+        if not np.all(masses > 0):
+            raise ValueError('Mass must be positive.')
+
+        identifiers = np.arange(star_count) if identifiers is None else np.asarray(identifiers, dtype=np.int64)
+        if identifiers.shape != (star_count,) or len(np.unique(identifiers)) != star_count:
+            raise ValueError(f'Star identifiers must be {star_count} different integers.')
+
+        return _Ensemble(name=name, identifiers=identifiers, masses=masses, positions=positions, velocities=velocities,
+                         **settings)
+
+    def __len__(self) -> int:
+        return len(self.masses)
+
+    def batches(self, workers: int, chunks_per_worker: int) -> list[slice]:
+        """Splits the systems into the batches sent to the workers: chunks_per_worker batches per worker, of at most
+        MAX_BATCH_SIZE systems, unless the batch size was set."""
+        size = self.batch_size or min(math.ceil(len(self) / (max(workers, 1) * chunks_per_worker)), MAX_BATCH_SIZE)
+        return [slice(start, min(start + size, len(self))) for start in range(0, len(self), max(size, 1))]
+
+
+@dataclass
+class _EnsembleBatch:
+    """Everything a worker needs to simulate a batch of systems of an ensemble, in a single round-trip."""
+    ensemble: int  # Index of the ensemble in the integrator
+    name: str
+    start: int  # Index of the first system of the batch in the ensemble
+    identifiers: np.ndarray
+    masses: np.ndarray
+    positions: np.ndarray
+    velocities: np.ndarray
+    time: float
+    time_step: float
+    precision: Precision
+    output_policy: OutputPolicy | None
+    stopping_conditions: StoppingConditions | None
+    force_threads: int | None
+
+
+@dataclass
+class _BatchOutcome:
+    """What a worker sends back after simulating a batch of systems."""
+    ensemble: int
+    start: int
+    time: np.ndarray
+    masses: np.ndarray
+    positions: np.ndarray
+    velocities: np.ndarray
+    stop_reasons: np.ndarray
+    snapshots: np.ndarray | None  # The snapshot buffers output by each system, with shape (b, T, Snapshot.size(N))
+
+
+def gather_results(ensembles: list[_Ensemble], time: float, time_step: float, outcomes) -> list[EnsembleResult]:
+    """Gathers the outcomes of the batches of the ensembles, in any order, into the arrays of each ensemble."""
+    arrays = []
+    for ensemble in ensembles:
+        system_count = len(ensemble)
+        snapshots = None
+        if ensemble.output_policy is not None:
+            policy = ensemble.output_policy
+            output_count = len(policy.stars) if policy.stars is not None else len(ensemble.identifiers)
+            snapshots = np.empty((system_count, policy.snapshot_count(0, time, time_step), Snapshot.size(output_count)))
+        arrays.append({'time': np.empty(system_count),
+                       'masses': np.empty_like(ensemble.masses),
+                       'positions': np.empty_like(ensemble.positions),
+                       'velocities': np.empty_like(ensemble.velocities),
+                       'stop_reasons': np.empty(system_count, dtype=np.int64),
+                       'snapshots': snapshots})
+
+    for outcome in outcomes:
+        systems = slice(outcome.start, outcome.start + len(outcome.time))
+        for name, array in arrays[outcome.ensemble].items():
+            if array is not None:
+                array[systems] = getattr(outcome, name)
+
+    results = []
+    for ensemble, values in zip(ensembles, arrays):
+        snapshots = values.pop('snapshots')
+        if snapshots is not None:
+            policy = ensemble.output_policy
+            identifiers = np.array(policy.stars, dtype=np.int64) if policy.stars is not None else ensemble.identifiers
+            stars = snapshots[..., SNAPSHOT_HEADER_SIZE:].reshape(*snapshots.shape[:2], len(identifiers),
+                                                                   SNAPSHOT_STAR_SIZE)
+            snapshots = Trajectory(time=snapshots[..., 0],
+                                   identifiers=identifiers,
+                                   states=stars[..., 1:],
+                                   total_energy=snapshots[..., 2],
+                                   kinetic_energy=snapshots[..., 3],
+                                   potential_energy=snapshots[..., 4])
+        results.append(EnsembleResult(name=ensemble.name, identifiers=ensemble.identifiers, snapshots=snapshots,
+                                      **values))
+    return results
@@ -0,0 +1,36 @@
+from dataclasses import dataclass
+from typing import Any
+
+from ..output import Snapshot
+from ._report import SimulationReport
+from ._stopping import StopReason
+from ._counters import PerformanceCounters
+
+
+@dataclass(frozen=True)
+class SnapshotEvent:
+    """A new snapshot of a cluster, produced while the cluster is being simulated.
+
+    The snapshot is a copy, so it can be kept after the next event.
+    """
+    index: int  # Position of the cluster in the integrator
+    cluster: str
+    snapshot: Snapshot
+
+
+@dataclass(frozen=True)
+class ClusterFinished:
+    """A cluster finished its simulation. Holds the result of its output handler (None if it had no output handler)."""
+    index: int  # Position of the cluster in the integrator
+    cluster: str
+    result: Any
+    report: SimulationReport | None = None  # Set if the integrator computes reports
+    stop_reason: StopReason = StopReason.COMPLETED
+    counters: PerformanceCounters | None = None
+
+
+@dataclass(frozen=True)
+class _ClusterFailed:
+    """A cluster raised an exception. Re-raised by the integrator instead of being yielded."""
+    index: int
+    error: BaseException
@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+
+
+# Number of values written by the getReductions function of the library (see main.cpp)
+REDUCTIONS_SIZE = 6
+
+
+@dataclass(frozen=True)
+class SimulationReport:
+    """Statistics of a cluster over every integrator step of an evolve call, computed by Brutus as it runs.
+
+    Unlike the output, they cover the steps between output times, so close encounters and energy spikes are never
+    missed. They are measured from the state the cluster started the evolve call from.
+    """
+    steps: int  # Number of integrator steps
+    max_energy_error: float  # Maximum of |E(t) - E(start)| / |E(start)|
+    min_separation: float  # Minimum distance between two stars
+    min_separation_time: float  # Time of the minimum separation
+    virial_ratio: float  # 2K / |W| at the end of the simulation
+    mean_virial_ratio: float  # 2K / |W| averaged over time
+
+    @staticmethod
+    def from_values(values) -> 'SimulationReport':
+        """Creates a report from the values written by the library."""
+        steps, max_energy_error, min_separation, min_separation_time, virial_ratio, mean_virial_ratio = values
+        return SimulationReport(steps=int(steps),
+                                max_energy_error=float(max_energy_error),
+                                min_separation=float(min_separation),
+                                min_separation_time=float(min_separation_time),
+                                virial_ratio=float(virial_ratio),
+                                mean_virial_ratio=float(mean_virial_ratio))
+
@@ -0,0 +1,82 @@
+import math
+from dataclasses import dataclass
+
+from ..common import Cluster, Precision
+from ..output._output import snapshot_count
+
+
+# Number of chunks per worker that the work is split into. More chunks balance the load better, fewer chunks reduce
+# the overhead of sending tasks to the workers.
+CHUNKS_PER_WORKER = 4
+
+
+@dataclass(frozen=True)
+class ScheduleReport:
+    """How the clusters of an evolve call were scheduled, and how long they took.
+
+    The ideal makespan is the shortest possible wall time for the measured cluster durations: either the longest
+    cluster, or the total work evenly split between the workers.
+    """
+    workers: int
+    costs: tuple[float, ...]  # Estimated cost of each cluster, in the order they were added
+    durations: tuple[float, ...]  # Measured duration of each cluster, in seconds
+    chunks: tuple[tuple[int, ...], ...]  # Indices of the clusters sent to the workers together, in dispatch order
+    makespan: float  # Wall time of the evolve call, in seconds
+
+    @property
+    def ideal_makespan(self) -> float:
+        if not self.durations:
+            return 0.0
+        return max(max(self.durations), sum(self.durations) / self.workers)
+
+    @property
+    def efficiency(self) -> float:
+        """The ideal makespan divided by the measured one. 1 means no worker was idle while work remained."""
+        return self.ideal_makespan / self.makespan if self.makespan > 0 else 1.0
+
+
+def word_length(precision: Precision) -> int:
+    """Returns the word length of the precision settings, deriving it from the tolerance like Brutus if it is None."""
+    if precision.word_length:
+        return precision.word_length
+    return 4 * int(abs(math.log10(precision.tolerance))) + 32
+
+
+def estimate_cost(cluster: Cluster, time: float, time_step: float, precision: Precision) -> float:
+    """Estimates the relative cost of simulating a cluster.
+
+    The force evaluation is quadratic in the number of stars, it runs at least once per output step, the cost of each
+    arithmetic operation grows with the word length and the Bulirsch-Stoer integrator needs more iterations for smaller
+    tolerances. Only ratios between costs are meaningful.
+    """
+    star_count = len(cluster.stars)
+    digits = max(abs(math.log10(precision.tolerance)), 1)
+    return star_count ** 2 * snapshot_count(time, time_step) * word_length(precision) / 64 * digits
+
+
+def schedule(costs: list[float], workers: int) -> list[list[int]]:
+    """Splits the tasks with the given costs into chunks to be dispatched to the workers, longest first.
+
+    Expensive tasks get a chunk of their own and start first, so they do not end up running alone at the end. Cheaper
+    tasks are grouped, up to a fraction of the even share of each worker, so they are dispatched with less overhead
+    and fill the gaps at the end.
+    """
+    order = sorted(range(len(costs)), key=lambda index: costs[index], reverse=True)
+    target = sum(costs) / (max(workers, 1) * CHUNKS_PER_WORKER)
+
+    chunks = []
+    chunk = []
+    chunk_cost = 0
+    for index in order:
+        if chunk and chunk_cost + costs[index] > target:
+            chunks.append(chunk)
+            chunk = []
+            chunk_cost = 0
+
+        chunk.append(index)
+        chunk_cost += costs[index]
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
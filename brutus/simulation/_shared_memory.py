@@ -0,0 +1,114 @@
+import sys
+import weakref
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from ..output import Trajectory
+
+
+TRAJECTORY_FIELDS = ('time', 'identifiers', 'states', 'total_energy', 'kinetic_energy', 'potential_energy')
+ALIGNMENT = 64
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Where an array is stored in a shared memory block."""
+    name: str
+    dtype: str
+    shape: tuple
+    offset: int
+
+
+@dataclass(frozen=True)
+class SharedResult:
+    """A small, picklable description of a result whose arrays were written to a shared memory block.
+
+    Workers return it instead of the result itself, so only the description goes through the pipe. The parent process
+    rebuilds the result with :func:`attach`.
+    """
+    block: str
+    kind: str  # 'trajectory' or 'dataframe'
+    arrays: tuple
+    index: tuple | None = None  # RangeIndex start, stop and step of a DataFrame
+
+
+def share(result):
+    """Writes the arrays of a result to a new shared memory block and returns a SharedResult describing them.
+
+    Supports Trajectory results and DataFrames whose columns are all numeric and that have a RangeIndex. Other results
+    are returned unchanged, and are pickled as usual.
+
+    The block is closed in this process but not unlinked: ownership goes to the process that attaches to it.
+    """
+    if isinstance(result, Trajectory):
+        kind = 'trajectory'
+        arrays = {field: np.asarray(getattr(result, field)) for field in TRAJECTORY_FIELDS}
+        index = None
+    elif _is_numeric_dataframe(result):
+        kind = 'dataframe'
+        arrays = {column: result[column].to_numpy() for column in result.columns}
+        index = (result.index.start, result.index.stop, result.index.step)
+    else:
+        return result
+
+    layout = []
+    size = 0
+    for name, array in arrays.items():
+        layout.append(SharedArray(name=name, dtype=array.dtype.str, shape=array.shape, offset=size))
+        size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    block = _create_block(max(size, 1))
+    try:
+        for description, array in zip(layout, arrays.values()):
+            _view(block.buf, description)[...] = array
+    finally:
+        block.close()
+
+    return SharedResult(block=block.name, kind=kind, arrays=tuple(layout), index=index)
+
+
+def attach(result: SharedResult):
+    """Rebuilds a result from its shared memory block, without copying its arrays.
+
+    The block is unlinked straight away, so it is freed as soon as the arrays are no longer used.
+    """
+    block = shared_memory.SharedMemory(name=result.block)
+    base = np.ndarray((block.size,), dtype=np.uint8, buffer=block.buf)
+    weakref.finalize(base, block.close)
+    block.unlink()
+
+    arrays = {description.name: _view(base, description) for description in result.arrays}
+
+    if result.kind == 'trajectory':
+        return Trajectory(**arrays)
+
+    import pandas as pd
+    return pd.DataFrame(arrays, index=pd.RangeIndex(*result.index), copy=False)
+
+
+def _create_block(size: int) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(create=True, size=size)
+    # The parent process unlinks the block, so this process's resource tracker must not do it when the worker exits
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+def _view(buffer, description: SharedArray) -> np.ndarray:
+    dtype = np.dtype(description.dtype)
+    count = int(np.prod(description.shape, dtype=np.int64))
+    return np.frombuffer(buffer, dtype=dtype, count=count, offset=description.offset).reshape(description.shape)
+
+
+def _is_numeric_dataframe(result) -> bool:
+    # The result cannot be a DataFrame if pandas was never imported, and importing it just to check is slow
+    pd = sys.modules.get('pandas')
+    if pd is None:
+        return False
+
+    return (isinstance(result, pd.DataFrame)
+            and isinstance(result.index, pd.RangeIndex)
+            and result.columns.is_unique
+            and all(isinstance(column, str) for column in result.columns)
+            and all(dtype.kind in 'biuf' for dtype in result.dtypes))
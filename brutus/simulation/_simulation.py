@@ -1,12 +1,33 @@
 
 import multiprocessing as mp
+import copy
+import functools
+import queue
+import threading
+import itertools
+import time as time_module
 import subprocess as sp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import os
 import logging
 import ctypes
+import dataclasses
+import hashlib
+from dataclasses import dataclass
 
-from ..common import Cluster
-from ..output import BaseOutput
+import numpy as np
+
+from ..common import Cluster, Precision, OutputPolicy
+from ..output import BaseOutput, Snapshot
+from ._shared_memory import SharedResult, share, attach
+from ._events import SnapshotEvent, ClusterFinished, _ClusterFailed
+from ._scheduling import ScheduleReport, estimate_cost, schedule, CHUNKS_PER_WORKER
+from ._checkpoint import Checkpoint
+from ._report import SimulationReport, REDUCTIONS_SIZE
+from ._stopping import StoppingConditions, StopReason
+from ._counters import PerformanceCounters, StepTrace, COUNTERS_SIZE, TRACE_RECORD_SIZE
+from ._ensemble import EnsembleResult, _Ensemble, _EnsembleBatch, _BatchOutcome, gather_results
+from ._cache import ResultCache, _CachedRun, cache_key
 
 logger = logging.getLogger(__name__)
 
@@ -15,58 +36,404 @@ abspath = os.path.abspath(__file__)
 dylib_path = os.path.join(os.path.dirname(abspath), '..', 'lib', 'libmain.dylib')
 so_path = os.path.join(os.path.dirname(abspath), '..', 'lib', 'libmain.so')
 
-if os.path.exists(dylib_path):
-    lib_path = dylib_path
 
-elif os.path.exists(so_path):
-    lib_path = so_path
+@functools.cache
+def library_path() -> str:
+    """Returns the path of the compiled Brutus library. It is looked up the first time a simulation needs it, rather
+    than when brutus is imported, so the package can be imported (and its output files read) without it."""
+    if os.path.exists(dylib_path):
+        return dylib_path
+
+    if os.path.exists(so_path):
+        return so_path
 
-else:
     raise FileNotFoundError('Could not find the Brutus compiled library file. Make sure you compiled it correctly. If everything seems right, open an issue on GitHub.')
 
 
+BACKENDS = ('processes', 'threads')
+
+# Status codes returned by the library's evolve functions (see main.cpp)
+STATUS_COMPLETED = 0
+STATUS_NOT_CONVERGED = 1
+STATUS_INVALID_HANDLE = 2
+STATUS_ABORTED = 3
+STATUS_STOPPED = 4
+
+# Output policy of ensembles that only return their final states: the first and last steps, without energies
+_FINAL_STATE_POLICY = OutputPolicy(every=10 ** 9, energy_every=0)
+
+
+class SimulationCancelled(Exception):
+    """Raised when a simulation is stopped before reaching its end time."""
+
+
+# Queue that worker processes put events into, set by the pool initializer of iter_evolve
+_event_queue = None
+
+
+def _init_event_queue(event_queue):
+    global _event_queue
+    _event_queue = event_queue
+
+
+# Cancellation flags (one per cluster) of the worker processes of iter_evolve_async, set by the executor initializer
+_cancel_flags = None
+
+
+def _init_cancel_flags(cancel_flags):
+    global _cancel_flags
+    _cancel_flags = cancel_flags
+
+
+# The interface of this process, shared by every simulation it runs (see get_interface)
+_interface = None
+_interface_lock = threading.Lock()
+
+
+def get_interface() -> 'BrutusInterface':
+    """Returns the BrutusInterface of this process, loading the library the first time."""
+    global _interface
+    with _interface_lock:
+        if _interface is None:
+            _interface = BrutusInterface()
+        return _interface
+
+
+@functools.cache
+def library_build() -> str:
+    """Returns a hash of the Brutus library file, which identifies the build that computed a cached result."""
+    with open(library_path(), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _init_worker():
+    # Load the library when the worker starts, rather than in its first simulation
+    get_interface()
+
+
+def _receives_snapshots(output_handler: BaseOutput) -> bool:
+    """Whether the output handler reads binary snapshots, rather than relying on the default text adapter."""
+    return type(output_handler).receive_snapshot is not BaseOutput.receive_snapshot
+
+
+@dataclass
+class _Outcome:
+    """What a worker sends back after simulating a cluster."""
+    result: object  # Result of the output handler, or a SharedResult describing it
+    checkpoint: Checkpoint
+    report: SimulationReport | None
+    stop_reason: StopReason
+    counters: PerformanceCounters | None  # None if the outcome was replayed from a cached run
+    recording: np.ndarray | None = None  # Every snapshot output, one per row, if the task was recorded
+
+
+@dataclass
+class _Task:
+    """Everything a worker needs to simulate a cluster."""
+    cluster: Cluster
+    time: float
+    time_step: float
+    output_handler: BaseOutput | None
+    precision: Precision
+    start: Checkpoint | None = None  # State to start from, instead of the initial conditions of the cluster
+    checkpoint_path: str | None = None
+    checkpoint_interval: float | None = None
+    output_policy: OutputPolicy = OutputPolicy()
+    reports: bool = False
+    stopping_conditions: StoppingConditions | None = None
+    force_threads: int | None = None
+    trace: bool = False
+    record: bool = False  # Keep a copy of every snapshot in the outcome, to cache the run
+
+    @property
+    def start_time(self) -> float:
+        return float(self.start.time) if self.start is not None else 0.0
+
+
 class BrutusInterface:
     """A Python interface to the Brutus integrator library. The interface
     provides methods to initialize a cluster, add stars to it, evolve the
     cluster, and clean up resources. The interface is implemented using
-    ctypes to call functions in the Brutus library."""
+    ctypes to call functions in the Brutus library.
+
+    Each cluster is identified by the opaque handle returned by init_cluster,
+    so several clusters can be simulated at the same time from different
+    threads. The GIL is released while the library runs."""
 
     def __init__(self):
-        self.lib = ctypes.CDLL(lib_path)
+        self.lib = ctypes.CDLL(library_path())
 
+        self.handle_t = ctypes.c_void_p
         self.time_t = ctypes.c_double
         self.star_identifier_t = ctypes.c_int
+        self.tolerance_t = ctypes.c_char_p
+        self.word_length_t = ctypes.c_int
         self.mass_t = ctypes.c_double
         self.position_t = ctypes.c_double * 3
         self.velocity_t = ctypes.c_double * 3
+        self.buffer_t = ctypes.POINTER(ctypes.c_double)
+        self.line_callback_t = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_char_p)
+        self.snapshot_callback_t = ctypes.CFUNCTYPE(ctypes.c_int)
+        self.checkpoint_callback_t = ctypes.CFUNCTYPE(None, ctypes.c_char_p)
+        self.ensemble_callback_t = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_int)
 
         self.lib.initCluster.argtypes = []
-        self.lib.addStar.argtypes = [self.star_identifier_t, self.mass_t, self.position_t, self.velocity_t]
-        self.lib.evolve.argtypes = [self.time_t, self.time_t, ctypes.CFUNCTYPE(None, ctypes.c_char_p)]
-        self.lib.cleanup.argtypes = None
+        self.lib.addStar.argtypes = [self.handle_t, self.star_identifier_t, self.mass_t, self.position_t, self.velocity_t]
+        self.lib.addStars.argtypes = [self.handle_t, ctypes.c_int, ctypes.POINTER(self.star_identifier_t), self.buffer_t,
+                                      self.buffer_t, self.buffer_t]
+        self.lib.setPrecision.argtypes = [self.handle_t, self.tolerance_t, self.word_length_t]
+        self.lib.getWordLength.argtypes = [self.handle_t]
+        self.lib.setState.argtypes = [self.handle_t, ctypes.c_char_p]
+        self.lib.getState.argtypes = [self.handle_t, ctypes.c_char_p, ctypes.c_int]
+        self.lib.setStateArrays.argtypes = [self.handle_t, self.time_t, self.buffer_t, self.buffer_t, self.buffer_t]
+        self.lib.getStateArrays.argtypes = [self.handle_t, self.buffer_t, self.buffer_t, self.buffer_t]
+        self.lib.setCheckpoints.argtypes = [self.handle_t, self.time_t, self.checkpoint_callback_t]
+        self.lib.setOutputEvery.argtypes = [self.handle_t, ctypes.c_int]
+        self.lib.setOutputTimes.argtypes = [self.handle_t, self.buffer_t, ctypes.c_int]
+        self.lib.setOutputStars.argtypes = [self.handle_t, ctypes.POINTER(self.star_identifier_t), ctypes.c_int]
+        self.lib.setEnergyInterval.argtypes = [self.handle_t, ctypes.c_int]
+        self.lib.setReductions.argtypes = [self.handle_t, ctypes.c_int]
+        self.lib.getReductions.argtypes = [self.handle_t, self.buffer_t]
+        self.lib.setStoppingConditions.argtypes = [self.handle_t, ctypes.c_double, ctypes.c_double, ctypes.c_double, ctypes.c_double]
+        self.lib.getStopReason.argtypes = [self.handle_t]
+        self.lib.setForceThreads.argtypes = [self.handle_t, ctypes.c_int]
+        self.lib.setTrace.argtypes = [self.handle_t, ctypes.c_int]
+        self.lib.getCounters.argtypes = [self.handle_t, self.buffer_t]
+        self.lib.getTrace.argtypes = [self.handle_t, self.buffer_t, ctypes.c_int]
+        self.lib.evolve.argtypes = [self.handle_t, self.time_t, self.time_t, self.line_callback_t]
+        self.lib.evolveSnapshots.argtypes = [self.handle_t, self.time_t, self.time_t, self.buffer_t, self.snapshot_callback_t]
+        self.lib.evolveEnsemble.argtypes = [self.handle_t, ctypes.c_int, self.time_t, self.time_t, self.buffer_t,
+                                            self.buffer_t, self.buffer_t, self.buffer_t, ctypes.POINTER(ctypes.c_int),
+                                            self.buffer_t, self.ensemble_callback_t, ctypes.POINTER(ctypes.c_int)]
+        self.lib.cleanup.argtypes = [self.handle_t]
 
-        self.lib.initCluster.restype = None
+        self.lib.initCluster.restype = self.handle_t
         self.lib.addStar.restype = None
-        self.lib.evolve.restype = None
+        self.lib.addStars.restype = None
+        self.lib.setPrecision.restype = None
+        self.lib.getWordLength.restype = self.word_length_t
+        self.lib.setState.restype = None
+        self.lib.getState.restype = ctypes.c_int
+        self.lib.setStateArrays.restype = None
+        self.lib.getStateArrays.restype = ctypes.c_int
+        self.lib.setCheckpoints.restype = None
+        self.lib.setOutputEvery.restype = None
+        self.lib.setOutputTimes.restype = None
+        self.lib.setOutputStars.restype = None
+        self.lib.setEnergyInterval.restype = None
+        self.lib.setReductions.restype = None
+        self.lib.getReductions.restype = ctypes.c_int
+        self.lib.setStoppingConditions.restype = None
+        self.lib.getStopReason.restype = ctypes.c_int
+        self.lib.setForceThreads.restype = None
+        self.lib.setTrace.restype = None
+        self.lib.getCounters.restype = ctypes.c_int
+        self.lib.getTrace.restype = ctypes.c_int
+        self.lib.evolve.restype = ctypes.c_int
+        self.lib.evolveSnapshots.restype = ctypes.c_int
+        self.lib.evolveEnsemble.restype = ctypes.c_int
         self.lib.cleanup.restype = None
 
-    def init_cluster(self):
-        """Initialize a cluster with the given seed."""
-        self.lib.initCluster()
+    def init_cluster(self) -> int:
+        """Initialize a new cluster and return its handle."""
+        return self.lib.initCluster()
 
-    def add_star(self, identifier: int, mass: float, position: tuple, velocity: tuple):
+    def add_star(self, handle: int, identifier: int, mass: float, position: tuple, velocity: tuple):
         """Add a star to the cluster with the given mass, position, and velocity."""
-        self.lib.addStar(identifier,
+        self.lib.addStar(handle,
+                         identifier,
                          mass,
                          self.position_t(*position),
                          self.velocity_t(*velocity))
+
+    def add_stars(self, handle: int, identifiers: np.ndarray, masses: np.ndarray, positions: np.ndarray,
+                  velocities: np.ndarray):
+        """Add the stars with the given identifiers (N,), masses (N,), positions (N, 3) and velocities (N, 3) to the
+        cluster, in a single call (see Cluster.to_arrays)."""
+        star_count = len(identifiers)
+        identifiers = np.ascontiguousarray(identifiers, dtype=np.intc)
+        masses = np.ascontiguousarray(masses, dtype=np.float64)
+        positions = np.ascontiguousarray(positions, dtype=np.float64)
+        velocities = np.ascontiguousarray(velocities, dtype=np.float64)
+        if masses.shape != (star_count,) or positions.shape != (star_count, 3) or velocities.shape != (star_count, 3):
+            raise ValueError(f'Star arrays must have shapes ({star_count},), ({star_count},), ({star_count}, 3) and '
+                             f'({star_count}, 3).')
+
+        self.lib.addStars(handle,
+                          star_count,
+                          identifiers.ctypes.data_as(ctypes.POINTER(self.star_identifier_t)),
+                          masses.ctypes.data_as(self.buffer_t),
+                          positions.ctypes.data_as(self.buffer_t),
+                          velocities.ctypes.data_as(self.buffer_t))
+
+    def set_precision(self, handle: int, precision: Precision):
+        """Set the Bulirsch-Stoer tolerance and word length used to evolve the cluster."""
+        self.lib.setPrecision(handle,
+                              repr(float(precision.tolerance)).encode(),
+                              precision.word_length or 0)
+
+    def get_word_length(self, handle: int) -> int:
+        """Get the word length (in bits) used to evolve the cluster, after deriving it from the tolerance if needed."""
+        return self.lib.getWordLength(handle)
         
-    def evolve(self, time: float, step_time: float, callback):
-        """Evolve the cluster for the given time."""
-        self.lib.evolve(time, step_time, callback)
+    def set_state(self, handle: int, state: str):
+        """Set the full precision state (time and star values) to evolve the cluster from, replacing its stars."""
+        self.lib.setState(handle, state.encode())
+
+    def get_state(self, handle: int) -> str:
+        """Get the full precision state of the cluster: the time followed by the m, x, y, z, vx, vy, vz of each star."""
+        size = self.lib.getState(handle, None, 0) + 1
+        buffer = ctypes.create_string_buffer(size)
+        self.lib.getState(handle, buffer, size)
+        return buffer.value.decode()
+
+    def set_state_arrays(self, handle: int, time: float, masses: np.ndarray, positions: np.ndarray,
+                         velocities: np.ndarray):
+        """Set the state to evolve the cluster from as arrays, replacing its stars and any state set by set_state.
+
+        The arrays hold the masses (N,), positions (N, 3) and velocities (N, 3) of the stars added, in the order they
+        were added. Must be called after set_precision.
+        """
+        star_count = self.get_state_arrays_size(handle)
+        masses = np.ascontiguousarray(masses, dtype=np.float64)
+        positions = np.ascontiguousarray(positions, dtype=np.float64)
+        velocities = np.ascontiguousarray(velocities, dtype=np.float64)
+        if masses.shape != (star_count,) or positions.shape != (star_count, 3) or velocities.shape != (star_count, 3):
+            raise ValueError(f'State arrays must have shapes ({star_count},), ({star_count}, 3) and ({star_count}, 3).')
+
+        self.lib.setStateArrays(handle,
+                                time,
+                                masses.ctypes.data_as(self.buffer_t),
+                                positions.ctypes.data_as(self.buffer_t),
+                                velocities.ctypes.data_as(self.buffer_t))
+
+    def get_state_arrays(self, handle: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the state of the cluster rounded to double precision, as arrays of masses (N,), positions (N, 3) and
+        velocities (N, 3), in the order the stars were added."""
+        star_count = self.get_state_arrays_size(handle)
+        masses = np.empty(star_count)
+        positions = np.empty((star_count, 3))
+        velocities = np.empty((star_count, 3))
+        self.lib.getStateArrays(handle,
+                                masses.ctypes.data_as(self.buffer_t),
+                                positions.ctypes.data_as(self.buffer_t),
+                                velocities.ctypes.data_as(self.buffer_t))
+        return masses, positions, velocities
+
+    def get_state_arrays_size(self, handle: int) -> int:
+        """Get the number of stars N of the state arrays of the cluster."""
+        return self.lib.getStateArrays(handle, None, None, None)
+
+    def set_checkpoints(self, handle: int, interval: float, callback):
+        """Call callback with the full precision state (see get_state) every interval time units while evolving."""
+        self.lib.setCheckpoints(handle, interval, callback)
+
+    def set_output_policy(self, handle: int, policy: OutputPolicy):
+        """Set which steps, stars and energies are output while evolving the cluster. Must be called after add_star."""
+        self.lib.setOutputEvery(handle, policy.every)
+
+        times = policy.times or ()
+        self.lib.setOutputTimes(handle, (ctypes.c_double * len(times))(*times), len(times))
+
+        stars = policy.stars or ()
+        self.lib.setOutputStars(handle, (self.star_identifier_t * len(stars))(*stars), len(stars))
+
+        self.lib.setEnergyInterval(handle, policy.energy_every)
 
-    def cleanup(self):
-        self.lib.cleanup()
+    def set_reductions(self, handle: int, enabled: bool):
+        """Enable or disable the statistics computed by the library after every integrator step."""
+        self.lib.setReductions(handle, int(enabled))
+
+    def get_reductions(self, handle: int) -> SimulationReport | None:
+        """Get the statistics of the last evolve call, or None if they are disabled."""
+        values = np.zeros(REDUCTIONS_SIZE)
+        if self.lib.getReductions(handle, values.ctypes.data_as(self.buffer_t)) == 0:
+            return None
+        return SimulationReport.from_values(values.tolist())
+
+    def set_stopping_conditions(self, handle: int, conditions: StoppingConditions | None):
+        """Set the conditions that end the evolve calls of the cluster early. None disables them."""
+        conditions = conditions or StoppingConditions()
+        self.lib.setStoppingConditions(handle,
+                                       conditions.escape_radius or 0,
+                                       conditions.encounter_distance or 0,
+                                       conditions.max_energy_error or 0,
+                                       conditions.wall_time or 0)
+
+    def get_stop_reason(self, handle: int) -> StopReason:
+        """Get the reason the last evolve call of the cluster ended."""
+        return StopReason(self.lib.getStopReason(handle))
+
+    def set_force_threads(self, handle: int, threads: int | None):
+        """Set the number of threads that compute the forces of the cluster. None uses the serial pair loop."""
+        self.lib.setForceThreads(handle, threads or 0)
+
+    def set_trace(self, handle: int, enabled: bool):
+        """Enable or disable the record of each integrator step of the next evolve calls (see get_counters)."""
+        self.lib.setTrace(handle, int(enabled))
+
+    def get_counters(self, handle: int) -> PerformanceCounters:
+        """Get the performance counters of the last evolve call, with its step trace if it is enabled."""
+        values = np.zeros(COUNTERS_SIZE)
+        self.lib.getCounters(handle, values.ctypes.data_as(self.buffer_t))
+
+        trace = None
+        steps = self.lib.getTrace(handle, None, 0)
+        if steps:
+            records = np.zeros(steps * TRACE_RECORD_SIZE)
+            self.lib.getTrace(handle, records.ctypes.data_as(self.buffer_t), steps)
+            trace = StepTrace.from_values(records)
+
+        return PerformanceCounters.from_values(values.tolist(), trace=trace)
+
+    def evolve(self, handle: int, time: float, step_time: float, callback) -> int:
+        """Evolve the cluster for the given time. Returns one of the STATUS_* codes.
+
+        The callback takes the output line of a step and returns 0 to continue, or any other value to stop the
+        simulation (STATUS_ABORTED is then returned).
+        """
+        return self.lib.evolve(handle, time, step_time, callback)
+
+    def evolve_snapshots(self, handle: int, time: float, step_time: float, buffer: np.ndarray, callback) -> int:
+        """Evolve the cluster for the given time, writing the state at each step into buffer.
+
+        The buffer must be a contiguous float64 array of Snapshot.size(star_count) elements. The callback takes no
+        arguments and is called each time the buffer holds a new step. It returns 0 to continue, or any other value to
+        stop the simulation. Returns one of the STATUS_* codes.
+        """
+        return self.lib.evolveSnapshots(handle, time, step_time, buffer.ctypes.data_as(self.buffer_t), callback)
+
+    def evolve_ensemble(self, handle: int, time: float, step_time: float, masses: np.ndarray, positions: np.ndarray,
+                        velocities: np.ndarray, times: np.ndarray, stop_reasons: np.ndarray, buffer: np.ndarray,
+                        callback=None) -> tuple[int, int]:
+        """Evolve B systems with the stars and settings of the cluster from t = 0 to t = time, one after the other.
+
+        The contiguous arrays hold the masses (B, N), positions (B, N, 3) and velocities (B, N, 3) of the systems, and
+        are overwritten with the states they reach. The time each system reaches and its StopReason code are written
+        into times (float64) and stop_reasons (intc), with shape (B,). Each output is written into buffer, as by
+        evolve_snapshots, and callback, if any, is called with the index of the system; it returns 0 to continue.
+
+        Returns one of the STATUS_* codes, and the index of the system that did not complete if it is not
+        STATUS_COMPLETED.
+        """
+        failed = ctypes.c_int(-1)
+        status = self.lib.evolveEnsemble(handle,
+                                         len(masses),
+                                         time,
+                                         step_time,
+                                         masses.ctypes.data_as(self.buffer_t),
+                                         positions.ctypes.data_as(self.buffer_t),
+                                         velocities.ctypes.data_as(self.buffer_t),
+                                         times.ctypes.data_as(self.buffer_t),
+                                         stop_reasons.ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
+                                         buffer.ctypes.data_as(self.buffer_t),
+                                         callback or self.ensemble_callback_t(),
+                                         ctypes.byref(failed))
+        return status, failed.value
+
+    def cleanup(self, handle: int):
+        """Release the cluster's resources. The handle must not be used afterwards."""
+        self.lib.cleanup(handle)
 
 
 class BrutusIntegrator:
@@ -74,25 +441,126 @@ class BrutusIntegrator:
                  time_step: float,
                  *,
                  bulirsch_stoer_tolerance: float = 1e-11,
-                 word_length: int = 128,
-                 workers: int = 1):
+                 word_length: int | None = 128,
+                 workers: int = 1,
+                 backend: str = 'processes',
+                 shared_memory: bool = False,
+                 checkpoint_dir: os.PathLike | None = None,
+                 checkpoint_interval: float | None = None,
+                 output_policy: OutputPolicy | None = None,
+                 reports: bool = False,
+                 stopping_conditions: StoppingConditions | None = None,
+                 force_threads: int | None = None,
+                 trace: bool = False,
+                 cache: ResultCache | os.PathLike | None = None):
         """Initialize the Brutus integrator.
         The default parameters are taken from the Newton vs. the Machine paper.
 
         Args:
             bulirsch_stoer_tolerance: The tolerance to use for the Bulirsch-Stoer integrator.
-            word_length: The word length to use for the Bulirsch-Stoer integrator.
+            word_length: The word length (in bits) to use for the Bulirsch-Stoer integrator. If None, it is derived from the tolerance.
             workers: The number of workers to use for parallel processing. Each worker will run a separate simulation, meaning that the number of workers is the number of simulations that can be run in parallel.
+            backend: How workers are run. 'processes' runs each worker in a separate process. 'threads' runs the workers in a thread pool inside the current process, which avoids process startup and pickling of clusters, output handlers and results.
+            shared_memory: With the 'processes' backend, return Trajectory results and numeric DataFrames (such as those of PandasOutput with the 'wide' or 'long' layout) through shared memory instead of pickling them. Workers write the arrays to a shared memory block and the results are rebuilt in this process without copying them. Other results are pickled as usual.
+            checkpoint_dir: A folder to save the state of each cluster to, as <cluster name>.checkpoint.json, when its simulation finishes. Load them with Checkpoint.load and continue them with resume.
+            checkpoint_interval: If set, the checkpoints are also saved every checkpoint_interval time units while the clusters are simulated, so a crash only loses the time since the last checkpoint. Requires checkpoint_dir.
+            output_policy: Which steps, stars and energies are output, for clusters that were added without their own policy. By default, every star and the energies are output at every time step.
+            reports: Compute a SimulationReport for each cluster: its maximum energy error, minimum separation between stars and virial ratio over every integrator step, not just the output times. They are stored in reports after evolve. This costs one O(N^2) pass over the stars per integrator step.
+            stopping_conditions: Conditions that end the simulation of a cluster before t = time, such as the escape of a star. The reason each cluster ended is stored in stop_reasons after evolve.
+            force_threads: The number of threads that compute the forces between the stars of each cluster, for clusters with hundreds of stars. The pair loop is then split into a fixed number of partitions that are summed in a fixed order, so the result is the same for any number of threads, but differs from the default serial loop by rounding. If None, the forces are computed by the serial loop. Each worker uses up to this many threads, so workers * force_threads should not exceed the number of cores.
+            trace: Record each integrator step of each cluster (its time step, extrapolation depth, rejections, force evaluations and wall time) in the trace of its PerformanceCounters. The trace grows with the number of steps, so it is off by default; the counters themselves are always stored in counters after evolve.
+            cache: A ResultCache, or a folder to keep one in, to reuse the results of clusters that were already evolved with the same stars and settings by this build of the library. Each cluster is then simulated once: duplicate clusters within an evolve call, and clusters found in the cache, are replayed through their output handlers instead. Replayed clusters have no counters. Only evolve uses the cache, and clusters with a wall time stopping condition are never cached.
         """
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend "{backend}". Must be one of: {", ".join(BACKENDS)}.')
+        if checkpoint_interval is not None and checkpoint_interval <= 0:
+            raise ValueError('Checkpoint interval must be positive.')
+        if checkpoint_interval is not None and checkpoint_dir is None:
+            raise ValueError('A checkpoint interval requires a checkpoint folder.')
+        if force_threads is not None and force_threads < 1:
+            raise ValueError('The number of force threads must be at least 1.')
+
         self.time_step = time_step
         self.bulirsch_stoer_tolerance = bulirsch_stoer_tolerance
         self.word_length = word_length
 
         self.workers = workers
+        self.backend = backend
+        self.shared_memory = shared_memory
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.output_policy = output_policy or OutputPolicy()
+        self.compute_reports = reports
+        self.stopping_conditions = stopping_conditions
+        self.force_threads = force_threads
+        self.trace = trace
+        self.cache = cache if cache is None or isinstance(cache, ResultCache) else ResultCache(cache)
+        self.schedule_report = None  # Set by evolve()
+        self.pool = None  # Workers reused by every evolve call, between open() and close()
         self.clusters = []
         self.output_handlers = []
+        self.precisions = []
+        self.output_policies = []
+        self.starts = []  # Checkpoint each cluster starts from, or None to start from its stars at t = 0
+        self.checkpoints = []  # State reached by each cluster in the last evolve call, or None
+        self.reports = []  # SimulationReport of each cluster in the last evolve call, if compute_reports is set
+        self.stop_reasons = []  # StopReason of each cluster in the last evolve call, or None
+        self.counters = []  # PerformanceCounters of each cluster in the last evolve call, or None
+        self.ensembles = []
+
+    def __enter__(self):
+        self.open()
+        return self
 
-    def add_cluster(self, cluster: Cluster, *, output_handler: BaseOutput | None = None):
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """Starts the workers, which are then kept alive and reused by every call to evolve until close is called.
+
+        The workers load the Brutus library once, when they start, so repeated evolve calls do not pay for starting
+        processes or loading the library. The integrator can also be used as a context manager, which calls open and
+        close.
+        """
+        if self.pool is None:
+            self.pool = self._create_pool()
+
+    def close(self):
+        """Stops the workers started by open."""
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            self._close_pool(pool)
+
+    def _create_pool(self):
+        # A missing library is reported here, as the pools would only see their initializer fail in every worker
+        library_path()
+        if self.backend == 'threads':
+            return ThreadPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return mp.Pool(processes=self.workers, initializer=_init_worker)
+
+    def _close_pool(self, pool, terminate: bool = False):
+        if self.backend == 'threads':
+            pool.shutdown(wait=not terminate, cancel_futures=terminate)
+        elif terminate:
+            pool.terminate()
+        else:
+            pool.close()
+            pool.join()
+
+    @property
+    def precision(self) -> Precision:
+        """The precision used for clusters that were added without their own precision settings."""
+        return Precision(tolerance=self.bulirsch_stoer_tolerance, word_length=self.word_length)
+
+    def add_cluster(self,
+                    cluster: Cluster,
+                    *,
+                    output_handler: BaseOutput | None = None,
+                    precision: Precision | None = None,
+                    output_policy: OutputPolicy | None = None,
+                 reports: bool = False,
+                 stopping_conditions: StoppingConditions | None = None,
+                 force_threads: int | None = None):
         """Add a new star cluster.
 
         For each star cluster, a new Brutus process will be spawned to handle the simulation, which will be run in
@@ -103,46 +571,641 @@ class BrutusIntegrator:
         Args:
             cluster: The star cluster to simulate.
             output_handler: The output handler to use for the simulation. If None, no output will be generated.
+            precision: The precision settings for this cluster. If None, the integrator's tolerance and word length are
+                used.
+            output_policy: Which steps, stars and energies of this cluster are output. If None, the integrator's
+                output policy is used.
         """
+        policy = output_policy or self.output_policy
+        if policy.stars is not None:
+            missing = set(policy.stars) - set(cluster.identifiers.tolist())
+            if missing:
+                raise ValueError(f'Cluster "{cluster.name}" has no stars with identifiers {sorted(missing)}.')
+
         self.clusters.append(cluster)
         self.output_handlers.append(output_handler)
+        self.precisions.append(precision)
+        self.output_policies.append(output_policy)
+        self.starts.append(None)
+        self.checkpoints.append(None)
+        self.reports.append(None)
+        self.stop_reasons.append(None)
+        self.counters.append(None)
+
+    def resume(self,
+               checkpoint: Checkpoint,
+               *,
+               output_handler: BaseOutput | None = None,
+               output_policy: OutputPolicy | None = None):
+        """Add a cluster that continues from a checkpoint, with the precision settings it was simulated with.
+
+        The cluster starts from the exact state saved in the checkpoint, so evolving it to a later time gives the same
+        result as a simulation that was never interrupted.
+
+        Args:
+            checkpoint: The checkpoint to continue from, for example loaded with Checkpoint.load.
+            output_handler: The output handler to use for the simulation. If None, no output will be generated.
+            output_policy: Which steps, stars and energies are output. If None, the integrator's output policy is used.
+        """
+        cluster = checkpoint.to_cluster()
+        self.add_cluster(cluster, output_handler=output_handler, precision=checkpoint.precision, output_policy=output_policy)
+        self.starts[-1] = checkpoint
 
-    def evolve(self, time: float):
+    def add_ensemble(self,
+                     masses: np.ndarray,
+                     positions: np.ndarray,
+                     velocities: np.ndarray,
+                     *,
+                     name: str | None = None,
+                     identifiers: np.ndarray | None = None,
+                     precision: Precision | None = None,
+                     snapshots: bool = False,
+                     output_policy: OutputPolicy | None = None,
+                     batch_size: int | None = None):
+        """Add an ensemble of B independent systems of N stars each, such as millions of three-body problems.
+
+        The systems are given as arrays, so no Cluster, output handler or task is created for each of them. They are
+        sent to the workers in batches of many systems, and a worker simulates each batch with a single call to the
+        library. After evolve, the :class:`EnsembleResult` of each ensemble follows the results of the
+        clusters. Ensembles use the time step, stopping conditions and force threads of the integrator, but have no
+        checkpoints, reports or counters, and always start from the given states.
+
+        Args:
+            masses: The masses of the stars of each system, with shape (B, N).
+            positions: The positions of the stars of each system, with shape (B, N, 3).
+            velocities: The velocities of the stars of each system, with shape (B, N, 3).
+            name: The name of the ensemble, used in logs and errors. Defaults to ensemble_<index>.
+            identifiers: The star identifiers, the same in every system, with shape (N,). Defaults to 0 to N - 1.
+            precision: The precision settings of the systems. If None, the integrator's tolerance and word length are
+                used.
+            snapshots: Return the outputs of every system in the snapshots of the result. Otherwise, only the final
+                states are returned and the systems are evolved without calling back into Python.
+            output_policy: Which steps, stars and energies are returned in the snapshots. If None, the integrator's
+                output policy is used.
+            batch_size: The number of systems sent to a worker at once. By default, the ensemble is split into a few
+                batches per worker, of at most 1000 systems.
+        """
+        if batch_size is not None and batch_size < 1:
+            raise ValueError('The batch size must be at least 1.')
+
+        policy = (output_policy or self.output_policy) if snapshots else None
+        ensemble = _Ensemble.from_arrays(name or f'ensemble_{len(self.ensembles)}', identifiers, masses, positions,
+                                         velocities, precision=precision, output_policy=policy, batch_size=batch_size)
+
+        if policy is not None and policy.stars is not None:
+            missing = set(policy.stars) - set(ensemble.identifiers.tolist())
+            if missing:
+                raise ValueError(f'Ensemble "{ensemble.name}" has no stars with identifiers {sorted(missing)}.')
+
+        self.ensembles.append(ensemble)
+
+    def evolve(self, time: float, *, resume: bool = False):
         """Evolve the simulation until t = time.
 
-        This will spawn a new process for each star cluster and run the simulation in parallel.
+        This will run the simulation of each star cluster in parallel, in a pool of processes or threads depending on the
+        backend. The most expensive clusters (estimated from their number of stars, end time, time step and precision)
+        are started first, so they do not keep a single worker busy after the others are done. How the clusters were
+        scheduled is stored in :attr:`schedule_report`.
+
+        The state reached by each cluster is stored in :attr:`checkpoints` (and saved to the checkpoint folder, if
+        any), and its statistics in :attr:`reports` if they are computed. Clusters that meet one of the stopping
+        conditions end early, at the time recorded in their checkpoint, for the reason stored in :attr:`stop_reasons`.
+        The work done for each cluster, and where its time went, is stored in :attr:`counters`.
+
+        Args:
+            time: The time to evolve the clusters to.
+            resume: If True, each cluster continues from the state it reached in the previous evolve call, instead of
+                starting again from its initial conditions. Extending a simulation from t = 10 to t = 20 then only
+                integrates the last 10 time units.
 
         Returns:
             A list of results for each star cluster. Each result is the output of the simulation, as generated by the
-            output handler.
+            output handler. It is followed by an :class:`EnsembleResult` for each ensemble.
         """
-        with mp.Pool(processes=self.workers) as pool:
-            results = pool.starmap(self._simulate_cluster, [(cluster, time, output_handler) for cluster, output_handler in zip(self.clusters, self.output_handlers)])
+        tasks = self._tasks(time, resume=resume)
+        batches = self._ensemble_batches(time)
+        keys, runs, simulated = self._cached_runs(tasks)
+        costs = [estimate_cost(task.cluster, task.time - task.start_time, task.time_step, task.precision) for task in tasks]
+        chunks = [[simulated[index] for index in chunk] for chunk in schedule([costs[index] for index in simulated], self.workers)]
+        chunk_tasks = [[(index, tasks[index]) for index in chunk] for chunk in chunks]
 
+        outcomes = [None] * len(tasks)
+        durations = [0.0] * len(tasks)
+        start = time_module.perf_counter()
+
+        pool = self.pool or self._create_pool()
+        try:
+            # The ensemble batches are queued right after the clusters, so the workers do not wait between them
+            if self.backend == 'threads':
+                chunk_results = pool.map(functools.partial(_simulate_chunk, shared_memory=False), chunk_tasks)
+                batch_outcomes = pool.map(_simulate_ensemble_batch, batches)
+            else:
+                chunk_results = pool.imap_unordered(functools.partial(_simulate_chunk, shared_memory=self.shared_memory), chunk_tasks)
+                batch_outcomes = pool.imap_unordered(_simulate_ensemble_batch, batches)
+
+            for index, outcome, duration in itertools.chain.from_iterable(chunk_results):
+                if isinstance(outcome.result, SharedResult):
+                    outcome.result = attach(outcome.result)
+                outcomes[index] = outcome
+                durations[index] = duration
+
+            ensemble_results = gather_results(self.ensembles, time, self.time_step, batch_outcomes)
+        except BaseException:
+            if pool is not self.pool:
+                self._close_pool(pool, terminate=True)
+            raise
+        else:
+            if pool is not self.pool:
+                self._close_pool(pool)
+
+        for index in simulated:
+            if tasks[index].record:
+                outcome = outcomes[index]
+                runs[keys[index]] = _CachedRun(snapshots=outcome.recording,
+                                               state=outcome.checkpoint.state_string(),
+                                               report=outcome.report,
+                                               stop_reason=outcome.stop_reason)
+                self.cache.store(keys[index], runs[keys[index]])
+
+        results = []
+        for index, task in enumerate(tasks):
+            outcome = outcomes[index] or _replay_cluster(task, runs[keys[index]])
+            results.append(outcome.result)
+            self.checkpoints[index] = outcome.checkpoint
+            self.reports[index] = outcome.report
+            self.stop_reasons[index] = outcome.stop_reason
+            self.counters[index] = outcome.counters
+
+        self.schedule_report = ScheduleReport(workers=self.workers,
+                                              costs=tuple(costs),
+                                              durations=tuple(durations),
+                                              chunks=tuple(tuple(chunk) for chunk in chunks),
+                                              makespan=time_module.perf_counter() - start)
+        logger.info(f'Simulated {len(tasks)} clusters in {self.schedule_report.makespan:.3f} s '
+                    f'({self.schedule_report.efficiency:.0%} of the ideal makespan)')
+
+        return results + ensemble_results
+
+    def iter_evolve(self, time: float, *, queue_size: int = 1024):
+        """Evolve the simulation until t = time, yielding the snapshots of each cluster as they are produced.
+
+        Yields a :class:`SnapshotEvent` for each output of each cluster, and a :class:`ClusterFinished` with the result of
+        the output handler when a cluster finishes. Events of different clusters are interleaved in the order they are
+        produced. Output handlers still receive every step, so clusters can be streamed with no output handler at all.
+
+        Args:
+            time: The time to evolve the clusters to.
+            queue_size: The maximum number of events waiting to be consumed. Workers wait when the queue is full, so
+                memory use stays bounded if the consumer is slower than the simulations.
+        """
+        if self.ensembles:
+            raise ValueError('Ensembles are only simulated by evolve.')
+
+        tasks = list(enumerate(self._tasks(time)))
+        remaining = len(tasks)
+
+        if self.backend == 'threads':
+            events = queue.Queue(maxsize=queue_size)
+            stopped = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            futures = [executor.submit(_stream_cluster, index, task, False, events, stopped) for index, task in tasks]
+            try:
+                yield from _consume_events(events, remaining)
+            finally:
+                # If the consumer stopped early, cancel the simulations and unblock the workers waiting on the full queue
+                stopped.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                while not all(future.done() for future in futures):
+                    try:
+                        events.get(timeout=0.05)
+                    except queue.Empty:
+                        pass
+        else:
+            events = mp.Queue(maxsize=queue_size)
+            with mp.Pool(processes=self.workers, initializer=_init_event_queue, initargs=(events,)) as pool:
+                # Errors are put in the queue by the tasks; this only catches tasks that could not be started
+                pool.starmap_async(_stream_cluster, [(index, task, self.shared_memory) for index, task in tasks],
+                                   error_callback=lambda error: events.put(_ClusterFailed(index=-1, error=error)))
+                yield from _consume_events(events, remaining)
+
+    async def evolve_async(self, time: float, *, max_concurrency: int | None = None) -> list:
+        """Evolve the simulation until t = time without blocking the event loop.
+
+        Same as :meth:`evolve`, but the simulations run in an executor (a thread pool or a process pool, depending on
+        the backend) while the event loop keeps running. Cancelling the call stops every simulation at its next output.
+
+        Args:
+            time: The time to evolve the clusters to.
+            max_concurrency: The maximum number of clusters simulated at the same time. Defaults to the number of
+                workers.
+
+        Returns:
+            A list of results for each star cluster, as returned by :meth:`evolve`.
+        """
+        results = [None] * len(self.clusters)
+        async for event in self.iter_evolve_async(time, max_concurrency=max_concurrency):
+            results[event.index] = event.result
+            self.reports[event.index] = event.report
+            self.stop_reasons[event.index] = event.stop_reason
+            self.counters[event.index] = event.counters
         return results
-    
-    def _simulate_cluster(self, cluster: Cluster, time: float, output_handler: BaseOutput | None):
-        logger.info(f'Started simulating cluster "{cluster.name}"')
-        @ctypes.CFUNCTYPE(None, ctypes.c_char_p)
-        def callback(line: bytes):
-            line = line.decode()
-
-            if output_handler:
+
+    async def iter_evolve_async(self, time: float, *, max_concurrency: int | None = None):
+        """Evolve the simulation until t = time without blocking the event loop, yielding clusters as they finish.
+
+        Yields a :class:`ClusterFinished` for each cluster, in the order the clusters finish. Cancelling the iteration or
+        closing the iterator (for example with :func:`contextlib.aclosing`) stops the remaining simulations at their
+        next output.
+
+        Args:
+            time: The time to evolve the clusters to.
+            max_concurrency: The maximum number of clusters simulated at the same time. Defaults to the number of
+                workers.
+        """
+        import asyncio  # Only needed by the async API, and slow to import
+
+        if self.ensembles:
+            raise ValueError('Ensembles are only simulated by evolve.')
+
+        tasks = self._tasks(time)
+        loop = asyncio.get_running_loop()
+
+        if self.backend == 'threads':
+            cancel_flags = bytearray(len(tasks))
+            executor = ThreadPoolExecutor(max_workers=max_concurrency or self.workers)
+        else:
+            cancel_flags = mp.RawArray(ctypes.c_bool, len(tasks))
+            executor = ProcessPoolExecutor(max_workers=max_concurrency or self.workers,
+                                           initializer=_init_cancel_flags, initargs=(cancel_flags,))
+
+        async def simulate(index: int, task: _Task) -> ClusterFinished:
+            # Worker processes find the flags in a global, as shared arrays cannot be pickled with the task
+            flags = cancel_flags if self.backend == 'threads' else None
+            shared_memory = self.shared_memory and self.backend == 'processes'
+            outcome = await loop.run_in_executor(executor, functools.partial(_simulate_cancellable_cluster, index, task, flags, shared_memory))
+            if isinstance(outcome.result, SharedResult):
+                outcome.result = attach(outcome.result)
+            return _finished_event(index, task, outcome)
+
+        futures = [asyncio.ensure_future(simulate(index, task)) for index, task in enumerate(tasks)]
+        try:
+            for future in asyncio.as_completed(futures):
+                yield await future
+        finally:
+            for index in range(len(tasks)):
+                cancel_flags[index] = 1
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _tasks(self, time: float, resume: bool = False) -> list[_Task]:
+        tasks = []
+        for index, cluster in enumerate(self.clusters):
+            output_handler = self.output_handlers[index]
+            if self.backend == 'threads':
+                # Workers get their own output handlers, like the pickled copies used by the processes backend
+                output_handler = copy.deepcopy(output_handler)
+
+            start = self.starts[index]
+            if resume and self.checkpoints[index] is not None:
+                start = self.checkpoints[index]
+
+            task = _Task(cluster=cluster,
+                         time=time,
+                         time_step=self.time_step,
+                         output_handler=output_handler,
+                         precision=self.precisions[index] or self.precision,
+                         start=start,
+                         checkpoint_path=self._checkpoint_path(cluster),
+                         checkpoint_interval=self.checkpoint_interval,
+                         output_policy=self.output_policies[index] or self.output_policy,
+                         reports=self.compute_reports,
+                         stopping_conditions=self.stopping_conditions,
+                         force_threads=self.force_threads,
+                         trace=self.trace)
+
+            if task.start_time >= time:
+                raise ValueError(f'Cluster "{cluster.name}" is already at t = {task.start_time}, which is not before t = {time}.')
+
+            tasks.append(task)
+
+        return tasks
+
+    def _cached_runs(self, tasks: list[_Task]) -> tuple[list, dict, list[int]]:
+        """Looks the tasks up in the cache, if there is one.
+
+        Returns the cache key of each task (None if it is not cached), the runs found in the cache by key and the
+        indices of the tasks to simulate. Those are the tasks that were not found, except for duplicates of another
+        task, which are replayed from its run once it is recorded.
+        """
+        if self.cache is None:
+            return [None] * len(tasks), {}, list(range(len(tasks)))
+
+        keys = [cache_key(task, library_build()) for task in tasks]
+        runs = {}
+        simulated = []
+        for index, key in enumerate(keys):
+            if key is None:
+                simulated.append(index)
+            elif key not in runs:
+                runs[key] = self.cache.load(key)
+                if runs[key] is None:
+                    tasks[index].record = True
+                    simulated.append(index)
+
+        replayed = len(tasks) - len(simulated)
+        if replayed:
+            logger.info(f'Replaying {replayed} of {len(tasks)} clusters from the cache')
+        return keys, runs, simulated
+
+    def _ensemble_batches(self, time: float) -> list[_EnsembleBatch]:
+        if self.ensembles and time <= 0:
+            raise ValueError(f'Ensembles start at t = 0, which is not before t = {time}.')
+
+        batches = []
+        for index, ensemble in enumerate(self.ensembles):
+            for systems in ensemble.batches(self.workers, CHUNKS_PER_WORKER):
+                batches.append(_EnsembleBatch(ensemble=index,
+                                              name=ensemble.name,
+                                              start=systems.start,
+                                              identifiers=ensemble.identifiers,
+                                              masses=ensemble.masses[systems],
+                                              positions=ensemble.positions[systems],
+                                              velocities=ensemble.velocities[systems],
+                                              time=time,
+                                              time_step=self.time_step,
+                                              precision=ensemble.precision or self.precision,
+                                              output_policy=ensemble.output_policy,
+                                              stopping_conditions=self.stopping_conditions,
+                                              force_threads=self.force_threads))
+        return batches
+
+    def _checkpoint_path(self, cluster: Cluster) -> str | None:
+        if self.checkpoint_dir is None:
+            return None
+        return os.path.join(self.checkpoint_dir, f'{cluster.name}.checkpoint.json')
+
+
+# The functions below run in the workers. They are module-level functions so the integrator is not pickled with every
+# task sent to a worker process.
+
+def _consume_events(events, remaining: int):
+    while remaining:
+        event = events.get()
+
+        if isinstance(event, _ClusterFailed):
+            raise event.error
+
+        if isinstance(event, ClusterFinished) and isinstance(event.result, SharedResult):
+            event = dataclasses.replace(event, result=attach(event.result))
+
+        if isinstance(event, ClusterFinished):
+            remaining -= 1
+
+        yield event
+
+
+def _simulate_chunk(chunk: list, shared_memory: bool) -> list:
+    """Simulates the (index, task) pairs of a chunk, returning (index, outcome, duration) tuples."""
+    results = []
+    for index, task in chunk:
+        start = time_module.perf_counter()
+        outcome = _simulate_cluster(task)
+        if shared_memory:
+            outcome.result = share(outcome.result)
+        results.append((index, outcome, time_module.perf_counter() - start))
+
+    return results
+
+
+def _stream_cluster(index: int, task: _Task, shared_memory: bool, events=None, stopped=None):
+    if events is None:
+        events = _event_queue
+
+    def observer(snapshot: Snapshot):
+        if stopped is None or not stopped.is_set():
+            events.put(SnapshotEvent(index=index, cluster=task.cluster.name, snapshot=snapshot.copy()))
+
+    try:
+        outcome = _simulate_cluster(task, observer=observer, cancelled=stopped.is_set if stopped is not None else None)
+        if shared_memory:
+            outcome.result = share(outcome.result)
+        events.put(_finished_event(index, task, outcome))
+    except SimulationCancelled:
+        pass
+    except Exception as error:
+        events.put(_ClusterFailed(index=index, error=error))
+
+
+def _simulate_cancellable_cluster(index: int, task: _Task, cancel_flags, shared_memory: bool):
+    if cancel_flags is None:
+        cancel_flags = _cancel_flags
+
+    outcome = _simulate_cluster(task, cancelled=lambda: bool(cancel_flags[index]))
+    if shared_memory:
+        outcome.result = share(outcome.result)
+    return outcome
+
+
+def _finished_event(index: int, task: _Task, outcome: _Outcome) -> ClusterFinished:
+    return ClusterFinished(index=index,
+                           cluster=task.cluster.name,
+                           result=outcome.result,
+                           report=outcome.report,
+                           stop_reason=outcome.stop_reason,
+                           counters=outcome.counters)
+
+
+def _simulate_ensemble_batch(batch: _EnsembleBatch) -> _BatchOutcome:
+    """Simulates the systems of a batch of an ensemble with a single call to the library.
+
+    Without snapshots, the library does not call back into Python at all, so the cost of a system is its integration.
+    """
+    interface = get_interface()
+    system_count, star_count = batch.masses.shape
+    policy = batch.output_policy or _FINAL_STATE_POLICY
+    output_count = len(policy.stars) if policy.stars is not None else star_count
+    buffer = np.zeros(Snapshot.size(output_count))
+
+    # The library overwrites the initial states with the states reached
+    outcome = _BatchOutcome(ensemble=batch.ensemble,
+                            start=batch.start,
+                            time=np.empty(system_count),
+                            masses=batch.masses.copy(),
+                            positions=batch.positions.copy(),
+                            velocities=batch.velocities.copy(),
+                            stop_reasons=np.empty(system_count, dtype=np.intc),
+                            snapshots=None)
+
+    callback = None
+    if batch.output_policy is not None:
+        # Outputs after a system stopped early are left as NaN
+        outcome.snapshots = np.full((system_count, policy.snapshot_count(0, batch.time, batch.time_step), len(buffer)),
+                                    np.nan)
+        rows = np.zeros(system_count, dtype=np.int64)  # Outputs written for each system
+
+        def receive(system: int) -> int:
+            if rows[system] < outcome.snapshots.shape[1]:
+                outcome.snapshots[system, rows[system]] = buffer
+            rows[system] += 1
+            return 0
+
+        callback = interface.ensemble_callback_t(receive)
+
+    handle = interface.init_cluster()
+    try:
+        interface.add_stars(handle, batch.identifiers, batch.masses[0], batch.positions[0], batch.velocities[0])
+        interface.set_precision(handle, batch.precision)
+        interface.set_output_policy(handle, policy)
+        interface.set_stopping_conditions(handle, batch.stopping_conditions)
+        interface.set_force_threads(handle, batch.force_threads)
+        status, failed = interface.evolve_ensemble(handle, batch.time, batch.time_step, outcome.masses,
+                                                   outcome.positions, outcome.velocities, outcome.time,
+                                                   outcome.stop_reasons, buffer, callback)
+    finally:
+        interface.cleanup(handle)
+
+    if status == STATUS_NOT_CONVERGED:
+        raise RuntimeError(f'The Bulirsch-Stoer integrator did not converge while simulating system '
+                           f'{batch.start + failed} of ensemble "{batch.name}". Try a larger tolerance or word length.')
+
+    logger.info(f'Simulated systems {batch.start} to {batch.start + system_count - 1} of ensemble "{batch.name}"')
+    return outcome
+
+
+def _replay_cluster(task: _Task, run: _CachedRun) -> _Outcome:
+    """Rebuilds the outcome of a cluster from a cached run with the same stars and settings, feeding the snapshots of
+    the run to a copy of its output handler as if it was simulated."""
+    cluster, output_handler = task.cluster, copy.deepcopy(task.output_handler)
+    if output_handler:
+        output_handler.prepare(task.time, task.time_step, task.precision)
+        if not task.output_policy.is_default:
+            count = task.output_policy.snapshot_count(task.start_time, task.time, task.time_step)
+            output_handler.apply_output_policy(task.output_policy, count)
+        for buffer in run.snapshots:
+            output_handler.receive_snapshot(Snapshot(buffer))
+
+    checkpoint = Checkpoint.from_state_string(cluster, run.state, task.precision, task.time_step)
+    if task.checkpoint_path is not None:
+        checkpoint.save(task.checkpoint_path)
+
+    if output_handler:
+        output_handler.finalize()
+
+    logger.info(f'Replayed cluster "{cluster.name}" from the cache')
+    return _Outcome(result=output_handler.result() if output_handler else None,
+                    checkpoint=checkpoint,
+                    report=run.report,
+                    stop_reason=run.stop_reason,
+                    counters=None)
+
+
+def _simulate_cluster(task: _Task, observer=None, cancelled=None) -> _Outcome:
+    """Simulates a single cluster and returns the result of its output handler, the checkpoint it reached, its report
+    (None if reports are not computed) and the reason it ended.
+
+    Args:
+        observer: Called with each snapshot, before the output handler.
+        cancelled: Called after each output. If it returns True, the simulation stops and SimulationCancelled is raised.
+    """
+    cluster, output_handler = task.cluster, task.output_handler
+    logger.info(f'Started simulating cluster "{cluster.name}"')
+    interface = get_interface()
+    handle = interface.init_cluster()
+    errors = []
+    recording = [] if task.record else None
+
+    def receive(snapshot: Snapshot | None, line: str | None = None) -> int:
+        # Exceptions cannot propagate through the library, so they stop the simulation and are raised afterwards
+        try:
+            if observer:
+                observer(snapshot if snapshot is not None else Snapshot.from_line(line))
+            if output_handler and line is not None:
                 output_handler.receive_output_line(line)
-            
-        interface = BrutusInterface()
-        interface.init_cluster()
+            elif output_handler:
+                output_handler.receive_snapshot(snapshot)
+        except BaseException as error:
+            errors.append(error)
+
+        return int(bool(errors) or (cancelled is not None and cancelled()))
 
-        for star in cluster.stars:
-            interface.add_star(star.identifier, star.mass, star.position, star.velocity)
+    def save_checkpoint(state: bytes):
+        try:
+            Checkpoint.from_state_string(cluster, state.decode(), task.precision, task.time_step).save(task.checkpoint_path)
+        except BaseException as error:
+            errors.append(error)
 
-        interface.evolve(time, self.time_step, callback)
+    try:
+        interface.add_stars(handle, *cluster.to_arrays())
 
-        interface.cleanup()
+        interface.set_precision(handle, task.precision)
+        interface.set_output_policy(handle, task.output_policy)
+        interface.set_reductions(handle, task.reports)
+        interface.set_stopping_conditions(handle, task.stopping_conditions)
+        interface.set_force_threads(handle, task.force_threads)
+        interface.set_trace(handle, task.trace)
+
+        if task.start is not None:
+            interface.set_state(handle, task.start.state_string())
+
+        if task.checkpoint_path is not None and task.checkpoint_interval is not None:
+            checkpoint_callback = interface.checkpoint_callback_t(save_checkpoint)
+            interface.set_checkpoints(handle, task.checkpoint_interval, checkpoint_callback)
 
         if output_handler:
-            output_handler.finalize()
+            output_handler.prepare(task.time, task.time_step, task.precision)
+            if not task.output_policy.is_default:
+                count = task.output_policy.snapshot_count(task.start_time, task.time, task.time_step)
+                output_handler.apply_output_policy(task.output_policy, count)
+
+        if output_handler is None or task.record or _receives_snapshots(output_handler):
+            star_count = len(task.output_policy.stars) if task.output_policy.stars is not None else len(cluster.stars)
+            buffer = np.zeros(Snapshot.size(star_count))
+            snapshot = Snapshot(buffer)
+
+            def receive_snapshot() -> int:
+                if recording is not None:
+                    recording.append(buffer.copy())
+                return receive(snapshot)
+
+            callback = interface.snapshot_callback_t(receive_snapshot)
+            status = interface.evolve_snapshots(handle, task.time, task.time_step, buffer, callback)
+        else:
+            # Handlers that only implement the text protocol get their lines formatted by the library
+            callback = interface.line_callback_t(lambda line: receive(None, line.decode()))
+            status = interface.evolve(handle, task.time, task.time_step, callback)
+
+        state = interface.get_state(handle)
+        report = interface.get_reductions(handle)
+        stop_reason = interface.get_stop_reason(handle)
+        counters = interface.get_counters(handle)
+    finally:
+        interface.cleanup(handle)
+
+    if errors:
+        raise errors[0]
+
+    if status == STATUS_NOT_CONVERGED:
+        raise RuntimeError(f'The Bulirsch-Stoer integrator did not converge while simulating cluster "{cluster.name}". '
+                           f'Try a larger tolerance or word length.')
+
+    if status == STATUS_ABORTED:
+        logger.info(f'Cancelled simulating cluster "{cluster.name}"')
+        raise SimulationCancelled(f'The simulation of cluster "{cluster.name}" was cancelled.')
+
+    checkpoint = Checkpoint.from_state_string(cluster, state, task.precision, task.time_step)
+    if task.checkpoint_path is not None:
+        checkpoint.save(task.checkpoint_path)
+
+    if output_handler:
+        output_handler.finalize()
 
-        result = output_handler.result() if output_handler else None
+    result = output_handler.result() if output_handler else None
+    if stop_reason != StopReason.COMPLETED:
+        logger.info(f'Stopped simulating cluster "{cluster.name}" at t = {checkpoint.time} ({stop_reason.name})')
+    else:
         logger.info(f'Finished simulating cluster "{cluster.name}"')
-        return result
+    if recording is not None:
+        recording = np.array(recording).reshape(len(recording), Snapshot.size(star_count))
+    return _Outcome(result=result, checkpoint=checkpoint, report=report, stop_reason=stop_reason, counters=counters,
+                    recording=recording)
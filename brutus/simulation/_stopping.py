@@ -0,0 +1,36 @@
+from dataclasses import dataclass
+from enum import IntEnum
+
+
+class StopReason(IntEnum):
+    """Why a simulation ended. The values are the codes returned by the Brutus library (see main.cpp)."""
+    COMPLETED = 0  # The end time was reached
+    ESCAPE = 1
+    ENCOUNTER = 2
+    ENERGY_ERROR = 3
+    WALL_TIME = 4
+
+
+@dataclass(frozen=True)
+class StoppingConditions:
+    """A class to represent the conditions that end a simulation before its end time.
+
+    Brutus checks them after every integrator step, so a simulation stops as soon as one is met. Its last state is
+    then output, and the reason is recorded as a :class:`StopReason`. Conditions that are None are not checked:
+    - escape_radius: A star is further than this from the centre of mass, with a positive energy relative to it.
+    - encounter_distance: Two stars are closer than this.
+    - max_energy_error: The relative energy error |E(t) - E0| / |E0| since the start of the evolve call is larger than
+      this.
+    - wall_time: The simulation of the cluster took more than this many seconds.
+    """
+    escape_radius: float | None = None
+    encounter_distance: float | None = None
+    max_energy_error: float | None = None
+    wall_time: float | None = None
+
+    def __post_init__(self):
+        """Validate the input parameters."""
+        for name in ('escape_radius', 'encounter_distance', 'max_energy_error', 'wall_time'):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"{name.replace('_', ' ').capitalize()} must be positive.")
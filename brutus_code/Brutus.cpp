@@ -1,9 +1,21 @@
 #include "Brutus.h"
 
+#include <chrono>
+
+void EngineCounters::add(const StepRecord &step, bool accepted) {
+  rejections += step.rejections;
+  force_evaluations += step.force_evaluations;
+  integration_time += step.duration;
+  if(accepted) {
+    steps++;
+    depth_sum += step.depth;
+    if(step.depth > max_depth) max_depth = step.depth;
+  }
+}
+
 Brutus::Brutus() {
   t = "0";
-  data.clear();
-  N = 0;  
+  N = 0;
 
   tolerance = "1e-6";
   numBits = 56;
@@ -14,8 +26,8 @@ Brutus::Brutus() {
 }
 Brutus::Brutus(std::vector<mpreal> &data) {
   t = "0";
-  this->data = data;
-  N = data.size()/7;  
+  cl = Cluster(data);
+  N = cl.size();
 
   tolerance = "1e-6";
   numBits = 56;
@@ -26,8 +38,8 @@ Brutus::Brutus(std::vector<mpreal> &data) {
 }
 Brutus::Brutus(mpreal &t, std::vector<mpreal> &data, mpreal &tolerance) {
   this->t = t;
-  this->data = data;
-  N = data.size()/7;  
+  cl = Cluster(data);
+  N = cl.size();
 
   this->tolerance = tolerance;
   numBits = get_numBits(tolerance);
@@ -38,8 +50,8 @@ Brutus::Brutus(mpreal &t, std::vector<mpreal> &data, mpreal &tolerance) {
 }
 Brutus::Brutus(mpreal &t, std::vector<mpreal> &data, mpreal &tolerance, int &numBits) {
   this->t = t;
-  this->data = data;
-  N = data.size()/7;  
+  cl = Cluster(data);
+  N = cl.size();
 
   this->tolerance = tolerance;
   this->numBits = numBits;
@@ -50,11 +62,18 @@ Brutus::Brutus(mpreal &t, std::vector<mpreal> &data, mpreal &tolerance, int &num
 }
 
 void Brutus::set_data(std::vector<mpreal> &data) {
-  this->data = data;
-  N = data.size()/7; 
-
   Cluster c(data);
+  set_cluster(c);
+}
+void Brutus::set_arrays(int N, const double *m, const double *r, const double *v) {
+  Cluster c(N, m, r, v);
+  set_cluster(c);
+}
+void Brutus::set_cluster(Cluster &c) {
+  c.eps2 = cl.eps2;
+  c.threads = cl.threads;
   cl = c;
+  N = cl.size();
 }
 void Brutus::set_eta(mpreal &eta) {
   this->eta = eta;
@@ -69,6 +88,9 @@ void Brutus::set_numBits(int &numBits) {
 void Brutus::set_t_begin(mpreal &t_begin) {
   this->t = t_begin;
 }
+void Brutus::set_force_threads(int threads) {
+  cl.threads = threads;
+}
 
 mpreal Brutus::get_eta(mpreal tolerance) {
   mpreal a = "0", b = "0";
@@ -122,9 +144,7 @@ mpreal Brutus::fit_slope(std::vector<mpreal> &x, std::vector<mpreal> &y) {
 }
 
 void Brutus::setup() {
-  Cluster c(data);
-  c.eps2 = "0";
-  cl = c;
+  cl.eps2 = "0";
 
   Bulirsch_Stoer b(tolerance);
   bs = b;
@@ -132,8 +152,10 @@ void Brutus::setup() {
   eta = get_eta(tolerance);  
 }
 
-void Brutus::evolve(mpreal t_end) {
+bool Brutus::evolve(mpreal t_end, const std::function<bool()> &on_step) {
   while (t<t_end) {
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+
     cl.calcAcceleration_dt();
     dt = eta*cl.dt;
 
@@ -141,42 +163,65 @@ void Brutus::evolve(mpreal t_end) {
 
     bool converged = bs.integrate(cl, dt);
 
+    std::chrono::duration<double> duration = std::chrono::steady_clock::now() - start;
+    last_step.time_step = dt.toDouble();
+    last_step.depth = bs.get_depth();
+    last_step.rejections = bs.get_rejections();
+    last_step.force_evaluations = bs.get_force_evaluations() + 1;
+    last_step.duration = duration.count();
+    counters.add(last_step, converged);
+
     if(!converged) {
       std::cerr << "Not converged at " << t << "!" << std::endl;
-      exit(1);
+      return false;
     }
 
     t += dt;
+
+    // Stopping early is not an error: the state reached is kept
+    if(on_step && !on_step()) break;
   }
-  this->data = cl.get_data();
+  return true;
 }
   
 mpreal Brutus::get_t() {
   return t;
 }
+Cluster &Brutus::get_cluster() {
+  return cl;
+}
 std::vector<mpreal> Brutus::get_data() {
-  return data;
+  return cl.get_data();
 }
 std::vector<double> Brutus::get_data_double() {
-  int N = data.size()/7;
-  std::vector<double> v(7*N, 0);
-  for(int i=0; i<N; i++) {
-    for(int j=0; j<7; j++) {
-      v[i*7+j] = data[i*7+j].toDouble();
-    }
-  }
-  return v;
+  return cl.get_data_double();
+}
+void Brutus::get_arrays(double *m, double *r, double *v) {
+  cl.get_arrays(m, r, v);
 }
 std::vector<std::string> Brutus::get_data_string() {
-  int N = data.size()/7;
+  int N = cl.size();
   std::vector<std::string> v(7*N, "0");
   for(int i=0; i<N; i++) {
-    for(int j=0; j<7; j++) {
-      v[i*7+j] = data[i*7+j].toString();
+    v[i*7] = to_exact_string(cl.m[i]);
+    for(int k=0; k<3; k++) {
+      v[i*7+1+k] = to_exact_string(cl.r[3*i+k]);
+      v[i*7+4+k] = to_exact_string(cl.v[3*i+k]);
     }
   }
   return v;
 }
+const StepRecord &Brutus::get_last_step() {
+  return last_step;
+}
+const EngineCounters &Brutus::get_counters() {
+  return counters;
+}
+std::string Brutus::to_exact_string(const mpreal &x) {
+  // Enough significant digits to read back the same binary value
+  int digits = 1 + (int)std::ceil(x.get_prec() * std::log10(2.0));
+  return x.toString(digits);
+}
 
 
 
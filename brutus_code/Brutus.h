@@ -2,13 +2,35 @@
 #include "Cluster.h"
 #include "Bulirsch_Stoer.h"
 
+#include <functional>
+
 #ifndef __Brutus_h
 #define __Brutus_h
 
+// What a step of evolve() did, accepted or not
+struct StepRecord {
+  double time_step = 0;        // Time step taken, after the retries
+  int depth = 0;               // Substeps n of the last extrapolation level
+  int rejections = 0;          // Times the step was retried with a smaller time step
+  long force_evaluations = 0;  // Including the one that sets the time step
+  double duration = 0;         // Wall time, in seconds
+};
+
+// Work done by evolve() since the Brutus object was created
+struct EngineCounters {
+  long steps = 0;              // Accepted steps
+  long rejections = 0;
+  long force_evaluations = 0;
+  long depth_sum = 0;          // Sum of the depths of the accepted steps
+  int max_depth = 0;
+  double integration_time = 0;  // Wall time of the steps, in seconds
+
+  void add(const StepRecord &step, bool accepted);
+};
+
 class Brutus {
   mpreal t;
-  int N;  
-  std::vector<mpreal> data;
+  int N;
 
   mpreal tolerance;
   int numBits;
@@ -18,6 +40,9 @@ class Brutus {
   Cluster cl;
   Bulirsch_Stoer bs;
 
+  StepRecord last_step;
+  EngineCounters counters;
+
   public:
 
   Brutus();
@@ -26,24 +51,33 @@ class Brutus {
   Brutus(mpreal &t, std::vector<mpreal> &data, mpreal &tolerance, int &numBits);
 
   void set_data(std::vector<mpreal> &data);
+  void set_arrays(int N, const double *m, const double *r, const double *v);
+  void set_cluster(Cluster &cl);
   void set_eta(mpreal &eta);
   void set_tolerance(mpreal &tolerance);
   void set_numBits(int &numBits);
   void set_t_begin(mpreal &t_begin);
+  void set_force_threads(int threads);
 
   mpreal get_eta(mpreal tolerance);
   mpreal get_tolerance();
   int get_numBits();
-  int get_numBits(mpreal tolerance);
+  static int get_numBits(mpreal tolerance);
   mpreal fit_slope(std::vector<mpreal> &x, std::vector<mpreal> &y);
 
   void setup();
-  void evolve(mpreal t_end);
+  bool evolve(mpreal t_end, const std::function<bool()> &on_step = std::function<bool()>());
   
   mpreal get_t();
+  Cluster &get_cluster();
   std::vector<mpreal> get_data();
   std::vector<double> get_data_double();
+  void get_arrays(double *m, double *r, double *v);
   std::vector<std::string> get_data_string();
+  static std::string to_exact_string(const mpreal &x);
+
+  const StepRecord &get_last_step();
+  const EngineCounters &get_counters();
 };
 
 #endif
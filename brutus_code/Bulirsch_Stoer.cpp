@@ -1,19 +1,25 @@
 #include "Bulirsch_Stoer.h"
 
+// The arrays of the cluster state that the integrator extrapolates and compares: positions and velocities
+static std::vector<mpreal> Cluster::* const extrapolated[] = {&Cluster::r, &Cluster::v};
+
 Bulirsch_Stoer::Bulirsch_Stoer() {
   tolerance = "1e-6";
   n_max = 32;
   k_max = 128;
+  zero = "0";
 }
 Bulirsch_Stoer::Bulirsch_Stoer(mpreal tolerance) {
   this->tolerance = tolerance;
   n_max = 32;
   k_max = 128;
+  zero = "0";
 }
 Bulirsch_Stoer::Bulirsch_Stoer(mpreal tolerance, int n_max, int k_max) {
   this->tolerance = tolerance;
   this->n_max = n_max;
   this->k_max = k_max;
+  zero = "0";
 }
 
 void Bulirsch_Stoer::set_tolerance(mpreal tolerance) {
@@ -36,25 +42,38 @@ int Bulirsch_Stoer::get_k_max() {
   return k_max;
 }
 
+int Bulirsch_Stoer::get_rejections() {
+  return rejections;
+}
+int Bulirsch_Stoer::get_depth() {
+  return depth;
+}
+long Bulirsch_Stoer::get_force_evaluations() {
+  return force_evaluations;
+}
+
 bool Bulirsch_Stoer::integrate(Cluster &cl, mpreal &dt) {
-  Cluster c0 = cl;
-  Cluster c  = cl;	
-  mpreal timestep = dt;
+  start = cl;
+  trial = cl;
+  timestep = dt;
+  rejections = 0;
+  force_evaluations = 0;
 
-  bool flag = step(c, timestep);
+  bool flag = step(trial, timestep);
 
   if(flag == false) {
     int k = 2;
     while( flag == false && k <= k_max ) {
-      timestep = dt/k;
-      c = c0;
-      flag = step(c, timestep);
+      mpfr_div_si(timestep.mpfr_ptr(), dt.mpfr_srcptr(), k, MPFR_RNDN);
+      trial = start;
+      rejections++;
+      flag = step(trial, timestep);
       k += 2;
     }
   }  
 
   if(flag == true) {
-    cl = c;
+    cl = trial;
     dt = timestep;
   }
 
@@ -63,35 +82,44 @@ bool Bulirsch_Stoer::integrate(Cluster &cl, mpreal &dt) {
 bool Bulirsch_Stoer::step(Cluster &cl, mpreal &dt) {
   bool flag;
   int n;
-  std::vector<mpreal> h;
-  std::vector<Cluster> c;
-  Cluster cl_exp0 = cl;
-  Cluster cl_exp  = cl;
+  int M = 0;  // Number of extrapolation levels
+
+  // Integrates a copy of cl with n substeps of dt/n, as the next extrapolation level
+  auto add_level = [&](int n) {
+    if((int)levels.size() == M) {
+      levels.push_back(cl);
+      h.push_back(dt);
+    }
+    else {
+      levels[M] = cl;
+    }
+    mpfr_div_si(h[M].mpfr_ptr(), dt.mpfr_srcptr(), n, MPFR_RNDN);
+    for(int i=0; i<n; i++) levels[M].step( h[M] );
+    force_evaluations += n;
+    depth = n;
+    M++;
+  };
+
+  cl_exp = cl;
 
   // n=1
   n=1;
-  h.push_back( dt/n );
-  c.push_back( cl );
-  c[0].step( h[0] );
-  cl_exp0 = c[0];
+  add_level(n);
+  cl_exp0 = levels[0];
 
   // n=2
   n=2;
-  h.push_back( dt/n );
-  c.push_back( cl );
-  for(int i=0; i<n; i++) c[1].step( h[1] );
-  extrapol( cl_exp, h, c );
+  add_level(n);
+  extrapol( cl_exp, M );
   
   flag = error_control(cl_exp0, cl_exp);
 
   if(flag == false) {
     while(flag == false && n <= n_max) {
       n += 2;
-      h.push_back( dt/n );
-      c.push_back( cl );
-      for(int i=0; i<n; i++) c[n/2].step( h[n/2] );
+      add_level(n);
       cl_exp0 = cl_exp;
-      extrapol( cl_exp, h, c );   
+      extrapol( cl_exp, M );
 
       flag = error_control(cl_exp0, cl_exp);   
     }    
@@ -101,73 +129,47 @@ bool Bulirsch_Stoer::step(Cluster &cl, mpreal &dt) {
 
   return flag;
 }
-void Bulirsch_Stoer::extrapol(Cluster &cl_exp, std::vector<mpreal> &dt, std::vector<Cluster> &c) {
-  int M = dt.size();
-  int N = c[0].s.size();
-
-  std::vector<mpreal> x_sample(M), y_sample(M), z_sample(M), vx_sample(M), vy_sample(M), vz_sample(M);
-  for(int i=0; i<N; i++) {
-    for(int j=0; j<M; j++) {
-      x_sample[j]  = c[j].s[i].r[0];
-      y_sample[j]  = c[j].s[i].r[1];
-      z_sample[j]  = c[j].s[i].r[2];
-      vx_sample[j] = c[j].s[i].v[0];
-      vy_sample[j] = c[j].s[i].v[1];
-      vz_sample[j] = c[j].s[i].v[2];
+void Bulirsch_Stoer::extrapol(Cluster &cl_exp, int M) {
+  if((int)sample.size() < M) sample.resize(M, zero);
+
+  // Positions, then velocities
+  for(std::vector<mpreal> Cluster::*array : extrapolated) {
+    int n = (levels[0].*array).size();
+    for(int i=0; i<n; i++) {
+      for(int j=0; j<M; j++) {
+        mpfr_set(sample[j].mpfr_ptr(), (levels[j].*array)[i].mpfr_srcptr(), MPFR_RNDN);
+      }
+      extrapolate(h, sample, M, (cl_exp.*array)[i]);
     }
-    cl_exp.s[i].r[0]  = extrapolate(dt, x_sample, "0.0");
-    cl_exp.s[i].r[1]  = extrapolate(dt, y_sample, "0.0");
-    cl_exp.s[i].r[2]  = extrapolate(dt, z_sample, "0.0");
-    cl_exp.s[i].v[0] = extrapolate(dt, vx_sample, "0.0");
-    cl_exp.s[i].v[1] = extrapolate(dt, vy_sample, "0.0");
-    cl_exp.s[i].v[2] = extrapolate(dt, vz_sample, "0.0");
   }
 }
-mpreal Bulirsch_Stoer::extrapolate(std::vector<mpreal> x, std::vector<mpreal> y, mpreal x0) {
-  int N = x.size();
-  if(N == 1) {
-    return y[0];
-  }
-  else {
-    for(int i=1; i<N; i++) {
-      for(int j=0; j<N-i; j++) {
-	y[j] = ( (x0-x[j+i])*y[j] + (x[j]-x0)*y[j+1] ) / ( x[j]-x[j+i] );
-      }
+// Extrapolates the values y(x) of the first M samples to x = 0 (Neville's algorithm), overwriting y, into y0
+void Bulirsch_Stoer::extrapolate(std::vector<mpreal> &x, std::vector<mpreal> &y, int M, mpreal &y0) {
+  for(int i=1; i<M; i++) {
+    for(int j=0; j<M-i; j++) {
+      // y[j] = ( (x0-x[j+i])*y[j] + (x[j]-x0)*y[j+1] ) / ( x[j]-x[j+i] ), with x0 = 0
+      mpfr_sub(t1.mpfr_ptr(), zero.mpfr_srcptr(), x[j+i].mpfr_srcptr(), MPFR_RNDN);
+      mpfr_mul(t1.mpfr_ptr(), t1.mpfr_srcptr(), y[j].mpfr_srcptr(), MPFR_RNDN);
+      mpfr_sub(t2.mpfr_ptr(), x[j].mpfr_srcptr(), zero.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_mul(t2.mpfr_ptr(), t2.mpfr_srcptr(), y[j+1].mpfr_srcptr(), MPFR_RNDN);
+      mpfr_add(t1.mpfr_ptr(), t1.mpfr_srcptr(), t2.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_sub(t3.mpfr_ptr(), x[j].mpfr_srcptr(), x[j+i].mpfr_srcptr(), MPFR_RNDN);
+      mpfr_div(y[j].mpfr_ptr(), t1.mpfr_srcptr(), t3.mpfr_srcptr(), MPFR_RNDN);
     }
-    return y[0];
-  }  
+  }
+  mpfr_set(y0.mpfr_ptr(), y[0].mpfr_srcptr(), MPFR_RNDN);
 }
 bool Bulirsch_Stoer::error_control(Cluster &c1, Cluster &c2) {
-  int N = c1.s.size();
-  bool flag = true;
-  for(int i=0; i<N; i++) {
-    if( fabs(c2.s[i].r[0]-c1.s[i].r[0]) > tolerance ) {
-      flag = false;
-      break;
-    }
-    if( fabs(c2.s[i].r[1]-c1.s[i].r[1]) > tolerance ) {
-      flag = false;
-      break;
-    }
-    if( fabs(c2.s[i].r[2]-c1.s[i].r[2]) > tolerance ) {
-      flag = false;
-      break;
-    }
-    if( fabs(c2.s[i].v[0]-c1.s[i].v[0]) > tolerance ) {
-      flag = false;
-      break;
-    }
-    if( fabs(c2.s[i].v[1]-c1.s[i].v[1]) > tolerance ) {
-      flag = false;
-      break;
-    }
-    if( fabs(c2.s[i].v[2]-c1.s[i].v[2]) > tolerance ) {
-      flag = false;
-      break;
+  for(std::vector<mpreal> Cluster::*array : extrapolated) {
+    const std::vector<mpreal> &x1 = c1.*array, &x2 = c2.*array;
+    for(size_t i=0; i<x1.size(); i++) {
+      // fabs(x2-x1) > tolerance
+      mpfr_sub(t1.mpfr_ptr(), x2[i].mpfr_srcptr(), x1[i].mpfr_srcptr(), MPFR_RNDN);
+      if( mpfr_cmpabs(t1.mpfr_srcptr(), tolerance.mpfr_srcptr()) > 0 ) {
+        return false;
+      }
     }
   }
 
-  return flag;
+  return true;
 }
-
-
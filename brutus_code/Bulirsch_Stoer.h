@@ -8,6 +8,18 @@ class Bulirsch_Stoer {
   mpreal tolerance;
   int n_max, k_max;
 
+  // Workspace reused by every step. Clusters and numbers are assigned rather than created, so once it has grown to
+  // the largest number of extrapolation levels, integrating does not allocate.
+  Cluster start, trial, cl_exp0, cl_exp;
+  std::vector<Cluster> levels;
+  std::vector<mpreal> h, sample;
+  mpreal timestep, zero, t1, t2, t3;
+
+  // What the last call to integrate() did: the number of times the step was retried with a smaller time step, the
+  // number of substeps n of the last extrapolation level, and the number of force evaluations of the substeps
+  int rejections = 0, depth = 0;
+  long force_evaluations = 0;
+
   public:
 
   Bulirsch_Stoer();
@@ -22,10 +34,14 @@ class Bulirsch_Stoer {
   int get_n_max();
   int get_k_max();
 
+  int get_rejections();
+  int get_depth();
+  long get_force_evaluations();
+
   bool integrate(Cluster &cl, mpreal &dt);
   bool step(Cluster &cl, mpreal &dt);
-  void extrapol(Cluster &cl_exp, std::vector<mpreal> &dt, std::vector<Cluster> &c);
-  mpreal extrapolate(std::vector<mpreal> x, std::vector<mpreal> y, mpreal x0);
+  void extrapol(Cluster &cl_exp, int M);
+  void extrapolate(std::vector<mpreal> &x, std::vector<mpreal> &y, int M, mpreal &y0);
   bool error_control(Cluster &c1, Cluster &c2);
 };
 
@@ -1,182 +1,313 @@
 #include "Cluster.h"
 
+#include <algorithm>
+#include <atomic>
+#include <thread>
+
+// Number of partitions of the pair loop of the parallel force evaluation. It does not depend on the number of threads,
+// so the forces are always summed in the same order and the result is the same whatever the number of threads.
+#define FORCE_PARTITIONS 16
+
 Cluster::Cluster(std::vector<double> data) {
   int N = data.size()/7;
-  s.resize(N);
-  mpreal m;
-  std::vector<mpreal> r(3), v(3);
+  resize(N);
   for(int i=0; i<N; i++) {
-    m    = (mpreal)data[i*7+0];
-    r[0] = (mpreal)data[i*7+1];
-    r[1] = (mpreal)data[i*7+2];
-    r[2] = (mpreal)data[i*7+3];
-    v[0] = (mpreal)data[i*7+4];
-    v[1] = (mpreal)data[i*7+5];
-    v[2] = (mpreal)data[i*7+6];
-    s[i] = Star(m, r, v);
+    m[i] = (mpreal)data[i*7+0];
+    for(int k=0; k<3; k++) {
+      r[3*i+k] = (mpreal)data[i*7+1+k];
+      v[3*i+k] = (mpreal)data[i*7+4+k];
+    }
   }
   this->time = 0;
 }
 Cluster::Cluster(std::vector<mpreal> data) {
   int N = data.size()/7;
-  s.resize(N);
-  mpreal m;
-  std::vector<mpreal> r(3), v(3);
+  resize(N);
   for(int i=0; i<N; i++) {
-    m    = data[i*7+0];
-    r[0] = data[i*7+1];
-    r[1] = data[i*7+2];
-    r[2] = data[i*7+3];
-    v[0] = data[i*7+4];
-    v[1] = data[i*7+5];
-    v[2] = data[i*7+6];
-    s[i] = Star(m, r, v);
+    m[i] = data[i*7+0];
+    for(int k=0; k<3; k++) {
+      r[3*i+k] = data[i*7+1+k];
+      v[3*i+k] = data[i*7+4+k];
+    }
+  }
+  this->time = 0;
+}
+Cluster::Cluster(const std::vector<mpreal> &m, const std::vector<mpreal> &r, const std::vector<mpreal> &v) {
+  resize(m.size());
+  this->m = m;
+  this->r = r;
+  this->v = v;
+  this->time = 0;
+}
+Cluster::Cluster(int N, const double *m, const double *r, const double *v) {
+  resize(N);
+  for(int i=0; i<N; i++) {
+    this->m[i] = (mpreal)m[i];
+  }
+  for(int i=0; i<3*N; i++) {
+    this->r[i] = (mpreal)r[i];
+    this->v[i] = (mpreal)v[i];
   }
   this->time = 0;
 }
 
-void Cluster::calcAcceleration_dt() {
-  int N = s.size();
+void Cluster::resize(int N) {
+  m.assign(N, "0");
+  r.assign(3*N, "0");
+  v.assign(3*N, "0");
+  a.assign(3*N, "0");
+  a0.assign(3*N, "0");
+}
 
-  for(int i=0; i<N; i++) {
-    s[i].a.assign(3, "0");
+// Temporaries of the force and update loops. Each thread keeps its own and reuses them in every evaluation, so the
+// loops do not allocate: the operations below write their results into existing numbers instead of creating new ones.
+// They are reinitialized when the working precision changes.
+struct Workspace {
+  mpfr_prec_t precision = 0;
+  mpreal dx, dy, dz, RdotR, apre, fm, daix, daiy, daiz, a2i, mydti, tmp, tmp2;
+  mpreal dt_max, quarter;  // Constants: 1e100 and 0.25
+
+  void ensure(mpfr_prec_t p) {
+    if(p == precision) return;
+    precision = p;
+
+    mpreal *numbers[] = {&dx, &dy, &dz, &RdotR, &apre, &fm, &daix, &daiy, &daiz, &a2i, &mydti, &tmp, &tmp2, &dt_max, &quarter};
+    for(mpreal *x : numbers) mpfr_set_prec(x->mpfr_ptr(), p);
+
+    mpfr_set_str(dt_max.mpfr_ptr(), "1e100", 10, MPFR_RNDN);
+    mpfr_set_str(quarter.mpfr_ptr(), "0.25", 10, MPFR_RNDN);
+  }
+};
+
+static Workspace &workspace() {
+  static thread_local Workspace w;
+  w.ensure(mpreal::get_default_prec());
+  return w;
+}
+
+// Sets the accelerations (3 values per star) to 0, keeping their numbers
+static void reset_accelerations(std::vector<mpreal> &a) {
+  for(std::vector<mpreal>::iterator ai = a.begin(); ai != a.end(); ++ai) {
+    mpfr_set_zero(ai->mpfr_ptr(), 1);
   }
+}
+
+// Adds the force between the stars i and j, at positions ri and rj (3 values) and with masses mi and mj, to ai (3
+// values) and subtracts it from aj, and lowers dt_min to the time step criterion of the pair if it is not null. The
+// operations are the same, in the same order, as in the expressions a[i] += m_j/|r_ij|^3 * r_ij, so the results are
+// exactly the same.
+static void pair_force(const mpreal *ri, const mpreal *rj, const mpreal &mi, const mpreal &mj, const mpreal &eps2,
+                       mpreal *ai, mpreal *aj, mpreal *dt_min, Workspace &w) {
+  mpfr_sub(w.dx.mpfr_ptr(), rj[0].mpfr_srcptr(), ri[0].mpfr_srcptr(), MPFR_RNDN);
+  mpfr_sub(w.dy.mpfr_ptr(), rj[1].mpfr_srcptr(), ri[1].mpfr_srcptr(), MPFR_RNDN);
+  mpfr_sub(w.dz.mpfr_ptr(), rj[2].mpfr_srcptr(), ri[2].mpfr_srcptr(), MPFR_RNDN);
+
+  // RdotR = dx*dx + dy*dy + dz*dz + eps2
+  mpfr_mul(w.RdotR.mpfr_ptr(), w.dx.mpfr_srcptr(), w.dx.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_mul(w.tmp.mpfr_ptr(), w.dy.mpfr_srcptr(), w.dy.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_add(w.RdotR.mpfr_ptr(), w.RdotR.mpfr_srcptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_mul(w.tmp.mpfr_ptr(), w.dz.mpfr_srcptr(), w.dz.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_add(w.RdotR.mpfr_ptr(), w.RdotR.mpfr_srcptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_add(w.RdotR.mpfr_ptr(), w.RdotR.mpfr_srcptr(), eps2.mpfr_srcptr(), MPFR_RNDN);
 
-  dt = "1e100";
+  // apre = 1/sqrt(RdotR*RdotR*RdotR)
+  mpfr_mul(w.tmp.mpfr_ptr(), w.RdotR.mpfr_srcptr(), w.RdotR.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_mul(w.tmp.mpfr_ptr(), w.tmp.mpfr_srcptr(), w.RdotR.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_sqrt(w.tmp.mpfr_ptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+  mpfr_ui_div(w.apre.mpfr_ptr(), 1, w.tmp.mpfr_srcptr(), MPFR_RNDN);
 
-  mpreal dx = "0";
-  mpreal dy = "0";
-  mpreal dz = "0";
-  mpreal RdotR = "0";
-  mpreal apre = "0";
-  mpreal fm = "0";
-  mpreal daix = "0";
-  mpreal daiy = "0";
-  mpreal daiz = "0";
-  mpreal a2i = "0";
-  mpreal mydti = "0";
+  for(int side=0; side<2; side++) {
+    // First the force of star j on star i, then the force of star i on star j
+    const mpreal &m_other = side == 0 ? mj : mi;
+    mpreal *a = side == 0 ? ai : aj;
+
+    mpfr_mul(w.fm.mpfr_ptr(), m_other.mpfr_srcptr(), w.apre.mpfr_srcptr(), MPFR_RNDN);
+    mpfr_mul(w.daix.mpfr_ptr(), w.fm.mpfr_srcptr(), w.dx.mpfr_srcptr(), MPFR_RNDN);
+    mpfr_mul(w.daiy.mpfr_ptr(), w.fm.mpfr_srcptr(), w.dy.mpfr_srcptr(), MPFR_RNDN);
+    mpfr_mul(w.daiz.mpfr_ptr(), w.fm.mpfr_srcptr(), w.dz.mpfr_srcptr(), MPFR_RNDN);
+
+    if(side == 0) {
+      mpfr_add(a[0].mpfr_ptr(), a[0].mpfr_srcptr(), w.daix.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_add(a[1].mpfr_ptr(), a[1].mpfr_srcptr(), w.daiy.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_add(a[2].mpfr_ptr(), a[2].mpfr_srcptr(), w.daiz.mpfr_srcptr(), MPFR_RNDN);
+    }
+    else {
+      mpfr_sub(a[0].mpfr_ptr(), a[0].mpfr_srcptr(), w.daix.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_sub(a[1].mpfr_ptr(), a[1].mpfr_srcptr(), w.daiy.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_sub(a[2].mpfr_ptr(), a[2].mpfr_srcptr(), w.daiz.mpfr_srcptr(), MPFR_RNDN);
+    }
+
+    if(dt_min != nullptr) {
+      // mydti = RdotR/(daix*daix + daiy*daiy + daiz*daiz)
+      mpfr_mul(w.a2i.mpfr_ptr(), w.daix.mpfr_srcptr(), w.daix.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_mul(w.tmp.mpfr_ptr(), w.daiy.mpfr_srcptr(), w.daiy.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_add(w.a2i.mpfr_ptr(), w.a2i.mpfr_srcptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_mul(w.tmp.mpfr_ptr(), w.daiz.mpfr_srcptr(), w.daiz.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_add(w.a2i.mpfr_ptr(), w.a2i.mpfr_srcptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+      mpfr_div(w.mydti.mpfr_ptr(), w.RdotR.mpfr_srcptr(), w.a2i.mpfr_srcptr(), MPFR_RNDN);
+      if(mpfr_less_p(w.mydti.mpfr_srcptr(), dt_min->mpfr_srcptr())) mpfr_set(dt_min->mpfr_ptr(), w.mydti.mpfr_srcptr(), MPFR_RNDN);
+    }
+  }
+}
+
+void Cluster::calcAcceleration_dt() {
+  if(threads > 0) {
+    calcAccelerationParallel(true);
+    return;
+  }
+
+  int N = size();
+  Workspace &w = workspace();
+
+  reset_accelerations(a);
+  dt = w.dt_max;
 
   for(int i=0; i<N-1; i++) {
     for(int j=i+1; j<N; j++) {
-
-      dx = s[j].r[0]-s[i].r[0];
-      dy = s[j].r[1]-s[i].r[1];
-      dz = s[j].r[2]-s[i].r[2];
-      RdotR = dx*dx + dy*dy + dz*dz + eps2;
-      apre = "1"/sqrt(RdotR*RdotR*RdotR);      
-
-      fm = s[j].m*apre;
-      daix = fm*dx;
-      daiy = fm*dy;
-      daiz = fm*dz;
-
-      s[i].a[0] += daix;
-      s[i].a[1] += daiy;
-      s[i].a[2] += daiz;
-
-      a2i = daix*daix+daiy*daiy+daiz*daiz;
-      mydti = RdotR/a2i;
-      if(mydti < dt) dt = mydti;
-
-      fm = s[i].m*apre;
-      daix = fm*dx;
-      daiy = fm*dy;
-      daiz = fm*dz;
-      s[j].a[0] -= daix;
-      s[j].a[1] -= daiy;
-      s[j].a[2] -= daiz;
-
-      a2i = daix*daix+daiy*daiy+daiz*daiz;
-      mydti = RdotR/a2i;
-      if(mydti < dt) dt = mydti;
+      pair_force(&r[3*i], &r[3*j], m[i], m[j], eps2, &a[3*i], &a[3*j], &dt, w);
     }
   }
 
-  dt = pow(dt, "0.25");
+  mpfr_pow(dt.mpfr_ptr(), dt.mpfr_srcptr(), w.quarter.mpfr_srcptr(), MPFR_RNDN);
 }
 void Cluster::calcAcceleration() {
-  int N = s.size();
-
-  for(int i=0; i<N; i++) {
-    s[i].a.assign(3, "0");
+  if(threads > 0) {
+    calcAccelerationParallel(false);
+    return;
   }
 
-  mpreal dx = "0";
-  mpreal dy = "0";
-  mpreal dz = "0";
-  mpreal RdotR = "0";
-  mpreal apre = "0";
-  mpreal fm = "0";
-  mpreal daix = "0";
-  mpreal daiy = "0";
-  mpreal daiz = "0";
-  mpreal a2i = "0";
-  mpreal mydti = "0";
+  int N = size();
+  Workspace &w = workspace();
+
+  reset_accelerations(a);
 
   for(int i=0; i<N-1; i++) {
     for(int j=i+1; j<N; j++) {
-      dx = s[j].r[0]-s[i].r[0];
-      dy = s[j].r[1]-s[i].r[1];
-      dz = s[j].r[2]-s[i].r[2];
-      RdotR = dx*dx + dy*dy + dz*dz + eps2;
-      apre = "1"/sqrt(RdotR*RdotR*RdotR);      
-
-      fm = s[j].m*apre;
-      daix = fm*dx;
-      daiy = fm*dy;
-      daiz = fm*dz;
-      s[i].a[0] += daix;
-      s[i].a[1] += daiy;
-      s[i].a[2] += daiz;
-
-      fm = s[i].m*apre;
-      daix = fm*dx;
-      daiy = fm*dy;
-      daiz = fm*dz;
-      s[j].a[0] -= daix;
-      s[j].a[1] -= daiy;
-      s[j].a[2] -= daiz;
+      pair_force(&r[3*i], &r[3*j], m[i], m[j], eps2, &a[3*i], &a[3*j], nullptr, w);
     }
   }
 }
-  
-void Cluster::updatePositions(mpreal dt) {
-  int N = s.size();
-  for(int i=0; i<N; i++) {
-    s[i].a0 = s[i].a;
-    for(int k = 0; k != 3; ++k)
-      s[i].r[k] += dt*s[i].v[k] + "0.5"*dt*dt*s[i].a0[k];
+
+void Cluster::updatePositions(const mpreal &dt) {
+  int N = size();
+  Workspace &w = workspace();
+
+  // tmp2 = 0.5*dt*dt, the same for every star
+  mpfr_div_2ui(w.tmp2.mpfr_ptr(), dt.mpfr_srcptr(), 1, MPFR_RNDN);
+  mpfr_mul(w.tmp2.mpfr_ptr(), w.tmp2.mpfr_srcptr(), dt.mpfr_srcptr(), MPFR_RNDN);
+
+  a0 = a;
+  for(int i=0; i<3*N; i++) {
+    // r += dt*v + 0.5*dt*dt*a0
+    mpfr_mul(w.tmp.mpfr_ptr(), w.tmp2.mpfr_srcptr(), a0[i].mpfr_srcptr(), MPFR_RNDN);
+    mpfr_mul(w.fm.mpfr_ptr(), dt.mpfr_srcptr(), v[i].mpfr_srcptr(), MPFR_RNDN);
+    mpfr_add(w.fm.mpfr_ptr(), w.fm.mpfr_srcptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+    mpfr_add(r[i].mpfr_ptr(), r[i].mpfr_srcptr(), w.fm.mpfr_srcptr(), MPFR_RNDN);
   }
 }
+void Cluster::updateVelocities(const mpreal &dt) {
+  int N = size();
+  Workspace &w = workspace();
 
-void Cluster::updateVelocities(mpreal dt) {
-  int N = s.size();
-  for(int i=0; i<N; i++) {
-    for(int k = 0; k != 3; ++k) {
-       s[i].v[k] += "0.5"*dt*(s[i].a0[k]+s[i].a[k]);
-    }
-  }  
+  // tmp2 = 0.5*dt
+  mpfr_div_2ui(w.tmp2.mpfr_ptr(), dt.mpfr_srcptr(), 1, MPFR_RNDN);
+
+  for(int i=0; i<3*N; i++) {
+    // v += 0.5*dt*(a0+a)
+    mpfr_add(w.tmp.mpfr_ptr(), a0[i].mpfr_srcptr(), a[i].mpfr_srcptr(), MPFR_RNDN);
+    mpfr_mul(w.tmp.mpfr_ptr(), w.tmp2.mpfr_srcptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+    mpfr_add(v[i].mpfr_ptr(), v[i].mpfr_srcptr(), w.tmp.mpfr_srcptr(), MPFR_RNDN);
+  }
 }
 void Cluster::step(mpreal &dt) {
   updatePositions(dt);
   calcAcceleration();
   updateVelocities(dt);
 }
-    
+
+// Computes the accelerations (and the time step criterion if with_dt) with the pair loop split into partitions of
+// consecutive rows holding about the same number of pairs. Each partition adds its forces to its own accumulators, and
+// the accumulators are summed in partition order, so threads can process the partitions in any order.
+void Cluster::calcAccelerationParallel(bool with_dt) {
+  int N = size();
+  int P = std::max(std::min(FORCE_PARTITIONS, N-1), 1);
+
+  std::vector<int> bounds(P+1, N-1);
+  bounds[0] = 0;
+  long pairs = (long)N*(N-1)/2, count = 0;
+  for(int i=0, p=1; i<N-1 && p<P; i++) {
+    count += N-1-i;
+    if(count*P >= pairs*p) bounds[p++] = i+1;
+  }
+
+  std::vector< std::vector<mpreal> > acc(P);
+  std::vector<mpreal> dt_min(P);
+
+  // MPFR keeps the default precision per thread, so the workers must use the precision of this thread
+  mpfr_prec_t precision = mpreal::get_default_prec();
+  std::atomic<int> next(0);
+  auto work = [&]() {
+    mpreal::set_default_prec(precision);
+    for(int p = next++; p < P; p = next++) {
+      accumulatePairs(bounds[p], bounds[p+1], acc[p], dt_min[p], with_dt);
+    }
+  };
+
+  std::vector<std::thread> workers;
+  for(int t=1; t<std::min(threads, P); t++) {
+    workers.emplace_back(work);
+  }
+  work();
+  for(std::vector<std::thread>::iterator w = workers.begin(); w != workers.end(); ++w) {
+    w->join();
+  }
+
+  reset_accelerations(a);
+  for(int i=0; i<3*N; i++) {
+    for(int p=0; p<P; p++) a[i] += acc[p][i];
+  }
+
+  if(with_dt) {
+    Workspace &w = workspace();
+    dt = w.dt_max;
+    for(int p=0; p<P; p++) {
+      if(dt_min[p] < dt) dt = dt_min[p];
+    }
+    mpfr_pow(dt.mpfr_ptr(), dt.mpfr_srcptr(), w.quarter.mpfr_srcptr(), MPFR_RNDN);
+  }
+}
+
+// Adds the forces between the stars i in [i_begin, i_end) and the stars j > i to acc (3 values per star), and lowers
+// dt_min to the time step criterion of these pairs if with_dt.
+void Cluster::accumulatePairs(int i_begin, int i_end, std::vector<mpreal> &acc, mpreal &dt_min, bool with_dt) {
+  int N = size();
+  Workspace &w = workspace();
+
+  acc.assign(3*N, "0");
+  dt_min = w.dt_max;
+
+  for(int i=i_begin; i<i_end; i++) {
+    for(int j=i+1; j<N; j++) {
+      pair_force(&r[3*i], &r[3*j], m[i], m[j], eps2, &acc[3*i], &acc[3*j], with_dt ? &dt_min : nullptr, w);
+    }
+  }
+}
+
 std::vector<mpreal> Cluster::energies() {
+  int N = size();
   mpreal init = "0";
   std::vector<mpreal> E(3), rij(3);
   E.assign(3,"0");
-    
-  for (std::vector<Star>::iterator si = s.begin(); si != s.end(); ++si) {
-    E[1] += "0.5"*si->m*inner_product(si->v.begin(), si->v.end(), si->v.begin(), init); 
-  }
-    
-  for (std::vector<Star>::iterator si = s.begin(); si != s.end(); ++si) {
-    for (std::vector<Star>::iterator sj = si+1; sj != s.end(); ++sj) {
-      for (int i = 0; i != 3; ++i) 
-        rij[i] = si->r[i]-sj->r[i];
-      E[2] -= si->m*sj->m/sqrt(inner_product(rij.begin(), rij.end(),  rij.begin(), init)); 
+
+  for (int i = 0; i < N; i++) {
+    E[1] += "0.5"*m[i]*inner_product(v.begin()+3*i, v.begin()+3*i+3, v.begin()+3*i, init);
+  }
+
+  for (int i = 0; i < N; i++) {
+    for (int j = i+1; j < N; j++) {
+      for (int k = 0; k != 3; ++k)
+        rij[k] = r[3*i+k]-r[3*j+k];
+      E[2] -= m[i]*m[j]/sqrt(inner_product(rij.begin(), rij.end(),  rij.begin(), init));
     }
   }
   E[0] = E[1] + E[2];
@@ -184,29 +315,38 @@ std::vector<mpreal> Cluster::energies() {
 }
 
 std::vector<double> Cluster::get_data_double() {
-  std::vector<double> ddata;  
-  for (std::vector<Star>::iterator si = s.begin(); si != s.end(); ++si) {
-    ddata.push_back(si->m.toDouble());
-    ddata.push_back(si->r[0].toDouble());
-    ddata.push_back(si->r[1].toDouble());
-    ddata.push_back(si->r[2].toDouble());
-    ddata.push_back(si->v[0].toDouble());
-    ddata.push_back(si->v[1].toDouble());
-    ddata.push_back(si->v[2].toDouble());	  
-  }	  
+  int N = size();
+  std::vector<double> ddata(7*N);
+  for (int i = 0; i < N; i++) {
+    ddata[7*i] = m[i].toDouble();
+    for (int k = 0; k < 3; k++) {
+      ddata[7*i+1+k] = r[3*i+k].toDouble();
+      ddata[7*i+4+k] = v[3*i+k].toDouble();
+    }
+  }
   return ddata;
 }
 std::vector<mpreal> Cluster::get_data() {
-  std::vector<mpreal> ddata;  
-  for (std::vector<Star>::iterator si = s.begin(); si != s.end(); ++si) {
-    ddata.push_back(si->m);
-    ddata.push_back(si->r[0]);
-    ddata.push_back(si->r[1]);
-    ddata.push_back(si->r[2]);
-    ddata.push_back(si->v[0]);
-    ddata.push_back(si->v[1]);
-    ddata.push_back(si->v[2]);	  
-  }	  
+  int N = size();
+  std::vector<mpreal> ddata(7*N);
+  for (int i = 0; i < N; i++) {
+    ddata[7*i] = m[i];
+    for (int k = 0; k < 3; k++) {
+      ddata[7*i+1+k] = r[3*i+k];
+      ddata[7*i+4+k] = v[3*i+k];
+    }
+  }
   return ddata;
 }
-
+// Writes the state rounded to double precision into m (N values), r and v (3N values each), in the layout of the
+// cluster's arrays
+void Cluster::get_arrays(double *m, double *r, double *v) const {
+  int N = size();
+  for (int i = 0; i < N; i++) {
+    m[i] = this->m[i].toDouble();
+  }
+  for (int i = 0; i < 3*N; i++) {
+    r[i] = this->r[i].toDouble();
+    v[i] = this->v[i].toDouble();
+  }
+}
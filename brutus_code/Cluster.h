@@ -3,7 +3,7 @@ using namespace std;
 
 #include <vector>
 #include <cmath>
-#include <numeric> 
+#include <numeric>
 #include <cstdlib>
 
 #include "Star.h"
@@ -11,38 +11,62 @@ using namespace std;
 #ifndef __Cluster_h
 #define __Cluster_h
 
-class Cluster : public Star { 
+// The state of the stars is kept as a structure of arrays: one array of N masses, and one array of 3N values for each
+// of the positions, velocities and accelerations, with the 3 components of star i at 3*i, 3*i+1 and 3*i+2. Copying a
+// cluster copies 6 arrays, whatever the number of stars, and the loops run over contiguous memory.
+class Cluster {
   public:
 
-  std::vector<Star> s;
+  std::vector<mpreal> m;
+  std::vector<mpreal> r, v;
+  std::vector<mpreal> a, a0;
+
   mpreal eps2;
   mpreal time, dt, dt_last;
 
-  Cluster() : Star() {}
+  // Number of threads of the force evaluation. 0 uses the serial pair loop, any other value the partitioned one, whose
+  // result does not depend on the number of threads.
+  int threads = 0;
+
+  Cluster() {}
 
   Cluster(std::vector<double> data);
   Cluster(std::vector<mpreal> data);
+  Cluster(const std::vector<mpreal> &m, const std::vector<mpreal> &r, const std::vector<mpreal> &v);
+  Cluster(int N, const double *m, const double *r, const double *v);
+
+  int size() const { return m.size(); }
 
   std::vector<double> get_data_double();
-  std::vector<mpreal> get_data();    
+  std::vector<mpreal> get_data();
+  void get_arrays(double *m, double *r, double *v) const;
 
   void calcAcceleration_dt();
   void calcAcceleration();
+  void calcAccelerationParallel(bool with_dt);
 
-  void updatePositions(mpreal dt);
-  void updateVelocities(mpreal dt);
+  void updatePositions(const mpreal &dt);
+  void updateVelocities(const mpreal &dt);
 
   void step(mpreal &dt);
-  
+
   std::vector<mpreal> energies();
 
+  private:
+
+  void resize(int N);
+  void accumulatePairs(int i_begin, int i_end, std::vector<mpreal> &acc, mpreal &dt_min, bool with_dt);
+
+  public:
+
   friend ostream & operator << (ostream &so, Cluster &cl) {
-    for (std::vector<Star>::iterator si = cl.s.begin(); si != cl.s.end(); ++si) {
-      so << *si;
+    for (int i = 0; i < cl.size(); i++) {
+      so << cl.m[i] << " " << cl.r[3*i] << " " << cl.r[3*i+1] << " " << cl.r[3*i+2] << " "
+                           << cl.v[3*i] << " " << cl.v[3*i+1] << " " << cl.v[3*i+2] << std::endl;
     }
     return so;
   }
-  
+
 };
 
 #endif
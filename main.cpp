@@ -7,6 +7,11 @@
 #include <cstdlib>
 #include <fstream>
 #include <memory>
+#include <functional>
+#include <sstream>
+#include <cstring>
+#include <algorithm>
+#include <chrono>
 
 #include "lib/mpreal/mpreal.h"
 
@@ -18,77 +23,1023 @@
 
 #define MAX_TIME_PRECISION 1e10
 
+// Status codes returned by evolve(), evolveSnapshots() and evolveEnsemble()
+#define STATUS_COMPLETED 0
+#define STATUS_NOT_CONVERGED 1
+#define STATUS_INVALID_HANDLE 2
+#define STATUS_ABORTED 3
+#define STATUS_STOPPED 4
 
-// The Cluster object is stored here. It is created in the initCluster() function that is called from the Python code
-std::unique_ptr<Cluster> cl;
-std::vector<int> star_identifiers;
+// Reasons for a simulation to stop before its end time, returned by getStopReason()
+#define STOP_NONE 0
+#define STOP_ESCAPE 1
+#define STOP_ENCOUNTER 2
+#define STOP_ENERGY_ERROR 3
+#define STOP_WALL_TIME 4
+
+// Layout of the reductions written by getReductions(): step count, maximum relative energy error, minimum separation,
+// time of the minimum separation, final virial ratio and time-averaged virial ratio
+#define REDUCTIONS_SIZE 6
+
+// Layout of the counters written by getCounters(): accepted steps, rejections, force evaluations, maximum and mean
+// extrapolation depth, then the wall time (in seconds) of the integration, the output energies, the output callback
+// and the reductions and stopping conditions
+#define COUNTERS_SIZE 9
+
+// Layout of each record of the trace written by getTrace(): time, time step, extrapolation depth, rejections, force
+// evaluations and wall time of an accepted step
+#define TRACE_RECORD_SIZE 6
 
 
 /**
- * Converts the Brutus simulation object to a string containing hthe current state of the simulation.
+ * Running statistics over every integrator step of a simulation, not just its outputs.
+ * The virial ratio is 2K/|W|: 1 for a system in virial equilibrium.
  */
-std::string result_string(Brutus b)
+struct Reductions
 {
-    mpreal t_current = b.get_t();
-    std::vector<mpreal> data = b.get_data();
-    Cluster cl(data);
+    long steps = 0;
+    mpreal initial_energy;
+    double max_energy_error = 0;
+    double min_separation = INFINITY;
+    double min_separation_time = NAN;
+    double virial_ratio = NAN;
+    double virial_ratio_integral = 0;
+    double last_time = 0;
+    double start_time = 0;
+
+    /**
+     * Starts the statistics from the given state.
+     */
+    void start(Brutus &b)
+    {
+        *this = Reductions();
+        start_time = last_time = b.get_t().toDouble();
+        initial_energy = update(b, false);
+    }
+
+    /**
+     * Updates the statistics with the state reached by an integrator step, and returns its total energy.
+     * The kinetic and potential energies and the pairwise separations are computed in a single pass over the stars.
+     */
+    mpreal update(Brutus &b, bool is_step = true)
+    {
+        Cluster &cl = b.get_cluster();
+        double t = b.get_t().toDouble();
+
+        mpreal kinetic = 0, potential = 0;
+        double min_r2 = INFINITY;
+        int n = cl.size();
+        for (int i = 0; i < n; i++) {
+            const mpreal *vi = &cl.v[3 * i], *ri = &cl.r[3 * i];
+            kinetic += mpreal("0.5") * cl.m[i] * (vi[0] * vi[0] + vi[1] * vi[1] + vi[2] * vi[2]);
+
+            for (int j = i + 1; j < n; j++) {
+                const mpreal *rj = &cl.r[3 * j];
+                mpreal dx = ri[0] - rj[0], dy = ri[1] - rj[1], dz = ri[2] - rj[2];
+                mpreal r2 = dx * dx + dy * dy + dz * dz;
+                potential -= cl.m[i] * cl.m[j] / sqrt(r2);
+                min_r2 = std::min(min_r2, r2.toDouble());
+            }
+        }
+        mpreal energy = kinetic + potential;
+
+        if (std::sqrt(min_r2) < min_separation) {
+            min_separation = std::sqrt(min_r2);
+            min_separation_time = t;
+        }
+
+        virial_ratio = potential != 0 ? (2 * kinetic / abs(potential)).toDouble() : NAN;
+
+        if (is_step) {
+            steps++;
+            if (initial_energy != 0) {
+                max_energy_error = std::max(max_energy_error, abs((energy - initial_energy) / initial_energy).toDouble());
+            }
+            virial_ratio_integral += virial_ratio * (t - last_time);
+            last_time = t;
+        }
+        return energy;
+    }
+
+    void write(double *buffer) const
+    {
+        buffer[0] = steps;
+        buffer[1] = max_energy_error;
+        buffer[2] = min_separation;
+        buffer[3] = min_separation_time;
+        buffer[4] = virial_ratio;
+        buffer[5] = last_time > start_time ? virial_ratio_integral / (last_time - start_time) : virial_ratio;
+    }
+};
+
+
+/**
+ * Where the time of an evolve() call went: the work counted by the integrator, and the wall time spent outside of it.
+ */
+struct PerformanceCounters
+{
+    EngineCounters engine;
+    double energy_time = 0;       // Computing the energies of the outputs
+    double output_time = 0;       // Formatting the outputs and calling the output callback
+    double diagnostics_time = 0;  // Updating the reductions and checking the stopping conditions after each step
+
+    void write(double *buffer) const
+    {
+        buffer[0] = engine.steps;
+        buffer[1] = engine.rejections;
+        buffer[2] = engine.force_evaluations;
+        buffer[3] = engine.max_depth;
+        buffer[4] = engine.steps > 0 ? (double)engine.depth_sum / engine.steps : 0;
+        buffer[5] = engine.integration_time;
+        buffer[6] = energy_time;
+        buffer[7] = output_time;
+        buffer[8] = diagnostics_time;
+    }
+};
+
+
+/**
+ * Conditions that end a simulation early, checked after every integrator step. A value of 0 disables a condition.
+ */
+struct StoppingConditions
+{
+    // A star is escaping if it is further than escape_radius from the centre of mass and its energy is positive
+    double escape_radius = 0;
+    // Two stars are encountering if they are closer than encounter_distance
+    double encounter_distance = 0;
+    // Relative energy error |E(t) - E0| / |E0|
+    double max_energy_error = 0;
+    // Wall-clock time of the evolve() call, in seconds
+    double wall_time = 0;
+
+    mpreal initial_energy;
+    std::chrono::steady_clock::time_point start_time;
+
+    bool enabled() const
+    {
+        return escape_radius > 0 || encounter_distance > 0 || max_energy_error > 0 || wall_time > 0;
+    }
+
+    /**
+     * Records the initial energy and the starting time of the run.
+     */
+    void start(Brutus &b)
+    {
+        start_time = std::chrono::steady_clock::now();
+        if (max_energy_error > 0) {
+            initial_energy = b.get_cluster().energies()[0];
+        }
+    }
+
+    /**
+     * Returns the reason to stop at the current state, or STOP_NONE. The geometric conditions are checked in double
+     * precision, which is plenty for a threshold; the energy error needs the full precision.
+     */
+    int check(Brutus &b) const
+    {
+        Cluster &cl = b.get_cluster();
+        size_t n = cl.size();
+
+        if (wall_time > 0) {
+            std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start_time;
+            if (elapsed.count() > wall_time) {
+                return STOP_WALL_TIME;
+            }
+        }
+
+        if (encounter_distance > 0 || escape_radius > 0) {
+            std::vector<double> m(n), r(3 * n), v(3 * n);
+            cl.get_arrays(m.data(), r.data(), v.data());
+
+            if (encounter_distance > 0) {
+                double d2 = encounter_distance * encounter_distance;
+                for (size_t i = 0; i < n; i++) {
+                    for (size_t j = i + 1; j < n; j++) {
+                        if (distance2(&r[3 * i], &r[3 * j]) < d2) {
+                            return STOP_ENCOUNTER;
+                        }
+                    }
+                }
+            }
+
+            if (escape_radius > 0 && escaping(m, r, v)) {
+                return STOP_ESCAPE;
+            }
+        }
+
+        if (max_energy_error > 0 && initial_energy != 0) {
+            mpreal energy = cl.energies()[0];
+            if (abs((energy - initial_energy) / initial_energy).toDouble() > max_energy_error) {
+                return STOP_ENERGY_ERROR;
+            }
+        }
+
+        return STOP_NONE;
+    }
+
+private:
+    static double distance2(const double *a, const double *b)
+    {
+        double dx = a[0] - b[0], dy = a[1] - b[1], dz = a[2] - b[2];
+        return dx * dx + dy * dy + dz * dz;
+    }
+
+    /**
+     * Whether a star is beyond the escape radius from the centre of mass, with a positive energy relative to it
+     * (its kinetic energy in the centre of mass frame plus its potential energy with every other star).
+     */
+    bool escaping(const std::vector<double> &m, const std::vector<double> &r, const std::vector<double> &v) const
+    {
+        size_t n = m.size();
+        double mass = 0, com_r[3] = {0, 0, 0}, com_v[3] = {0, 0, 0};
+        for (size_t i = 0; i < n; i++) {
+            mass += m[i];
+            for (int k = 0; k < 3; k++) {
+                com_r[k] += m[i] * r[3 * i + k];
+                com_v[k] += m[i] * v[3 * i + k];
+            }
+        }
+        for (int k = 0; k < 3; k++) {
+            com_r[k] /= mass;
+            com_v[k] /= mass;
+        }
+
+        for (size_t i = 0; i < n; i++) {
+            if (distance2(&r[3 * i], com_r) <= escape_radius * escape_radius) {
+                continue;
+            }
+
+            double v2 = distance2(&v[3 * i], com_v);
+            double energy = 0.5 * m[i] * v2;
+            for (size_t j = 0; j < n; j++) {
+                if (j != i) {
+                    energy -= m[i] * m[j] / std::sqrt(distance2(&r[3 * i], &r[3 * j]));
+                }
+            }
+            if (energy > 0) {
+                return true;
+            }
+        }
+        return false;
+    }
+};
+
+
+/**
+ * The state of a single simulation. It is created in the initCluster() function that is called from the Python code
+ * and passed back to every other function as an opaque handle, so a process can run several simulations at once.
+ */
+struct Simulation
+{
+    // Initial conditions, 7 values per star in the layout expected by Brutus: m, x, y, z, vx, vy, vz
+    std::vector<double> data;
+    std::vector<int> star_identifiers;
+
+    // Bulirsch-Stoer tolerance and word length. A word length of 0 derives it from the tolerance.
+    std::string tolerance = "1e-10";
+    int numBits = 88;
+
+    // Full precision state reached by the last evolve() call, or set by setState(): the time and 7 values per star
+    // (m, x, y, z, vx, vy, vz) as decimal strings. Evolving starts from it instead of the initial conditions if set.
+    std::string time = "0";
+    std::vector<std::string> state;
+
+    // Called with the state string (see state_string()) every checkpoint_interval time units, if set
+    double checkpoint_interval = 0;
+    void (*checkpoint_callback)(const char*) = nullptr;
+
+    // Output cadence: every output_every-th step and the last one, or only at output_times if it is not empty
+    int output_every = 1;
+    std::vector<double> output_times;
+
+    // Indices of the stars that are output, in order. Empty outputs every star.
+    std::vector<int> output_stars;
+
+    // Energies are computed for every energy_every-th output, and are NaN in the others. 0 never computes them.
+    int energy_every = 1;
+
+    // Whether the reductions are updated at every integrator step, and their values over the last evolve() call
+    bool reductions_enabled = false;
+    Reductions reductions;
+
+    // Conditions that end evolve() early, and why the last evolve() call stopped (STOP_NONE if it reached its end)
+    StoppingConditions stopping;
+    int stop_reason = STOP_NONE;
+
+    // Threads of the force evaluation. 0 uses the serial pair loop (see Cluster::threads).
+    int force_threads = 0;
 
-    // Get energies
+    // Work done by the last evolve() call, and a record of each of its accepted steps if trace_enabled
+    // (TRACE_RECORD_SIZE values per step)
+    PerformanceCounters counters;
+    bool trace_enabled = false;
+    std::vector<double> trace;
+};
+
+
+/**
+ * Returns the seconds elapsed since start.
+ */
+double seconds_since(std::chrono::steady_clock::time_point start)
+{
+    std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+    return elapsed.count();
+}
+
+
+/**
+ * Sets the default precision of new mpreal numbers for the lifetime of this object, restoring the previous one
+ * afterwards. MPFR keeps the default precision per thread, so simulations in different threads do not interfere.
+ */
+class DefaultPrecision
+{
+    mp_prec_t previous;
+
+public:
+    DefaultPrecision(int numBits) : previous(mpreal::get_default_prec())
+    {
+        mpreal::set_default_prec(numBits);
+    }
+
+    ~DefaultPrecision()
+    {
+        mpreal::set_default_prec(previous);
+    }
+};
+
+
+// Layout of the snapshot buffer filled by evolveSnapshots():
+// [time, star count, total energy, kinetic energy, potential energy,
+//  (identifier, x, y, z, vx, vy, vz, mass) for each star]
+#define SNAPSHOT_HEADER_SIZE 5
+#define SNAPSHOT_STAR_SIZE 8
+
+
+/**
+ * Returns the total, kinetic and potential energies of the cluster, or NaN if they are not computed for this output.
+ */
+std::vector<double> output_energies(Cluster &cl, bool with_energies)
+{
+    if (!with_energies) {
+        return std::vector<double>(3, std::nan(""));
+    }
     std::vector<mpreal> energies = cl.energies();
-    mpreal energy_total = energies[0];
-    mpreal energy_kinetic = energies[1];
-    mpreal energy_potential = energies[2];
+    return {energies[0].toDouble(), energies[1].toDouble(), energies[2].toDouble()};
+}
+
+
+/**
+ * Returns the indices of the stars that are output: the selected ones, or all of them.
+ */
+std::vector<int> output_star_indices(const Simulation &sim)
+{
+    if (!sim.output_stars.empty()) {
+        return sim.output_stars;
+    }
+    std::vector<int> indices(sim.star_identifiers.size());
+    std::iota(indices.begin(), indices.end(), 0);
+    return indices;
+}
+
+
+/**
+ * Converts the Brutus simulation object to a string containing hthe current state of the simulation.
+ */
+std::string result_string(Brutus &b, const Simulation &sim, const std::vector<double> &energies)
+{
+    mpreal t_current = b.get_t();
+    Cluster &cl = b.get_cluster();
+    std::vector<int> stars = output_star_indices(sim);
 
     // Create string with the current state of the simulation
     std::string result = std::to_string(t_current.toDouble()) + ",";
 
     // Size of the star vector
-    result += std::to_string(cl.s.size()) + ",";
+    result += std::to_string(stars.size()) + ",";
 
     // Add the star data to the string
-    for (int i = 0; i < cl.s.size(); i++) {
-        result += std::to_string(star_identifiers[i]) + ","
-        + std::to_string(cl.s[i].r[0].toDouble()) + ","
-        + std::to_string(cl.s[i].r[1].toDouble()) + ","
-        + std::to_string(cl.s[i].r[2].toDouble()) + ","
-        + std::to_string(cl.s[i].v[0].toDouble()) + ","
-        + std::to_string(cl.s[i].v[1].toDouble()) + ","
-        + std::to_string(cl.s[i].v[2].toDouble()) + ","
-        + std::to_string(cl.s[i].m.toDouble()) + ",";
+    for (int i : stars) {
+        result += std::to_string(sim.star_identifiers[i]) + ","
+        + std::to_string(cl.r[3 * i].toDouble()) + ","
+        + std::to_string(cl.r[3 * i + 1].toDouble()) + ","
+        + std::to_string(cl.r[3 * i + 2].toDouble()) + ","
+        + std::to_string(cl.v[3 * i].toDouble()) + ","
+        + std::to_string(cl.v[3 * i + 1].toDouble()) + ","
+        + std::to_string(cl.v[3 * i + 2].toDouble()) + ","
+        + std::to_string(cl.m[i].toDouble()) + ",";
     }
     
     // Add the energy data to the string
-    result += std::to_string(energy_total.toDouble()) + ","
-        + std::to_string(energy_kinetic.toDouble()) + ","
-        + std::to_string(energy_potential.toDouble());
+    result += std::to_string(energies[0]) + ","
+        + std::to_string(energies[1]) + ","
+        + std::to_string(energies[2]);
 
     return result;
 }
 
 
+/**
+ * Writes the current state of the simulation into a caller-owned buffer.
+ * The buffer must hold SNAPSHOT_HEADER_SIZE + SNAPSHOT_STAR_SIZE * N doubles, N being the number of output stars.
+ */
+void fill_snapshot(Brutus &b, const Simulation &sim, const std::vector<double> &energies, double *buffer)
+{
+    Cluster &cl = b.get_cluster();
+    std::vector<int> stars = output_star_indices(sim);
+
+    buffer[0] = b.get_t().toDouble();
+    buffer[1] = stars.size();
+    buffer[2] = energies[0];
+    buffer[3] = energies[1];
+    buffer[4] = energies[2];
+
+    double *star = buffer + SNAPSHOT_HEADER_SIZE;
+    for (int i : stars) {
+        star[0] = sim.star_identifiers[i];
+        for (int k = 0; k < 3; k++) {
+            star[1 + k] = cl.r[3 * i + k].toDouble();
+            star[4 + k] = cl.v[3 * i + k].toDouble();
+        }
+        star[7] = cl.m[i].toDouble();
+        star += SNAPSHOT_STAR_SIZE;
+    }
+}
+
+
+/**
+ * Formats the full precision state of the simulation: the time followed by the 7 values of each star
+ * (m, x, y, z, vx, vy, vz), separated by spaces. The values can be read back without losing precision.
+ */
+std::string state_string(Brutus &b)
+{
+    std::string result = Brutus::to_exact_string(b.get_t());
+    for (const std::string &value : b.get_data_string()) {
+        result += " " + value;
+    }
+    return result;
+}
+
+
+/**
+ * Returns the word length (in bits) of the given simulation, deriving it from the tolerance if it was not set.
+ */
+int word_length(Simulation &sim)
+{
+    if (sim.numBits > 0) {
+        return sim.numBits;
+    }
+    return Brutus::get_numBits(mpreal(sim.tolerance));
+}
+
+
+/**
+ * Runs the simulation loop from the simulation's current state up to t_end, in steps of t_step. output() is called with
+ * the Brutus object at the steps selected by the simulation's output cadence (see Simulation), and with the energies
+ * of that output (NaN if they are not computed for it). The state reached and the performance counters are stored in
+ * the simulation, so the next call continues from it.
+ * If output() returns false, the simulation stops and STATUS_ABORTED is returned.
+ * Returns STATUS_NOT_CONVERGED if the Bulirsch-Stoer integrator did not converge, and STATUS_STOPPED if one of the
+ * simulation's stopping conditions was met (see getStopReason()), after outputting the last state.
+ */
+int run_simulation(Simulation &sim, double t_end, double t_step,
+                   const std::function<bool(Brutus &, const std::vector<double> &)> &output)
+{
+    int numBits = word_length(sim);
+
+    // Every number of the simulation must be created after this point to use the requested word length
+    DefaultPrecision precision(numBits);
+
+    mpreal t = sim.time;
+    mpreal tolerance = sim.tolerance;
+
+    std::vector<mpreal> data;
+    if (sim.state.empty()) {
+        data.assign(sim.data.begin(), sim.data.end());
+    }
+    else {
+        data.assign(sim.state.begin(), sim.state.end());
+    }
+
+    Brutus b(t, data, tolerance, numBits);
+    b.set_force_threads(sim.force_threads);
+
+    // Store the state reached however the loop ends
+    struct SaveState {
+        Simulation &sim;
+        Brutus &b;
+        ~SaveState()
+        {
+            sim.time = Brutus::to_exact_string(b.get_t());
+            sim.state = b.get_data_string();
+            sim.counters.engine = b.get_counters();
+        }
+    } save_state{sim, b};
+
+    sim.counters = PerformanceCounters();
+    sim.trace.clear();
+
+    // The step targets are kept in double precision, the same as t_end, so the end condition compares like with like
+    double current_evolve_time = t.toDouble();
+    double next_checkpoint = current_evolve_time + sim.checkpoint_interval;
+
+    // Explicit output times that are still ahead
+    bool explicit_times = !sim.output_times.empty();
+    std::vector<double>::const_iterator next_output_time = std::upper_bound(sim.output_times.begin(), sim.output_times.end(), current_evolve_time);
+
+    // Reductions are updated, stopping conditions checked and the trace recorded after every integrator step, between
+    // the outputs
+    sim.stop_reason = STOP_NONE;
+    std::function<bool()> on_step;
+    if (sim.reductions_enabled || sim.stopping.enabled() || sim.trace_enabled) {
+        if (sim.reductions_enabled) {
+            sim.reductions.start(b);
+        }
+        sim.stopping.start(b);
+
+        on_step = [&]() {
+            if (sim.trace_enabled) {
+                const StepRecord &step = b.get_last_step();
+                sim.trace.insert(sim.trace.end(), {b.get_t().toDouble(), step.time_step, (double)step.depth,
+                                                   (double)step.rejections, (double)step.force_evaluations,
+                                                   step.duration});
+            }
+
+            std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+            if (sim.reductions_enabled) {
+                sim.reductions.update(b);
+            }
+            if (sim.stopping.enabled()) {
+                sim.stop_reason = sim.stopping.check(b);
+            }
+            sim.counters.diagnostics_time += seconds_since(start);
+            return sim.stop_reason == STOP_NONE;
+        };
+    }
+
+    int outputs = 0;
+    auto emit = [&]() {
+        bool with_energies = sim.energy_every > 0 && outputs % sim.energy_every == 0;
+        outputs++;
+
+        std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+        std::vector<double> energies = output_energies(b.get_cluster(), with_energies);
+        sim.counters.energy_time += seconds_since(start);
+
+        start = std::chrono::steady_clock::now();
+        bool keep_going = output(b, energies);
+        sim.counters.output_time += seconds_since(start);
+        return keep_going;
+    };
+
+    bool output_start = explicit_times ? std::binary_search(sim.output_times.begin(), sim.output_times.end(), current_evolve_time) : true;
+    if (output_start && !emit()) {
+        return STATUS_ABORTED;
+    }
+
+    long step = 0;
+
+    do
+    {
+        // Round the current time to avoid floating point errors
+        double target = std::round((current_evolve_time + t_step) * MAX_TIME_PRECISION) / MAX_TIME_PRECISION;
+        if (target >= t_end)
+        {
+            target = t_end;
+        }
+
+        // Stop at the explicit output times before the target, without outputting the target itself
+        while (next_output_time != sim.output_times.end() && *next_output_time < target)
+        {
+            if (!b.evolve(*next_output_time, on_step)) {
+                emit();
+                return STATUS_NOT_CONVERGED;
+            }
+            if (sim.stop_reason != STOP_NONE) {
+                emit();
+                return STATUS_STOPPED;
+            }
+            if (!emit()) {
+                return STATUS_ABORTED;
+            }
+            ++next_output_time;
+        }
+
+        current_evolve_time = target;
+        step++;
+
+        bool converged = b.evolve(current_evolve_time, on_step);
+
+        bool is_output;
+        if (explicit_times) {
+            is_output = next_output_time != sim.output_times.end() && *next_output_time == current_evolve_time;
+            if (is_output) {
+                ++next_output_time;
+            }
+        }
+        else {
+            is_output = step % sim.output_every == 0 || current_evolve_time >= t_end;
+        }
+
+        // The last state is always output if the integrator did not converge or a stopping condition was met
+        bool stopped = sim.stop_reason != STOP_NONE;
+        bool keep_going = (is_output || !converged || stopped) ? emit() : true;
+
+        if (!converged) {
+            return STATUS_NOT_CONVERGED;
+        }
+        if (stopped) {
+            return STATUS_STOPPED;
+        }
+        if (!keep_going) {
+            return STATUS_ABORTED;
+        }
+
+        if (sim.checkpoint_callback != nullptr && sim.checkpoint_interval > 0 && current_evolve_time >= next_checkpoint) {
+            sim.checkpoint_callback(state_string(b).c_str());
+            while (next_checkpoint <= current_evolve_time) {
+                next_checkpoint += sim.checkpoint_interval;
+            }
+        }
+
+    } while (current_evolve_time < t_end);
+
+    return STATUS_COMPLETED;
+}
+
+
 // The external interface used by the Python code
 extern "C" {
 
     /**
-     * Initializes a Cluster object for the simulation
+     * Initializes a Cluster object for a new simulation and returns its handle.
+     * The handle must be released with cleanup() when the simulation is finished.
      */
-    void initCluster()
+    Simulation *initCluster()
     {
-        cl = std::make_unique<Cluster>();   
+        return new Simulation();
     }
     
     /**
-     * Adds a start to the configured Cluster object.
+     * Adds a start to the Cluster object of the given simulation.
      * initCluster() must be called before this function.
      */
-    void addStar(int identifier, double m, double r[3], double v[3])
+    void addStar(Simulation *sim, int identifier, double m, double r[3], double v[3])
     {   
-        if (cl == nullptr) {
-            std::cout << "Cluster object is null" << std::endl;
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->data.insert(sim->data.end(), {m, r[0], r[1], r[2], v[0], v[1], v[2]});
+        sim->star_identifiers.push_back(identifier);
+    }
+
+    /**
+     * Adds n stars to the Cluster object of the given simulation in a single call, as addStar() would one by one.
+     * The arrays hold the identifiers and masses (n values), positions and velocities (3n values each, x, y, z of each
+     * star in turn) of the stars, in the layout of Cluster.
+     */
+    void addStars(Simulation *sim, int n, const int *identifiers, const double *masses, const double *positions,
+                  const double *velocities)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->data.reserve(sim->data.size() + 7 * n);
+        for (int i = 0; i < n; i++) {
+            const double *r = &positions[3 * i];
+            const double *v = &velocities[3 * i];
+            sim->data.insert(sim->data.end(), {masses[i], r[0], r[1], r[2], v[0], v[1], v[2]});
+        }
+        sim->star_identifiers.insert(sim->star_identifiers.end(), identifiers, identifiers + n);
+    }
+
+    /**
+     * Sets the Bulirsch-Stoer tolerance and the word length (in bits) of the given simulation.
+     * The tolerance is passed as a decimal string so it is not rounded to a double.
+     * If numBits is 0 or negative, the word length is derived from the tolerance.
+     */
+    void setPrecision(Simulation *sim, const char *tolerance, int numBits)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->tolerance = tolerance;
+        sim->numBits = numBits;
+    }
+
+    /**
+     * Sets the full precision state to evolve the given simulation from, replacing the initial conditions given by
+     * addStar(). The state is the time followed by the 7 values of each star (m, x, y, z, vx, vy, vz), as decimal
+     * strings separated by spaces, in the format returned by getState().
+     */
+    void setState(Simulation *sim, const char *state)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        std::istringstream values(state);
+        std::string value;
+
+        values >> sim->time;
+        sim->state.clear();
+        while (values >> value) {
+            sim->state.push_back(value);
+        }
+    }
+
+    /**
+     * Writes the full precision state of the given simulation into buffer, in the format taken by setState().
+     * Before the first evolve() call, this is the initial state. Returns the length of the state string; if it does not
+     * fit in size bytes (including the null terminator), nothing is written and the call must be repeated.
+     */
+    int getState(Simulation *sim, char *buffer, int size)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return 0;
+        }
+        std::string state = sim->time;
+        if (sim->state.empty()) {
+            for (double value : sim->data) {
+                std::ostringstream formatted;
+                formatted.precision(17);
+                formatted << value;
+                state += " " + formatted.str();
+            }
+        }
+        else {
+            for (const std::string &value : sim->state) {
+                state += " " + value;
+            }
+        }
+
+        if ((int)state.size() < size) {
+            std::memcpy(buffer, state.c_str(), state.size() + 1);
+        }
+        return state.size();
+    }
+
+    /**
+     * Sets the state to evolve the given simulation from as arrays, replacing the initial conditions given by addStar()
+     * and any state set by setState(). The arrays hold the masses (N values), positions and velocities (3N values each,
+     * x, y, z of each star in turn) of the N stars added, in the order they were added, in the layout of Cluster.
+     * setPrecision() must be called before this function, so the time is kept at the right word length.
+     */
+    void setStateArrays(Simulation *sim, double time, const double *masses, const double *positions,
+                        const double *velocities)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        size_t n = sim->star_identifiers.size();
+        for (size_t i = 0; i < n; i++) {
+            double *star = &sim->data[7 * i];
+            star[0] = masses[i];
+            for (int k = 0; k < 3; k++) {
+                star[1 + k] = positions[3 * i + k];
+                star[4 + k] = velocities[3 * i + k];
+            }
+        }
+
+        // Formatted at the word length of the simulation, so it is read back as the same value
+        DefaultPrecision precision(word_length(*sim));
+        sim->time = Brutus::to_exact_string(mpreal(time));
+        sim->state.clear();
+    }
+
+    /**
+     * Writes the state of the given simulation, rounded to double precision, into the arrays of masses (N values),
+     * positions and velocities (3N values each), in the layout taken by setStateArrays(). Before the first evolve()
+     * call, this is the initial state. Returns the number of stars N; if masses is null, nothing is written, so the
+     * arrays can be allocated first.
+     */
+    int getStateArrays(Simulation *sim, double *masses, double *positions, double *velocities)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return 0;
+        }
+        int n = sim->star_identifiers.size();
+        if (masses == nullptr) {
+            return n;
+        }
+        if (sim->state.empty()) {
+            for (int i = 0; i < n; i++) {
+                const double *star = &sim->data[7 * i];
+                masses[i] = star[0];
+                for (int k = 0; k < 3; k++) {
+                    positions[3 * i + k] = star[1 + k];
+                    velocities[3 * i + k] = star[4 + k];
+                }
+            }
+            return n;
+        }
+
+        DefaultPrecision precision(word_length(*sim));
+        Cluster cl(std::vector<mpreal>(sim->state.begin(), sim->state.end()));
+        cl.get_arrays(masses, positions, velocities);
+        return n;
+    }
+
+    /**
+     * Calls callback with the full precision state (in the format returned by getState()) every interval time units
+     * while the given simulation is evolved. An interval of 0 disables checkpoints.
+     */
+    void setCheckpoints(Simulation *sim, double interval, void (*callback)(const char*))
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->checkpoint_interval = interval;
+        sim->checkpoint_callback = callback;
+    }
+
+    /**
+     * Outputs every k-th step of the given simulation (and its last step) instead of every step.
+     */
+    void setOutputEvery(Simulation *sim, int every)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->output_every = every > 0 ? every : 1;
+    }
+
+    /**
+     * Outputs the given simulation only at the given times, which must be sorted. The integrator stops exactly at each
+     * of them. An empty list restores the output every k-th step (see setOutputEvery()).
+     */
+    void setOutputTimes(Simulation *sim, const double *times, int count)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->output_times.assign(times, times + count);
+    }
+
+    /**
+     * Outputs only the stars with the given identifiers, in the given order. Unknown identifiers are ignored.
+     * An empty list outputs every star.
+     */
+    void setOutputStars(Simulation *sim, const int *identifiers, int count)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->output_stars.clear();
+        for (int i = 0; i < count; i++) {
+            auto star = std::find(sim->star_identifiers.begin(), sim->star_identifiers.end(), identifiers[i]);
+            if (star != sim->star_identifiers.end()) {
+                sim->output_stars.push_back(star - sim->star_identifiers.begin());
+            }
+        }
+    }
+
+    /**
+     * Computes the energies (an O(N^2) operation) only for every k-th output of the given simulation. The energies of
+     * the other outputs are NaN. 0 never computes them.
+     */
+    void setEnergyInterval(Simulation *sim, int every)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->energy_every = every > 0 ? every : 0;
+    }
+
+    /**
+     * Enables or disables the reductions of the given simulation (see Reductions). When enabled, they are updated after
+     * every integrator step of the next evolve() calls, at the cost of one O(N^2) pass over the stars per step.
+     */
+    void setReductions(Simulation *sim, int enabled)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
             return;
         }
-        cl->s.push_back(Star(m, {r[0], r[1], r[2]}, {v[0], v[1], v[2]}));
-        star_identifiers.push_back(identifier);
+        sim->reductions_enabled = enabled != 0;
+    }
+
+    /**
+     * Writes the reductions of the last evolve() call of the given simulation into a caller-owned buffer of
+     * REDUCTIONS_SIZE doubles. Returns the number of values written, or 0 if the reductions are disabled.
+     */
+    int getReductions(Simulation *sim, double *buffer)
+    {
+        if (sim == nullptr || !sim->reductions_enabled) {
+            return 0;
+        }
+        sim->reductions.write(buffer);
+        return REDUCTIONS_SIZE;
+    }
+
+    /**
+     * Sets the conditions that end the next evolve() calls of the given simulation early (see StoppingConditions).
+     * They are checked after every integrator step. 0 disables a condition.
+     */
+    void setStoppingConditions(Simulation *sim, double escape_radius, double encounter_distance, double max_energy_error, double wall_time)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->stopping.escape_radius = escape_radius;
+        sim->stopping.encounter_distance = encounter_distance;
+        sim->stopping.max_energy_error = max_energy_error;
+        sim->stopping.wall_time = wall_time;
+    }
+
+    /**
+     * Returns why the last evolve() call of the given simulation stopped early (one of the STOP_* codes), or STOP_NONE
+     * if it reached its end time.
+     */
+    int getStopReason(Simulation *sim)
+    {
+        if (sim == nullptr) {
+            return STOP_NONE;
+        }
+        return sim->stop_reason;
+    }
+
+    /**
+     * Sets the number of threads that compute the forces between the stars of the given simulation. 0 (the default)
+     * uses the serial pair loop. Any other value uses a partitioned pair loop whose result does not depend on the
+     * number of threads, but differs from the serial loop's by rounding.
+     */
+    void setForceThreads(Simulation *sim, int threads)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->force_threads = threads > 0 ? threads : 0;
+    }
+
+    /**
+     * Enables or disables the trace of the given simulation: a record of each accepted integrator step of the next
+     * evolve() calls (see getTrace()). It grows with the number of steps, so it is disabled by default.
+     */
+    void setTrace(Simulation *sim, int enabled)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return;
+        }
+        sim->trace_enabled = enabled != 0;
+    }
+
+    /**
+     * Writes the performance counters of the last evolve() call of the given simulation into buffer, which must hold
+     * COUNTERS_SIZE doubles. Returns 1, or 0 if the handle is null.
+     */
+    int getCounters(Simulation *sim, double *buffer)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return 0;
+        }
+        sim->counters.write(buffer);
+        return 1;
+    }
+
+    /**
+     * Writes the trace of the last evolve() call of the given simulation into buffer, TRACE_RECORD_SIZE doubles per
+     * step, up to capacity steps. Returns the number of steps in the trace; if buffer is null, nothing is written, so
+     * the buffer can be allocated first.
+     */
+    int getTrace(Simulation *sim, double *buffer, int capacity)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return 0;
+        }
+        int steps = sim->trace.size() / TRACE_RECORD_SIZE;
+        if (buffer != nullptr) {
+            int count = std::min(steps, capacity) * TRACE_RECORD_SIZE;
+            std::copy(sim->trace.begin(), sim->trace.begin() + count, buffer);
+        }
+        return steps;
+    }
+
+    /**
+     * Returns the word length (in bits) that will be used to evolve the given simulation.
+     */
+    int getWordLength(Simulation *sim)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return 0;
+        }
+        return word_length(*sim);
     }
 
     /**
@@ -97,49 +1048,105 @@ extern "C" {
      * 
      * The callback function is called when a simulation step is finished.
      * This function is used to update the Python code with the current state of the simulation.
+     * If it returns a non-zero value, the simulation stops and STATUS_ABORTED is returned.
+     * 
+     * Returns one of the STATUS_* codes.
      */
-    void evolve(double t_end, double t_step, void (*callback)(const char*))
+    int evolve(Simulation *sim, double t_end, double t_step, int (*callback)(const char*))
     {   
-        if (cl == nullptr) {
-            std::cout << "Cluster object is null" << std::endl;
-            return;
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return STATUS_INVALID_HANDLE;
         }
-        mpreal t = "0";
-        mpreal tolerance = "1e-10";
-        int numBits = 88;
-
-        std::vector<mpreal> data = cl->get_data();
-
-        Brutus b(t, data, tolerance, numBits);
-
-        mpreal current_evolve_time = 0;
+        return run_simulation(*sim, t_end, t_step, [&](Brutus &b, const std::vector<double> &energies) {
+            return callback(result_string(b, *sim, energies).c_str()) == 0;
+        });
+    }
 
-        callback(result_string(b).c_str());
+    /**
+     * Same as evolve(), but writes each step into a caller-owned buffer of doubles instead of formatting a string.
+     * The buffer must hold SNAPSHOT_HEADER_SIZE + SNAPSHOT_STAR_SIZE * N doubles, N being the number of output stars.
+     * 
+     * The callback function is called when the buffer holds the state of a finished simulation step.
+     * Its contents are overwritten on the next step. If it returns a non-zero value, the simulation stops and
+     * STATUS_ABORTED is returned.
+     * 
+     * Returns one of the STATUS_* codes.
+     */
+    int evolveSnapshots(Simulation *sim, double t_end, double t_step, double *buffer, int (*callback)())
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return STATUS_INVALID_HANDLE;
+        }
+        return run_simulation(*sim, t_end, t_step, [&](Brutus &b, const std::vector<double> &energies) {
+            fill_snapshot(b, *sim, energies, buffer);
+            return callback() == 0;
+        });
+    }
 
-        do
-        {
-            current_evolve_time += t_step;
-            if (current_evolve_time >= t_end)
-            {
-                current_evolve_time = t_end;
+    /**
+     * Evolves count systems from t = 0 to t_end, one after the other, with the stars, precision, output policy and
+     * stopping conditions of the given simulation. The arrays hold the masses (N values), positions and velocities (3N
+     * values each) of each system in turn, in the layout of setStateArrays(), and the state each system reaches is
+     * written back into them, rounded to double precision. The time each system reaches and the reason it stopped
+     * (STOP_NONE if it reached t_end) are written into times and stop_reasons.
+     *
+     * Each output is written into buffer as by evolveSnapshots(), and callback, if it is not null, is called with the
+     * index of the system. A batch of systems thus costs a single call, and none per output without a callback.
+     *
+     * Returns one of the STATUS_* codes: STATUS_COMPLETED if every system completed or stopped, or the status of the
+     * first system that did not, whose index is written into failed. The systems after it are not evolved.
+     */
+    int evolveEnsemble(Simulation *sim, int count, double t_end, double t_step, double *masses, double *positions,
+                       double *velocities, double *times, int *stop_reasons, double *buffer, int (*callback)(int),
+                       int *failed)
+    {
+        if (sim == nullptr) {
+            std::cout << "Simulation handle is null" << std::endl;
+            return STATUS_INVALID_HANDLE;
+        }
+        size_t n = sim->star_identifiers.size();
+        for (int s = 0; s < count; s++) {
+            double *m = masses + n * s, *r = positions + 3 * n * s, *v = velocities + 3 * n * s;
+            for (size_t i = 0; i < n; i++) {
+                double *star = &sim->data[7 * i];
+                star[0] = m[i];
+                for (int k = 0; k < 3; k++) {
+                    star[1 + k] = r[3 * i + k];
+                    star[4 + k] = v[3 * i + k];
+                }
             }
+            sim->time = "0";
+            sim->state.clear();
 
-            // Round the current time to avoid floating point errors
-            current_evolve_time = round(current_evolve_time * MAX_TIME_PRECISION) / MAX_TIME_PRECISION;
-
-            b.evolve(current_evolve_time);
+            // The last output is the state reached, unless the output times end before t_end
+            double output_time = NAN;
+            int status = run_simulation(*sim, t_end, t_step, [&](Brutus &b, const std::vector<double> &energies) {
+                fill_snapshot(b, *sim, energies, buffer);
+                b.get_cluster().get_arrays(m, r, v);
+                output_time = b.get_t().toDouble();
+                return callback == nullptr || callback(s) == 0;
+            });
+            if (status != STATUS_COMPLETED && status != STATUS_STOPPED) {
+                *failed = s;
+                return status;
+            }
 
-            callback(result_string(b).c_str());
-        
-        } while (current_evolve_time < t_end);
+            times[s] = std::stod(sim->time);
+            stop_reasons[s] = sim->stop_reason;
+            if (times[s] != output_time) {
+                getStateArrays(sim, m, r, v);
+            }
+        }
+        return STATUS_COMPLETED;
     }
 
     /**
-     * Cleans up the Cluster object. This function should be called when the simulation is finished.
+     * Releases the given simulation. This function should be called when the simulation is finished.
      */
-    void cleanup()
+    void cleanup(Simulation *sim)
     {
-        cl.reset();
-        star_identifiers.clear();
+        delete sim;
     }
 }
@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 setup(
     name='brutus',
     version='0.1',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     package_data={'brutus': ['lib/*']},
     install_requires=[
         'numpy',
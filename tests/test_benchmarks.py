@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from benchmarks import Measurement, compare, save_results, load_results
+from benchmarks.__main__ import main
+
+
+class TestBenchmarks:
+    def test_measurement_key(self):
+        assert Measurement(name='engine_step', value=1, unit='ms/step').key == 'engine_step'
+        assert Measurement(name='engine_step', value=1, unit='ms/step',
+                           params={'stars': 3, 'bits': 64}).key == 'engine_step[stars=3,bits=64]'
+
+    def test_compare_slowdown(self):
+        baseline = [Measurement(name='time', value=2, unit='s'),
+                    Measurement(name='rate', value=100, unit='1/s', lower_is_better=False),
+                    Measurement(name='removed', value=1, unit='s')]
+        measurements = [Measurement(name='time', value=3, unit='s'),
+                        Measurement(name='rate', value=200, unit='1/s', lower_is_better=False),
+                        Measurement(name='added', value=1, unit='s')]
+
+        comparisons = {comparison.key: comparison for comparison in compare(measurements, baseline)}
+
+        assert set(comparisons) == {'time', 'rate'}
+        assert comparisons['time'].slowdown == pytest.approx(0.5)
+        assert comparisons['rate'].slowdown == pytest.approx(-0.5)
+
+    def test_save_load(self, tmp_path):
+        measurements = [Measurement(name='rate', value=100, unit='1/s', lower_is_better=False, params={'n': 3})]
+        save_results(tmp_path / 'results.json', measurements, {'commit': 'abc'})
+
+        assert load_results(tmp_path / 'results.json') == (measurements, {'commit': 'abc'})
+
+    def test_load_invalid(self, tmp_path):
+        (tmp_path / 'results.json').write_text(json.dumps({'format': 'other'}))
+
+        with pytest.raises(ValueError):
+            load_results(tmp_path / 'results.json')
+
+    def test_main_compare_regression(self, tmp_path):
+        save_results(tmp_path / 'baseline.json', [Measurement(name='time', value=1, unit='s')], {})
+        save_results(tmp_path / 'slower.json', [Measurement(name='time', value=1.5, unit='s')], {})
+        save_results(tmp_path / 'faster.json', [Measurement(name='time', value=0.5, unit='s')], {})
+
+        baseline = str(tmp_path / 'baseline.json')
+        assert main(['--results', str(tmp_path / 'slower.json'), '--baseline', baseline]) == 1
+        assert main(['--results', str(tmp_path / 'slower.json'), '--baseline', baseline, '--threshold', '0.6']) == 0
+        assert main(['--results', str(tmp_path / 'faster.json'), '--baseline', baseline]) == 0
+
+    def test_main_run(self, tmp_path):
+        assert main(['output', '--quick', '--repeat', '1', '--output', str(tmp_path / 'results.json')]) == 0
+
+        measurements, metadata = load_results(tmp_path / 'results.json')
+        assert {measurement.params['handler'] for measurement in measurements} >= {'raw', 'pandas-lists', 'file'}
+        assert all(measurement.value > 0 for measurement in measurements)
+        assert metadata['quick']
+
+    def test_main_unknown_benchmark(self):
+        with pytest.raises(SystemExit):
+            main(['unknown'])
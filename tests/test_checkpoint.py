@@ -0,0 +1,50 @@
+import pytest
+
+from brutus import Checkpoint, Cluster, Star, Precision
+
+
+class TestCheckpoint:
+    @pytest.fixture
+    def checkpoint(self):
+        return Checkpoint(cluster='test',
+                          identifiers=(3, 5),
+                          time='0.5000000000000000000000000001',
+                          state=('1', '0.1', '0.2', '0.3', '0.4', '0.5', '0.6',
+                                 '2', '1.1', '1.2', '1.3', '1.4', '1.5', '1.6'),
+                          precision=Precision(tolerance=1e-10, word_length=96),
+                          time_step=0.1)
+
+    def test_init_invalid_state(self):
+        with pytest.raises(ValueError):
+            Checkpoint(cluster='test', identifiers=(0,), time='0', state=('1', '2'), precision=Precision(), time_step=0.1)
+
+    def test_state_string(self, checkpoint):
+        assert checkpoint.state_string() == '0.5000000000000000000000000001 1 0.1 0.2 0.3 0.4 0.5 0.6 2 1.1 1.2 1.3 1.4 1.5 1.6'
+
+    def test_from_state_string(self, checkpoint):
+        cluster = checkpoint.to_cluster()
+        restored = Checkpoint.from_state_string(cluster, checkpoint.state_string(), checkpoint.precision, checkpoint.time_step)
+        assert restored == checkpoint
+
+    def test_to_cluster(self, checkpoint):
+        cluster = checkpoint.to_cluster()
+
+        assert cluster.name == 'test'
+        assert [star.identifier for star in cluster.stars] == [3, 5]
+        assert cluster.stars[1].mass == 2
+        assert cluster.stars[1].position == [1.1, 1.2, 1.3]
+        assert cluster.stars[1].velocity == [1.4, 1.5, 1.6]
+
+    def test_save_and_load(self, checkpoint, tmp_path):
+        path = tmp_path / 'test.checkpoint.json'
+        checkpoint.save(path)
+
+        assert Checkpoint.load(path) == checkpoint
+        assert not (tmp_path / 'test.checkpoint.json.tmp').exists()
+
+    def test_load_not_a_checkpoint(self, tmp_path):
+        path = tmp_path / 'other.json'
+        path.write_text('{}')
+
+        with pytest.raises(ValueError):
+            Checkpoint.load(path)
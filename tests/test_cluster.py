@@ -41,3 +41,58 @@ class TestCluster:
 
         with pytest.raises(ValueError):
             Cluster(name='test_cluster', stars=[star1, star2])
+
+    def test_cluster_to_arrays(self):
+        star1 = Star(identifier=4, position=(0, 1, 2), velocity=(3, 4, 5), mass=1)
+        star2 = Star(identifier=7, position=(6, 7, 8), velocity=(9, 10, 11), mass=2)
+        cluster = Cluster(name='test_cluster', stars=[star1, star2])
+
+        identifiers, masses, positions, velocities = cluster.to_arrays()
+
+        assert identifiers.tolist() == [4, 7]
+        assert masses.tolist() == [1, 2]
+        assert positions.tolist() == [[0, 1, 2], [6, 7, 8]]
+        assert velocities.tolist() == [[3, 4, 5], [9, 10, 11]]
+
+    def test_cluster_to_arrays_empty(self):
+        identifiers, masses, positions, velocities = Cluster(name='test_cluster').to_arrays()
+
+        assert identifiers.shape == (0,)
+        assert masses.shape == (0,)
+        assert positions.shape == (0, 3)
+        assert velocities.shape == (0, 3)
+
+    def test_cluster_from_arrays(self):
+        cluster = Cluster.from_arrays([4, 7], [1, 2], [[0, 1, 2], [6, 7, 8]], [[3, 4, 5], [9, 10, 11]],
+                                      name='test_cluster')
+
+        assert len(cluster.stars) == 2
+        assert cluster.stars[1] == Star(identifier=7, position=[6, 7, 8], velocity=[9, 10, 11], mass=2)
+        assert cluster.identifiers.tolist() == [4, 7]
+        assert cluster == Cluster(name='test_cluster', stars=[
+            Star(identifier=4, position=[0, 1, 2], velocity=[3, 4, 5], mass=1),
+            Star(identifier=7, position=[6, 7, 8], velocity=[9, 10, 11], mass=2),
+        ])
+
+        # The arrays are kept as they are, and cannot be changed
+        identifiers, masses, positions, velocities = cluster.to_arrays()
+        assert positions.tolist() == [[0, 1, 2], [6, 7, 8]]
+        with pytest.raises(ValueError):
+            positions[0, 0] = 1
+
+    def test_cluster_from_arrays_empty(self):
+        cluster = Cluster.from_arrays([], [], [], [], name='test_cluster')
+        assert cluster.stars == []
+        assert [array.shape for array in cluster.to_arrays()] == [(0,), (0,), (0, 3), (0, 3)]
+
+    @pytest.mark.parametrize('identifiers, masses, positions, velocities', [
+        ([0, 0], [1, 1], [[0, 0, 0]] * 2, [[0, 0, 0]] * 2),  # Same identifiers
+        ([0, 1], [1, 0], [[0, 0, 0]] * 2, [[0, 0, 0]] * 2),  # Mass not positive
+        ([0, 1], [1], [[0, 0, 0]] * 2, [[0, 0, 0]] * 2),  # Missing mass
+        ([0, 1], [1, 1], [[0, 0]] * 2, [[0, 0, 0]] * 2),  # 2D positions
+        ([0, 1], [1, 1], [[0, 0, 0]] * 2, [[0, 0, 0]]),  # Missing velocity
+        ([0.5, 1], [1, 1], [[0, 0, 0]] * 2, [[0, 0, 0]] * 2),  # Identifier not an integer
+    ])
+    def test_cluster_from_arrays_invalid(self, identifiers, masses, positions, velocities):
+        with pytest.raises(ValueError):
+            Cluster.from_arrays(identifiers, masses, positions, velocities, name='test_cluster')
@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+
+# Time that importing brutus may add to importing numpy and multiprocessing, which it cannot do without. Importing
+# pandas alone takes longer than that.
+IMPORT_TIME_BUDGET = 0.25
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+import numpy, multiprocessing, concurrent.futures.process, ctypes
+
+start = time.perf_counter()
+import brutus
+duration = time.perf_counter() - start
+
+from brutus.simulation import _simulation
+print(json.dumps({
+    'duration': duration,
+    'modules': [name for name in ('pandas', 'asyncio') if name in sys.modules],
+    'library_loaded': _simulation._interface is not None or _simulation.library_path.cache_info().currsize > 0,
+}))
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(script: str, path: str = ROOT) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-c', script], cwd=path, env={**os.environ, 'PYTHONPATH': path},
+                          capture_output=True, text=True)
+
+
+def test_import_is_lazy():
+    imported = json.loads(run_python(IMPORT_SCRIPT).stdout)
+    assert imported['modules'] == []
+    assert not imported['library_loaded']
+
+
+def test_import_time_budget():
+    # The fastest of a few imports, as the first one may read the files from disk
+    duration = min(json.loads(run_python(IMPORT_SCRIPT).stdout)['duration'] for _ in range(3))
+    assert duration < IMPORT_TIME_BUDGET
+
+
+def test_import_without_library(tmp_path):
+    shutil.copytree(os.path.join(ROOT, 'brutus'), tmp_path / 'brutus',
+                    ignore=shutil.ignore_patterns('libmain.*', '__pycache__'))
+
+    # The package imports, and only fails once a simulation loads the library
+    process = run_python('import brutus; brutus.BrutusIntegrator(time_step=0.1).evolve(1)', path=str(tmp_path))
+    assert 'FileNotFoundError: Could not find the Brutus compiled library file' in process.stderr
+
+
+def test_pandas_output_imports_pandas():
+    process = run_python('''
+import brutus
+cluster = brutus.Cluster(name='test', stars=[brutus.Star(identifier=0, position=[0, 0, 0], velocity=[0, 0, 0], mass=1)])
+integrator = brutus.BrutusIntegrator(time_step=0.1, backend='threads')
+integrator.add_cluster(cluster, output_handler=brutus.PandasOutput(cluster, layout='wide'))
+result, = integrator.evolve(0.2)
+print(type(result).__name__, len(result))
+''')
+    assert process.stdout.split() == ['DataFrame', '3']
@@ -1,7 +1,56 @@
 import pytest
 import os.path
 
-from brutus import BaseOutput, RawOutput, PandasOutput, FileOutput, Star, Cluster
+import numpy as np
+
+from brutus import BaseOutput, RawOutput, PandasOutput, FileOutput, NumpyOutput, Snapshot, Trajectory, Star, Cluster, Precision
+from brutus import MemmapOutput, open_trajectory, read_trajectory_metadata
+from brutus.output._output import snapshot_count
+
+
+class TestSnapshot:
+    @pytest.fixture
+    def buffer(self):
+        return np.array([0.5, 1, 3, 1, 2, 0, 1, 2, 3, 4, 5, 6, 2])
+
+    def test_size(self):
+        assert Snapshot.size(0) == 5
+        assert Snapshot.size(3) == 29
+
+    def test_views(self, buffer):
+        snapshot = Snapshot(buffer)
+
+        assert snapshot.time == 0.5
+        assert snapshot.star_count == 1
+        assert snapshot.total_energy == 3.0
+        assert snapshot.kinetic_energy == 1.0
+        assert snapshot.potential_energy == 2.0
+        assert snapshot.identifiers.tolist() == [0]
+        assert snapshot.positions.tolist() == [[1, 2, 3]]
+        assert snapshot.velocities.tolist() == [[4, 5, 6]]
+        assert snapshot.masses.tolist() == [2]
+        assert snapshot.states.shape == (1, 7)
+
+    def test_views_share_buffer(self, buffer):
+        snapshot = Snapshot(buffer)
+        buffer[6] = 10
+
+        assert snapshot.positions[0, 0] == 10
+
+    def test_copy(self, buffer):
+        snapshot = Snapshot(buffer).copy()
+        buffer[6] = 10
+
+        assert snapshot.positions[0, 0] == 1
+
+    def test_from_line(self, buffer):
+        snapshot = Snapshot.from_line(Snapshot(buffer).to_line())
+
+        assert snapshot.buffer.tolist() == buffer.tolist()
+
+    def test_to_line(self, buffer):
+        assert Snapshot(buffer).to_line() == \
+            '0.500000,1,0,1.000000,2.000000,3.000000,4.000000,5.000000,6.000000,2.000000,3.000000,1.000000,2.000000'
 
 
 class TestBaseOutput:
@@ -24,6 +73,13 @@ class TestBaseOutput:
         with pytest.raises(NotImplementedError):
             output.result()
 
+    def test_receive_snapshot_adapter(self):
+        output = RawOutput('cluster')
+        snapshot = Snapshot(np.array([0, 1, 3, 3, 3, 0, 0, 0, 0, 1, 1, 1, 2]))
+        output.receive_snapshot(snapshot)
+
+        assert output.data == [snapshot.to_line()]
+
 
 class TestRawOutput:
     @pytest.fixture
@@ -127,6 +183,29 @@ class TestPandasOutput:
         assert data['kinetic_energy'] == 3.0
         assert data['potential_energy'] == 3.0
     
+    def test_receive_snapshot(self, cluster):
+        output = PandasOutput(cluster)
+        output.receive_snapshot(Snapshot(np.array([0.5, 1, 3, 1, 2, 0, 0.1234567, 0, 0, 1, 1, 1, 2])))
+
+        data = output.data[0]
+
+        assert data['time'] == 0.5
+        assert data['star_count'] == 1
+        assert data['star_0_pos'] == [0.1234567, 0.0, 0.0]
+        assert data['star_0_vel'] == [1.0, 1.0, 1.0]
+        assert data['star_0_mass'] == 2.0
+        assert data['total_energy'] == 3.0
+        assert data['kinetic_energy'] == 1.0
+        assert data['potential_energy'] == 2.0
+
+    def test_receive_snapshot_matches_output_line(self, cluster, line):
+        snapshot_output = PandasOutput(cluster)
+        snapshot_output.receive_snapshot(Snapshot(np.array([0, 1, 3, 3, 3, 0, 0, 0, 0, 1, 1, 1, 2])))
+        line_output = PandasOutput(cluster)
+        line_output.receive_output_line(line)
+
+        assert snapshot_output.data == line_output.data
+
     def test_finalize(self, cluster, line):
         output = PandasOutput(cluster)
         output.receive_output_line(line)
@@ -150,6 +229,177 @@ class TestPandasOutput:
         assert output.result().iloc[0]['potential_energy'] == 3.0
 
 
+class TestPandasOutputVectorized:
+    @pytest.fixture
+    def cluster(self):
+        return Cluster(name='test', stars=[
+            Star(identifier=0, position=(0, 0, 0), velocity=(1, 1, 1), mass=1),
+            Star(identifier=4, position=(1, 0, 0), velocity=(0, 1, 0), mass=1),
+        ])
+
+    @pytest.fixture
+    def lines(self):
+        return [
+            "0,2,0,0,0,0,1,1,1,2,4,1,0,0,0,1,0,3,-1,1,-2",
+            "0.5,2,0,0.5,0,0,1,1,1,2,4,1.5,0,0,0,1,0,3,-1.5,1,-2.5",
+        ]
+
+    def test_invalid_layout(self, cluster):
+        with pytest.raises(ValueError):
+            PandasOutput(cluster, layout='columns')
+
+    def test_receive_output_line_buffers_lines(self, cluster, lines):
+        output = PandasOutput(cluster, layout='wide')
+        output.receive_output_line(lines[0])
+
+        assert output.lines == [lines[0]]
+        assert output.data == []
+
+    def test_wide(self, cluster, lines):
+        output = PandasOutput(cluster, layout='wide')
+        for line in lines:
+            output.receive_output_line(line)
+        output.finalize()
+        df = output.result()
+
+        assert df.shape == (2, 5 + 2 * 7)
+        assert df['time'].tolist() == [0, 0.5]
+        assert df['star_count'].tolist() == [2, 2]
+        assert df['star_0_x'].tolist() == [0, 0.5]
+        assert df['star_4_x'].tolist() == [1, 1.5]
+        assert df['star_4_vy'].tolist() == [1, 1]
+        assert df['star_4_mass'].tolist() == [3, 3]
+        assert df['total_energy'].tolist() == [-1, -1.5]
+        assert df['potential_energy'].tolist() == [-2, -2.5]
+        assert all(df[column].dtype == np.float64 for column in df.columns if column != 'star_count')
+
+    def test_long(self, cluster, lines):
+        output = PandasOutput(cluster, layout='long')
+        for line in lines:
+            output.receive_output_line(line)
+        output.finalize()
+        df = output.result()
+
+        assert df.shape == (4, 12)
+        assert df['time'].tolist() == [0, 0, 0.5, 0.5]
+        assert df['identifier'].tolist() == [0, 4, 0, 4]
+        assert df['x'].tolist() == [0, 1, 0.5, 1.5]
+        assert df['mass'].tolist() == [2, 3, 2, 3]
+        assert df['kinetic_energy'].tolist() == [1, 1, 1, 1]
+
+    def test_receive_snapshot_matches_output_lines(self, cluster, lines):
+        for layout in ('wide', 'long'):
+            snapshot_output = PandasOutput(cluster, layout=layout)
+            line_output = PandasOutput(cluster, layout=layout)
+            for line in lines:
+                snapshot_output.receive_snapshot(Snapshot.from_line(line))
+                line_output.receive_output_line(line)
+            snapshot_output.finalize()
+            line_output.finalize()
+
+            assert snapshot_output.result().equals(line_output.result())
+
+    def test_empty(self, cluster):
+        output = PandasOutput(cluster, layout='wide')
+        output.finalize()
+
+        assert len(output.result()) == 0
+
+
+class TestNumpyOutput:
+    @pytest.fixture
+    def cluster(self):
+        return Cluster(name='test', stars=[
+            Star(identifier=3, position=(0, 0, 0), velocity=(1, 1, 1), mass=1),
+            Star(identifier=7, position=(1, 0, 0), velocity=(0, 1, 0), mass=1),
+        ])
+
+    @staticmethod
+    def snapshot(t):
+        return Snapshot(np.array([t, 2, -1, 1, -2,
+                                  3, t, 0, 0, 1, 1, 1, 1,
+                                  7, 1, t, 0, 0, 1, 0, 2]))
+
+    def test_init(self, cluster):
+        output = NumpyOutput(cluster)
+        assert output.cluster == cluster
+        assert output.count == 0
+        assert output.identifiers.tolist() == [3, 7]
+
+    def test_prepare_preallocates(self, cluster):
+        output = NumpyOutput(cluster)
+        output.prepare(1, 0.2, Precision())
+
+        assert output.states.shape == (6, 2, 7)
+        assert output.time.shape == (6,)
+
+    def test_receive_snapshot(self, cluster):
+        output = NumpyOutput(cluster)
+        output.prepare(1, 0.5, Precision())
+        states = output.states
+        output.receive_snapshot(self.snapshot(0.5))
+
+        assert output.states is states  # Written in place
+        assert output.count == 1
+        assert output.time[0] == 0.5
+        assert output.states[0, 0].tolist() == [0.5, 0, 0, 1, 1, 1, 1]
+        assert output.states[0, 1].tolist() == [1, 0.5, 0, 0, 1, 0, 2]
+
+    def test_receive_snapshot_grows(self, cluster):
+        output = NumpyOutput(cluster)
+        output.prepare(0.5, 0.5, Precision())
+        for i in range(5):
+            output.receive_snapshot(self.snapshot(i))
+        output.finalize()
+
+        assert output.result().time.tolist() == [0, 1, 2, 3, 4]
+
+    def test_receive_output_line(self, cluster):
+        output = NumpyOutput(cluster)
+        output.receive_output_line(self.snapshot(0.5).to_line())
+        output.finalize()
+
+        assert output.result().states[0, 1].tolist() == [1, 0.5, 0, 0, 1, 0, 2]
+
+    def test_result(self, cluster):
+        output = NumpyOutput(cluster)
+        output.prepare(1, 0.5, Precision())
+        for t in (0, 0.5, 1):
+            output.receive_snapshot(self.snapshot(t))
+        output.finalize()
+        result = output.result()
+
+        assert isinstance(result, Trajectory)
+        assert result.time.tolist() == [0, 0.5, 1]
+        assert result.identifiers.tolist() == [3, 7]
+        assert result.states.shape == (3, 2, 7)
+        assert result.states.dtype == np.float64
+        assert result.positions[:, 0, 0].tolist() == [0, 0.5, 1]
+        assert result.velocities.shape == (3, 2, 3)
+        assert result.masses.tolist() == [[1, 2]] * 3
+        assert result.star(7)[:, 1].tolist() == [0, 0.5, 1]
+        assert result.total_energy.tolist() == [-1] * 3
+        assert result.kinetic_energy.tolist() == [1] * 3
+        assert result.potential_energy.tolist() == [-2] * 3
+
+    def test_result_unknown_star(self, cluster):
+        output = NumpyOutput(cluster)
+        output.finalize()
+
+        with pytest.raises(KeyError):
+            output.result().star(0)
+
+    def test_result_before_finalize(self, cluster):
+        output = NumpyOutput(cluster)
+
+        with pytest.raises(ValueError):
+            output.result()
+
+    @pytest.mark.parametrize('time, time_step, count', [(1, 0.2, 6), (1, 0.3, 5), (0.2, 0.05, 5), (1, 1, 2), (1, 2, 2)])
+    def test_snapshot_count(self, time, time_step, count):
+        assert snapshot_count(time, time_step) == count
+
+
 class TestFileOutput:    
     @pytest.fixture
     def cluster(self):
@@ -164,33 +414,168 @@ class TestFileOutput:
     def test_init(self, cluster, tmp_path):
         output = FileOutput(cluster, tmp_path)
         assert output.cluster == cluster
+        assert output.path == os.path.join(tmp_path, 'test.csv')
+        assert output.file is None
+
+    def test_init_invalid_compression(self, cluster, tmp_path):
+        with pytest.raises(ValueError):
+            FileOutput(cluster, tmp_path, compression='zip')
+
+    def test_init_invalid_flush_size(self, cluster, tmp_path):
+        with pytest.raises(ValueError):
+            FileOutput(cluster, tmp_path, flush_size=0)
 
     def test_receive_output_line(self, cluster, line, tmp_path):
         output = FileOutput(cluster, tmp_path)
         output.receive_output_line(line)
 
-        assert output.data == [line]
+        assert output.buffer == [line]
+        assert os.path.exists(output.path)
 
-    def test_receive_output_line_multiple(self, cluster, line, tmp_path):
-        output = FileOutput(cluster, tmp_path)
-        output.receive_output_line(line)
-        output.receive_output_line(line)
+    def test_receive_output_line_flushes(self, cluster, line, tmp_path):
+        output = FileOutput(cluster, tmp_path, flush_size=2 * len(line))
+        for _ in range(5):
+            output.receive_output_line(line)
 
-        assert output.data == [line, line]
+        assert len(output.buffer) == 1
+        assert output.lines_written == 4
+        with open(output.path, 'r') as f:
+            assert f.read() == '\n'.join([line] * 4)
+
+    def test_memory_is_bounded(self, cluster, line, tmp_path):
+        output = FileOutput(cluster, tmp_path, flush_size=1000)
+        for _ in range(10000):
+            output.receive_output_line(line)
+            assert output.buffer_size < 1000 + len(line) + 1
 
     def test_finalize_and_result(self, cluster, line, tmp_path):
         output = FileOutput(cluster, tmp_path)
         output.receive_output_line(line)
         output.finalize()
 
-        assert output.data == [line]
+        assert output.buffer == []
         assert os.path.exists(output.path)
         
         with open(output.path, 'r') as f:
             assert f.read() == line
 
+    def test_finalize_multiple(self, cluster, line, tmp_path):
+        output = FileOutput(cluster, tmp_path)
+        output.receive_output_line(line)
+        output.receive_output_line(line)
+        output.finalize()
+
+        with open(output.path, 'r') as f:
+            assert f.read() == line + '\n' + line
+
+    def test_header(self, cluster, line, tmp_path):
+        output = FileOutput(cluster, tmp_path, header=True)
+        output.receive_output_line(line)
+        output.finalize()
+
+        with open(output.path, 'r') as f:
+            header, data = f.read().split('\n')
+
+        assert header == ('time,star_count,star_0_identifier,star_0_x,star_0_y,star_0_z,star_0_vx,star_0_vy,star_0_vz,'
+                          'star_0_mass,total_energy,kinetic_energy,potential_energy')
+        assert len(header.split(',')) == len(line.split(','))
+        assert data == line
+
+    @pytest.mark.parametrize('compression, module', [('gzip', 'gzip'), ('bz2', 'bz2'), ('lzma', 'lzma')])
+    def test_compression(self, cluster, line, tmp_path, compression, module):
+        output = FileOutput(cluster, tmp_path, compression=compression)
+        output.receive_output_line(line)
+        output.receive_output_line(line)
+        output.finalize()
+
+        assert output.path.endswith(FileOutput.COMPRESSIONS[compression])
+        with __import__(module).open(output.path, 'rt') as f:
+            assert f.read() == line + '\n' + line
+
     def test_result(self, cluster, line, tmp_path):
         output = FileOutput(cluster, tmp_path)
         output.receive_output_line(line)
         output.finalize()
         assert output.result() == None
+
+
+class TestMemmapOutput:
+    @pytest.fixture
+    def cluster(self):
+        return Cluster(name='test', stars=[
+            Star(identifier=4, position=(0, 0, 0), velocity=(1, 1, 1), mass=1),
+            Star(identifier=7, position=(1, 2, 3), velocity=(0, 0, 0), mass=2),
+        ])
+
+    @pytest.fixture
+    def line(self):
+        return "0.5,2,4,1,2,3,4,5,6,7,7,8,9,10,11,12,13,14,-1,0.5,-1.5"
+
+    def test_init(self, cluster, tmp_path):
+        output = MemmapOutput(cluster, tmp_path)
+        assert output.path == os.path.join(tmp_path, 'test.bin')
+        assert output.metadata_path == os.path.join(tmp_path, 'test.json')
+        assert output.metadata['star_identifiers'] == [4, 7]
+        assert output.file is None
+
+    def test_round_trip(self, cluster, line, tmp_path):
+        output = MemmapOutput(cluster, tmp_path)
+        output.prepare(1, 0.5, Precision(tolerance=1e-10, word_length=64))
+        output.receive_output_line(line)
+        output.receive_snapshot(Snapshot.from_line(line))
+        output.finalize()
+
+        trajectory = open_trajectory(output.result())
+        assert isinstance(trajectory.time, np.memmap) or isinstance(trajectory.time.base, np.memmap)
+        np.testing.assert_array_equal(trajectory.time, [0.5, 0.5])
+        np.testing.assert_array_equal(trajectory.identifiers, [4, 7])
+        np.testing.assert_array_equal(trajectory.states[1], [[1, 2, 3, 4, 5, 6, 7], [8, 9, 10, 11, 12, 13, 14]])
+        np.testing.assert_array_equal(trajectory.total_energy, [-1, -1])
+        np.testing.assert_array_equal(trajectory.kinetic_energy, [0.5, 0.5])
+        np.testing.assert_array_equal(trajectory.potential_energy, [-1.5, -1.5])
+        np.testing.assert_array_equal(trajectory.star(7)[:, :3], [[8, 9, 10], [8, 9, 10]])
+
+    def test_file_size(self, cluster, line, tmp_path):
+        output = MemmapOutput(cluster, tmp_path)
+        for _ in range(3):
+            output.receive_output_line(line)
+        output.finalize()
+
+        assert os.path.getsize(output.path) == 3 * (4 + 7 * 2) * 8
+
+    def test_metadata(self, cluster, line, tmp_path):
+        output = MemmapOutput(cluster, tmp_path)
+        output.prepare(1, 0.5, Precision(tolerance=1e-10, word_length=None))
+        output.receive_output_line(line)
+        output.finalize()
+
+        metadata = read_trajectory_metadata(output.path)
+        assert metadata['cluster'] == 'test'
+        assert metadata['star_identifiers'] == [4, 7]
+        assert metadata['snapshot_count'] == 1
+        assert metadata['end_time'] == 1
+        assert metadata['time_step'] == 0.5
+        assert metadata['precision'] == {'tolerance': 1e-10, 'word_length': None}
+
+    def test_interrupted(self, cluster, line, tmp_path):
+        output = MemmapOutput(cluster, tmp_path)
+        output.receive_output_line(line)
+        output.receive_output_line(line)
+        output.file.flush()
+
+        assert len(open_trajectory(output.metadata_path).time) == 2
+
+    def test_empty(self, cluster, tmp_path):
+        output = MemmapOutput(cluster, tmp_path)
+        output.finalize()
+
+        trajectory = open_trajectory(output.result())
+        assert trajectory.states.shape == (0, 2, 7)
+
+    def test_not_a_trajectory(self, tmp_path):
+        path = os.path.join(tmp_path, 'other.json')
+        with open(path, 'w') as f:
+            f.write('{}')
+
+        with pytest.raises(ValueError):
+            open_trajectory(path)
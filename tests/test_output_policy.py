@@ -0,0 +1,48 @@
+import pytest
+from brutus import OutputPolicy
+
+
+class TestOutputPolicy:
+    def test_output_policy_defaults(self):
+        policy = OutputPolicy()
+        assert policy.every == 1
+        assert policy.times is None
+        assert policy.stars is None
+        assert policy.energy_every == 1
+        assert policy.is_default
+
+    def test_output_policy_converts_sequences(self):
+        policy = OutputPolicy(times=[0, 0.5, 1], stars=[2, 0])
+        assert policy.times == (0.0, 0.5, 1.0)
+        assert policy.stars == (2, 0)
+        assert not policy.is_default
+        hash(policy)
+
+    @pytest.mark.parametrize('options', [
+        {'every': 0},
+        {'energy_every': -1},
+        {'times': [0.5, 0.5]},
+        {'times': [1, 0.5]},
+        {'times': [-1, 0]},
+        {'stars': []},
+        {'stars': [1, 1]},
+    ])
+    def test_output_policy_invalid(self, options):
+        with pytest.raises(ValueError):
+            OutputPolicy(**options)
+
+    def test_output_policy_log_spaced(self):
+        policy = OutputPolicy.log_spaced(0.01, 100, 5, energy_every=0)
+        assert policy.times == pytest.approx((0.01, 0.1, 1, 10, 100))
+        assert policy.times[-1] == 100
+        assert policy.energy_every == 0
+
+        with pytest.raises(ValueError):
+            OutputPolicy.log_spaced(0, 1, 5)
+
+    def test_output_policy_snapshot_count(self):
+        assert OutputPolicy().snapshot_count(0, 1, 0.2) == 6
+        assert OutputPolicy(every=2).snapshot_count(0, 1, 0.2) == 4  # 0, 0.4, 0.8 and the last step
+        assert OutputPolicy(every=5).snapshot_count(0, 1, 0.2) == 2
+        assert OutputPolicy(times=[0, 0.3, 2]).snapshot_count(0, 1, 0.2) == 2
+        assert OutputPolicy(times=[0, 0.3, 2]).snapshot_count(0.5, 1, 0.2) == 0
@@ -0,0 +1,35 @@
+import pytest
+from brutus import Precision
+
+
+class TestPrecision:
+    def test_precision_creation(self):
+        precision = Precision(tolerance=1e-6, word_length=64)
+        assert precision.tolerance == 1e-6
+        assert precision.word_length == 64
+
+    def test_precision_defaults(self):
+        precision = Precision()
+        assert precision.tolerance == 1e-11
+        assert precision.word_length == 128
+
+    def test_precision_derived_word_length(self):
+        precision = Precision(tolerance=1e-6, word_length=None)
+        assert precision.word_length is None
+
+    def test_precision_invalid_tolerance(self):
+        with pytest.raises(ValueError):
+            Precision(tolerance=0)
+
+        with pytest.raises(ValueError):
+            Precision(tolerance=-1e-6)
+
+        with pytest.raises(ValueError):
+            Precision(tolerance=1)
+
+    def test_precision_invalid_word_length(self):
+        with pytest.raises(ValueError):
+            Precision(word_length=0)
+
+        with pytest.raises(ValueError):
+            Precision(word_length=-64)
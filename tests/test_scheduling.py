@@ -0,0 +1,69 @@
+import pytest
+
+from brutus import Star, Cluster, Precision, BrutusIntegrator, NumpyOutput
+from brutus.simulation._scheduling import ScheduleReport, estimate_cost, schedule, word_length
+
+
+def make_cluster(name, star_count):
+    return Cluster(name=name, stars=[
+        Star(identifier=i, position=[i, i % 2, 0], velocity=[0, 0.1 * i, 0], mass=1) for i in range(star_count)
+    ])
+
+
+class TestScheduling:
+    def test_word_length(self):
+        assert word_length(Precision(tolerance=1e-10, word_length=64)) == 64
+        assert word_length(Precision(tolerance=1e-10, word_length=None)) == 72
+
+    def test_estimate_cost_grows(self):
+        precision = Precision()
+        cost = estimate_cost(make_cluster('a', 3), 1, 0.1, precision)
+
+        assert estimate_cost(make_cluster('a', 6), 1, 0.1, precision) == pytest.approx(4 * cost)
+        assert estimate_cost(make_cluster('a', 3), 2, 0.1, precision) > cost
+        assert estimate_cost(make_cluster('a', 3), 1, 0.1, Precision(word_length=256)) > cost
+        assert estimate_cost(make_cluster('a', 3), 1, 0.1, Precision(tolerance=1e-20)) > cost
+
+    def test_schedule_longest_first(self):
+        costs = [1, 100, 5, 50, 1, 1]
+        chunks = schedule(costs, workers=2)
+
+        assert sorted(index for chunk in chunks for index in chunk) == list(range(len(costs)))
+        assert chunks[0] == [1]
+        assert chunks[1] == [3]
+        order = [costs[index] for chunk in chunks for index in chunk]
+        assert order == sorted(costs, reverse=True)
+
+    def test_schedule_groups_cheap_tasks(self):
+        costs = [100] + [1] * 40
+        chunks = schedule(costs, workers=2)
+
+        assert chunks[0] == [0]
+        assert len(chunks) < len(costs)
+        assert all(sum(costs[index] for index in chunk) <= 140 / 8 for chunk in chunks[1:])
+
+    def test_schedule_empty(self):
+        assert schedule([], workers=4) == []
+
+    def test_report(self):
+        report = ScheduleReport(workers=2, costs=(1, 1, 1), durations=(1.0, 2.0, 3.0), chunks=((2,), (1,), (0,)), makespan=4.0)
+
+        assert report.ideal_makespan == 3.0
+        assert report.efficiency == 0.75
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_evolve_keeps_order(self, backend):
+        clusters = [make_cluster('small', 2), make_cluster('large', 5), make_cluster('medium', 3)]
+
+        integrator = BrutusIntegrator(time_step=0.1, workers=2, backend=backend)
+        for cluster in clusters:
+            integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        results = integrator.evolve(0.2)
+
+        assert [result.states.shape[1] for result in results] == [2, 5, 3]
+
+        report = integrator.schedule_report
+        assert report.chunks[0] == (1,)
+        assert len(report.durations) == 3
+        assert all(duration > 0 for duration in report.durations)
+        assert report.makespan > 0
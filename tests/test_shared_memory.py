@@ -0,0 +1,57 @@
+import pytest
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from brutus import Trajectory
+from brutus.simulation._shared_memory import SharedResult, share, attach
+
+
+class TestSharedMemory:
+    @pytest.fixture
+    def trajectory(self):
+        return Trajectory(time=np.array([0, 0.5]),
+                          identifiers=np.array([3, 5]),
+                          states=np.arange(28, dtype=np.float64).reshape(2, 2, 7),
+                          total_energy=np.array([-1, -1.5]),
+                          kinetic_energy=np.array([0.5, 0.25]),
+                          potential_energy=np.array([-1.5, -1.75]))
+
+    def test_trajectory_round_trip(self, trajectory):
+        shared = share(trajectory)
+        assert isinstance(shared, SharedResult)
+        assert shared.kind == 'trajectory'
+
+        result = attach(shared)
+        for field in ('time', 'identifiers', 'states', 'total_energy', 'kinetic_energy', 'potential_energy'):
+            np.testing.assert_array_equal(getattr(result, field), getattr(trajectory, field))
+            assert getattr(result, field).dtype == getattr(trajectory, field).dtype
+
+    def test_dataframe_round_trip(self):
+        df = pd.DataFrame({'time': [0.0, 0.5, 1.0], 'star_count': [2, 2, 2]})
+        shared = share(df)
+        assert shared.kind == 'dataframe'
+
+        result = attach(shared)
+        pd.testing.assert_frame_equal(result, df)
+
+    def test_arrays_share_one_block(self, trajectory):
+        result = attach(share(trajectory))
+        assert np.shares_memory(result.time.base, result.states.base)
+
+    def test_block_is_unlinked(self, trajectory):
+        shared = share(trajectory)
+        attach(shared)
+
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=shared.block)
+
+    @pytest.mark.parametrize('result', [
+        None,
+        ['0,1,2'],
+        pd.DataFrame({'time': [0.0], 'positions': [[1, 2, 3]]}),
+        pd.DataFrame({'time': [0.0]}, index=[4]),
+    ])
+    def test_unsupported_results_are_unchanged(self, result):
+        assert share(result) is result
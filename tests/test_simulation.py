@@ -1,5 +1,53 @@
+import asyncio
+import ctypes
+import os
+import threading
+import time as timer
+
+import numpy as np
+import pandas as pd
 import pytest
-from brutus import Star, Cluster, BrutusIntegrator, PandasOutput
+from brutus import Star, Cluster, BrutusIntegrator, PandasOutput, RawOutput, NumpyOutput, FileOutput, Snapshot, Precision
+from brutus import BaseOutput, Checkpoint, OutputPolicy, SimulationReport, StoppingConditions, StopReason, MemmapOutput, open_trajectory, SnapshotEvent, ClusterFinished
+from brutus import PerformanceCounters, StepTrace, EnsembleResult, Trajectory, ResultCache
+from brutus.output._output import snapshot_count
+from brutus.simulation._simulation import BrutusInterface, STATUS_ABORTED, get_interface
+from brutus.simulation._cache import _CachedRun
+
+
+class FailingOutput(NumpyOutput):
+    def receive_snapshot(self, snapshot):
+        raise ValueError('Failed')
+
+
+class WorkerOutput(BaseOutput):
+    """Returns the process and library interface that ran the simulation."""
+    def receive_snapshot(self, snapshot):
+        pass
+
+    def finalize(self):
+        pass
+
+    def result(self):
+        return os.getpid(), id(get_interface())
+
+
+class CheckpointWatcher(BaseOutput):
+    """Returns the time of the checkpoint file at each step, while the simulation runs."""
+    def __init__(self, cluster, path):
+        super().__init__(cluster)
+        self.path = path
+        self.times = []
+
+    def receive_snapshot(self, snapshot):
+        if os.path.exists(self.path):
+            self.times.append(float(Checkpoint.load(self.path).time))
+
+    def finalize(self):
+        pass
+
+    def result(self):
+        return self.times
 
 
 class TestSimulation:
@@ -17,6 +65,11 @@ class TestSimulation:
         assert integrator.bulirsch_stoer_tolerance == 1e-11
         assert integrator.word_length == 128
         assert integrator.workers == 1
+        assert integrator.backend == 'processes'
+
+    def test_simulation_init_invalid_backend(self):
+        with pytest.raises(ValueError):
+            BrutusIntegrator(time_step=0.2, backend='gpu')
     
     def test_simulation_add_cluster(self, cluster):
         integrator = BrutusIntegrator(time_step=0.2)
@@ -92,3 +145,1010 @@ class TestSimulation:
         assert 'total_energy' in result.columns
         assert 'kinetic_energy' in result.columns
         assert 'potential_energy' in result.columns
+
+    def test_snapshot_callback_matches_output_lines(self, cluster):
+        interface = BrutusInterface()
+
+        lines = []
+        line_callback = interface.line_callback_t(lambda line: lines.append(line.decode()) or 0)
+
+        handle = interface.init_cluster()
+        for star in cluster.stars:
+            interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+        interface.evolve(handle, 1, 0.2, line_callback)
+        interface.cleanup(handle)
+
+        snapshots = []
+        buffer = np.zeros(Snapshot.size(len(cluster.stars)))
+        snapshot_callback = interface.snapshot_callback_t(lambda: snapshots.append(Snapshot(buffer).copy()) or 0)
+
+        handle = interface.init_cluster()
+        for star in cluster.stars:
+            interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+        interface.evolve_snapshots(handle, 1, 0.2, buffer, snapshot_callback)
+        interface.cleanup(handle)
+
+        assert len(snapshots) == 6
+        assert [snapshot.to_line() for snapshot in snapshots] == lines
+        assert snapshots[-1].time == 1.0
+        assert snapshots[-1].identifiers.tolist() == [0, 1, 2]
+
+    def test_simulation_evolve_raw_output(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.2)
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+        result = integrator.evolve(1)[0]
+
+        assert len(result) == 6
+        assert result[0].split(',')[:3] == ['0.000000', '3', '0']
+
+    def test_interface_independent_handles(self, cluster):
+        interface = BrutusInterface()
+        handles = [interface.init_cluster(), interface.init_cluster()]
+
+        for handle, stars in zip(handles, [cluster.stars, cluster.stars[:2]]):
+            for star in stars:
+                interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+
+        counts = []
+        for handle in handles:
+            buffer = np.zeros(Snapshot.size(3))
+            callback = interface.snapshot_callback_t(lambda: counts.append(int(buffer[1])) or 0)
+            interface.evolve_snapshots(handle, 0.2, 0.2, buffer, callback)
+            interface.cleanup(handle)
+
+        assert counts == [3, 3, 2, 2]
+
+    def test_simulation_evolve_threads_backend(self, cluster):
+        processes = BrutusIntegrator(time_step=0.2)
+        threads = BrutusIntegrator(time_step=0.2, workers=2, backend='threads')
+        for integrator in (processes, threads):
+            integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+            integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+
+        expected = processes.evolve(1)
+        results = threads.evolve(1)
+
+        assert len(results) == 2
+        assert results == expected
+
+    def test_simulation_precision_default(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.2, bulirsch_stoer_tolerance=1e-8, word_length=None)
+        assert integrator.precision == Precision(tolerance=1e-8, word_length=None)
+
+    def test_simulation_add_cluster_precision(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.2)
+        integrator.add_cluster(cluster, precision=Precision(tolerance=1e-6, word_length=64))
+        integrator.add_cluster(cluster)
+
+        assert integrator.precisions == [Precision(tolerance=1e-6, word_length=64), None]
+
+    def test_simulation_add_cluster_precision_overrides_default(self, cluster, monkeypatch):
+        received = []
+        monkeypatch.setattr(BrutusInterface, 'set_precision', lambda self, handle, precision: received.append(precision))
+
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads')
+        integrator.add_cluster(cluster, precision=Precision(tolerance=1e-6, word_length=64))
+        integrator.add_cluster(cluster)
+        integrator.evolve(0.2)
+
+        # Clusters are started in order of estimated cost, not in the order they were added
+        assert set(received) == {Precision(tolerance=1e-6, word_length=64), integrator.precision}
+
+    def test_interface_state_arrays(self, cluster):
+        interface = BrutusInterface()
+        handle = interface.init_cluster()
+        for star in cluster.stars:
+            interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+
+        _, masses, positions, velocities = cluster.to_arrays()
+        initial = interface.get_state_arrays(handle)
+        assert [array.tolist() for array in initial] == [masses.tolist(), positions.tolist(), velocities.tolist()]
+
+        buffer = np.zeros(Snapshot.size(3))
+        snapshots = []
+        callback = interface.snapshot_callback_t(lambda: snapshots.append(Snapshot(buffer).copy()) or 0)
+        interface.evolve_snapshots(handle, 0.4, 0.2, buffer, callback)
+
+        # After evolving, the arrays hold the state reached, which is also the last snapshot
+        masses, positions, velocities = interface.get_state_arrays(handle)
+        states = snapshots[-1].states
+        assert masses.tolist() == states[:, 6].tolist()
+        assert positions.tolist() == states[:, 0:3].tolist()
+        assert velocities.tolist() == states[:, 3:6].tolist()
+        interface.cleanup(handle)
+
+    def test_interface_add_stars(self, cluster):
+        interface = BrutusInterface()
+        handles = [interface.init_cluster(), interface.init_cluster()]
+        for star in cluster.stars:
+            interface.add_star(handles[0], star.identifier, star.mass, star.position, star.velocity)
+        interface.add_stars(handles[1], *cluster.to_arrays())
+
+        assert interface.get_state(handles[1]) == interface.get_state(handles[0])
+        with pytest.raises(ValueError):
+            interface.add_stars(handles[1], [0], [1], [0, 0, 0], [0, 0, 0])
+        for handle in handles:
+            interface.cleanup(handle)
+
+    def test_simulation_cluster_from_arrays(self, cluster):
+        results = []
+        for source in [cluster, Cluster.from_arrays(*cluster.to_arrays(), name='test')]:
+            integrator = BrutusIntegrator(time_step=0.2, backend='threads',
+                                          output_policy=OutputPolicy(stars=(2, 0)))
+            integrator.add_cluster(source, output_handler=NumpyOutput(source))
+            results.extend(integrator.evolve(0.4))
+
+        assert results[0].identifiers.tolist() == results[1].identifiers.tolist() == [2, 0]
+        assert results[0].states.tolist() == results[1].states.tolist()
+
+    def test_interface_set_state_arrays(self, cluster):
+        interface = BrutusInterface()
+        handles = [interface.init_cluster(), interface.init_cluster()]
+        for handle in handles:
+            interface.set_precision(handle, Precision())
+            for star in cluster.stars:
+                interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+
+        # Evolving the first cluster to t = 0.2, then restarting the second one from its state as arrays
+        buffer = np.zeros(Snapshot.size(3))
+        callback = interface.snapshot_callback_t(lambda: 0)
+        interface.evolve_snapshots(handles[0], 0.2, 0.2, buffer, callback)
+        arrays = interface.get_state_arrays(handles[0])
+        interface.set_state_arrays(handles[1], 0.2, *arrays)
+
+        assert interface.get_state(handles[1]).split()[0] == interface.get_state(handles[0]).split()[0]
+        assert [array.tolist() for array in interface.get_state_arrays(handles[1])] == \
+            [array.tolist() for array in arrays]
+
+        times = []
+        callback = interface.snapshot_callback_t(lambda: times.append(buffer[0]) or 0)
+        interface.evolve_snapshots(handles[1], 0.4, 0.2, buffer, callback)
+        assert times == [0.2, 0.4]
+
+        with pytest.raises(ValueError):
+            interface.set_state_arrays(handles[1], 0, arrays[0][:2], arrays[1], arrays[2])
+
+        for handle in handles:
+            interface.cleanup(handle)
+
+    @pytest.mark.parametrize('precision, word_length', [
+        (Precision(tolerance=1e-11, word_length=128), 128),
+        (Precision(tolerance=1e-6, word_length=None), 4 * 6 + 32),
+        (Precision(tolerance=1e-10, word_length=None), 4 * 10 + 32),
+    ])
+    def test_interface_word_length(self, precision, word_length):
+        interface = BrutusInterface()
+        handle = interface.init_cluster()
+        interface.set_precision(handle, precision)
+
+        assert interface.get_word_length(handle) == word_length
+        interface.cleanup(handle)
+
+    @pytest.mark.parametrize('precision', [
+        Precision(),
+        Precision(tolerance=1e-10, word_length=88),
+        Precision(tolerance=1e-6, word_length=None),
+    ])
+    @pytest.mark.parametrize('time, time_step, snapshots', [(0.2, 0.05, 5), (0.3, 0.1, 4), (0.3, 0.2, 3)])
+    def test_simulation_evolve_non_representable_end_time(self, cluster, precision, time, time_step, snapshots):
+        integrator = BrutusIntegrator(time_step=time_step, backend='threads')
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster), precision=precision)
+        result = integrator.evolve(time)[0]
+
+        assert len(result) == snapshots
+        assert float(result[-1].split(',')[0]) == pytest.approx(time)
+
+    def test_simulation_text_handlers_use_library_lines(self, cluster, monkeypatch):
+        monkeypatch.setattr(Snapshot, 'to_line', lambda self: pytest.fail('Snapshot formatted in Python'))
+
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads')
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+        result = integrator.evolve(1)[0]
+
+        assert len(result) == 6
+
+    def test_simulation_pandas_output_uses_snapshots(self, cluster, monkeypatch):
+        monkeypatch.setattr(PandasOutput, 'receive_output_line', lambda self, line: pytest.fail('Output line parsed'))
+
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads')
+        integrator.add_cluster(cluster, output_handler=PandasOutput(cluster))
+        result = integrator.evolve(1)[0]
+
+        assert len(result) == 6
+        assert result.iloc[-1]['time'] == 1.0
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    @pytest.mark.parametrize('output_handler', [RawOutput, PandasOutput])
+    def test_simulation_evolve_twice(self, cluster, backend, output_handler):
+        integrator = BrutusIntegrator(time_step=0.1, backend=backend)
+        integrator.add_cluster(cluster, output_handler=output_handler(cluster))
+
+        first = integrator.evolve(0.2)[0]
+        second = integrator.evolve(0.2)[0]
+
+        assert len(first) == 3
+        assert len(second) == 3
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_not_converged(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.2, bulirsch_stoer_tolerance=1e-40, word_length=32, backend=backend)
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+
+        with pytest.raises(RuntimeError):
+            integrator.evolve(0.2)
+
+    @pytest.mark.parametrize('time, time_step', [(1, 0.2), (1, 0.3), (0.2, 0.05)])
+    def test_simulation_evolve_numpy_output(self, cluster, time, time_step):
+        integrator = BrutusIntegrator(time_step=time_step, backend='threads')
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        result = integrator.evolve(time)[0]
+
+        assert len(result.time) == snapshot_count(time, time_step)
+        assert result.time[-1] == time
+        assert result.states.shape == (snapshot_count(time, time_step), 3, 7)
+        assert result.states[0, 1].tolist() == [1, 0, 0, 0, 1, 0, 1]
+
+    def test_simulation_evolve_pandas_output_wide(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads')
+        integrator.add_cluster(cluster, output_handler=PandasOutput(cluster, layout='wide'))
+        result = integrator.evolve(1)[0]
+
+        assert len(result) == 6
+        assert result['star_2_y'].iloc[0] == 1.0
+        assert result['star_2_vz'].dtype == np.float64
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_evolve_file_output(self, cluster, backend, tmp_path):
+        integrator = BrutusIntegrator(time_step=0.2, backend=backend)
+        integrator.add_cluster(cluster, output_handler=FileOutput(cluster, tmp_path, compression='gzip', header=True))
+        integrator.evolve(1)
+
+        import gzip
+        with gzip.open(tmp_path / 'test.csv.gz', 'rt') as f:
+            lines = f.read().split('\n')
+
+        assert len(lines) == 7
+        assert lines[0].startswith('time,star_count,')
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_evolve_memmap_output(self, cluster, backend, tmp_path):
+        integrator = BrutusIntegrator(time_step=0.2, backend=backend)
+        integrator.add_cluster(cluster, output_handler=MemmapOutput(cluster, tmp_path))
+        path = integrator.evolve(1)[0]
+
+        trajectory = open_trajectory(path)
+        assert len(trajectory.time) == 6
+        assert trajectory.time[-1] == 1
+        assert trajectory.states[0, 1].tolist() == [1, 0, 0, 0, 1, 0, 1]
+
+    @pytest.mark.parametrize('output_handler', [NumpyOutput, lambda cluster: PandasOutput(cluster, layout='wide'), RawOutput])
+    def test_simulation_evolve_shared_memory(self, cluster, output_handler):
+        expected = BrutusIntegrator(time_step=0.2)
+        expected.add_cluster(cluster, output_handler=output_handler(cluster))
+
+        integrator = BrutusIntegrator(time_step=0.2, shared_memory=True)
+        integrator.add_cluster(cluster, output_handler=output_handler(cluster))
+
+        result, = integrator.evolve(1)
+        expected_result, = expected.evolve(1)
+
+        if isinstance(result, pd.DataFrame):
+            pd.testing.assert_frame_equal(result, expected_result)
+        elif isinstance(result, list):
+            assert result == expected_result
+        else:
+            np.testing.assert_array_equal(result.states, expected_result.states)
+            np.testing.assert_array_equal(result.time, expected_result.time)
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_iter_evolve(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.2, workers=2, backend=backend)
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+        integrator.add_cluster(cluster)
+
+        events = list(integrator.iter_evolve(1, queue_size=2))
+
+        finished = [event for event in events if isinstance(event, ClusterFinished)]
+        assert sorted(event.index for event in finished) == [0, 1, 2]
+
+        for index in range(3):
+            snapshots = [event.snapshot for event in events if isinstance(event, SnapshotEvent) and event.index == index]
+            assert [snapshot.time for snapshot in snapshots] == pytest.approx([0, 0.2, 0.4, 0.6, 0.8, 1])
+            assert snapshots[0].positions[1].tolist() == [1, 0, 0]
+            # The completion event comes after the last snapshot of its cluster
+            position = next(i for i, event in enumerate(events) if isinstance(event, ClusterFinished) and event.index == index)
+            assert all(not isinstance(event, SnapshotEvent) or event.index != index for event in events[position:])
+
+        results = {event.index: event.result for event in finished}
+        assert len(results[0].time) == 6
+        assert len(results[1]) == 6
+        assert results[2] is None
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_iter_evolve_stop_early(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.01, backend=backend)
+        integrator.add_cluster(cluster)
+
+        events = integrator.iter_evolve(1, queue_size=1)
+        event = next(events)
+        events.close()
+
+        assert event.snapshot.time == 0
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_iter_evolve_not_converged(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.2, bulirsch_stoer_tolerance=1e-40, word_length=32, backend=backend)
+        integrator.add_cluster(cluster)
+
+        with pytest.raises(RuntimeError):
+            list(integrator.iter_evolve(1))
+
+    def test_interface_callback_aborts(self, cluster):
+        interface = BrutusInterface()
+        handle = interface.init_cluster()
+        for star in cluster.stars:
+            interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+
+        times = []
+        buffer = np.zeros(Snapshot.size(len(cluster.stars)))
+        callback = interface.snapshot_callback_t(lambda: times.append(buffer[0]) or int(len(times) == 2))
+        status = interface.evolve_snapshots(handle, 1, 0.2, buffer, callback)
+        interface.cleanup(handle)
+
+        assert status == STATUS_ABORTED
+        assert times == [0, 0.2]
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_output_handler_error(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.2, backend=backend)
+        integrator.add_cluster(cluster, output_handler=FailingOutput(cluster))
+
+        with pytest.raises(ValueError, match='Failed'):
+            integrator.evolve(1)
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_evolve_async(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.2, workers=2, backend=backend)
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+        integrator.add_cluster(cluster)
+
+        results = asyncio.run(integrator.evolve_async(1, max_concurrency=2))
+
+        assert len(results[0].time) == 6
+        assert results[1] == integrator.evolve(1)[1]
+        assert results[2] is None
+
+    def test_simulation_iter_evolve_async(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads')
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+
+        async def collect():
+            return [event async for event in integrator.iter_evolve_async(1)]
+
+        events = asyncio.run(collect())
+        assert sorted(event.index for event in events) == [0, 1]
+        assert all(isinstance(event, ClusterFinished) and len(event.result) == 6 for event in events)
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_evolve_async_cancel(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.001, backend=backend)
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster))
+        threads = set(threading.enumerate())
+
+        async def cancel():
+            task = asyncio.ensure_future(integrator.evolve_async(1000))
+
+            # The event loop keeps running while the simulation does
+            ticks = 0
+            while ticks < 5:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        start = timer.time()
+        asyncio.run(cancel())
+
+        # The simulation stops at its next step instead of running to the end
+        while set(threading.enumerate()) - threads and timer.time() - start < 10:
+            timer.sleep(0.01)
+        assert not set(threading.enumerate()) - threads
+        assert timer.time() - start < 10
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_persistent_pool(self, cluster, backend):
+        with BrutusIntegrator(time_step=0.2, backend=backend) as integrator:
+            assert integrator.pool is not None
+            integrator.add_cluster(cluster, output_handler=WorkerOutput(cluster))
+            first, = integrator.evolve(0.2)
+            second, = integrator.evolve(0.2)
+
+        assert integrator.pool is None
+        # The same worker, with the same library interface, ran both calls
+        assert first == second
+
+        third, = integrator.evolve(0.2)
+        if backend == 'processes':
+            assert third[0] != first[0]
+
+    def test_simulation_close_twice(self):
+        integrator = BrutusIntegrator(time_step=0.2)
+        integrator.open()
+        integrator.close()
+        integrator.close()
+        assert integrator.pool is None
+
+    def test_interface_is_cached(self):
+        assert get_interface() is get_interface()
+
+    @pytest.mark.parametrize('backend', ['processes', 'threads'])
+    def test_simulation_evolve_resume(self, cluster, backend):
+        expected = BrutusIntegrator(time_step=0.25, backend=backend)
+        expected.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        expected_result, = expected.evolve(1)
+
+        integrator = BrutusIntegrator(time_step=0.25, backend=backend)
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        integrator.evolve(0.5)
+        assert integrator.checkpoints[0].time == '0.5'
+
+        result, = integrator.evolve(1, resume=True)
+
+        # Continuing from the full precision state gives exactly the same trajectory
+        assert result.time.tolist() == [0.5, 0.75, 1]
+        np.testing.assert_array_equal(result.states, expected_result.states[2:])
+        assert integrator.checkpoints[0] == expected.checkpoints[0]
+
+    def test_simulation_evolve_without_resume_starts_over(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.25, backend='threads')
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        integrator.evolve(0.5)
+        result, = integrator.evolve(1)
+
+        assert result.time[0] == 0
+
+    def test_simulation_evolve_resume_to_reached_time(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.25, backend='threads')
+        integrator.add_cluster(cluster)
+        integrator.evolve(0.5)
+
+        with pytest.raises(ValueError):
+            integrator.evolve(0.5, resume=True)
+
+    def test_simulation_resume_checkpoint_file(self, cluster, tmp_path):
+        first = BrutusIntegrator(time_step=0.25, backend='threads', checkpoint_dir=tmp_path)
+        first.add_cluster(cluster)
+        first.evolve(0.5)
+
+        checkpoint = Checkpoint.load(tmp_path / 'test.checkpoint.json')
+        assert checkpoint == first.checkpoints[0]
+
+        integrator = BrutusIntegrator(time_step=0.25, backend='threads')
+        integrator.resume(checkpoint, output_handler=NumpyOutput(checkpoint.to_cluster()))
+        result, = integrator.evolve(1)
+
+        expected = BrutusIntegrator(time_step=0.25, backend='threads')
+        expected.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        expected_result, = expected.evolve(1)
+
+        np.testing.assert_array_equal(result.states, expected_result.states[2:])
+
+    def test_simulation_checkpoint_interval(self, cluster, tmp_path):
+        path = tmp_path / 'test.checkpoint.json'
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads', checkpoint_dir=tmp_path, checkpoint_interval=0.4)
+        integrator.add_cluster(cluster, output_handler=CheckpointWatcher(cluster, path))
+        seen, = integrator.evolve(1)
+
+        assert seen == pytest.approx([0.4, 0.4, 0.8])
+        assert Checkpoint.load(path).time == '1'
+
+    @pytest.mark.parametrize('options', [{'checkpoint_interval': 0, 'checkpoint_dir': '.'}, {'checkpoint_interval': 1}])
+    def test_simulation_invalid_checkpoint_options(self, options):
+        with pytest.raises(ValueError):
+            BrutusIntegrator(time_step=0.2, **options)
+
+    @pytest.mark.parametrize('backend', ['threads', 'processes'])
+    def test_simulation_output_every(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.1, backend=backend, output_policy=OutputPolicy(every=3))
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        result, = integrator.evolve(1)
+
+        expected = BrutusIntegrator(time_step=0.1, backend='threads')
+        expected.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        expected_result, = expected.evolve(1)
+
+        # Skipping outputs does not change the integration
+        assert result.time == pytest.approx([0, 0.3, 0.6, 0.9, 1])
+        np.testing.assert_array_equal(result.states, expected_result.states[[0, 3, 6, 9, 10]])
+
+    def test_simulation_output_times(self, cluster):
+        policy = OutputPolicy(times=[0.25, 0.5, 0.55, 3])
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads')
+        integrator.add_cluster(cluster, output_handler=RawOutput(cluster), output_policy=policy)
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster), output_policy=policy)
+        lines, result = integrator.evolve(1)
+
+        # The integrator stops exactly at the output times between steps
+        assert [float(line.split(',')[0]) for line in lines] == pytest.approx([0.25, 0.5, 0.55])
+        assert result.time.tolist() == [0.25, 0.5, 0.55]
+
+    def test_simulation_output_stars(self, cluster, tmp_path):
+        policy = OutputPolicy(stars=[2, 0], energy_every=2)
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads', output_policy=policy)
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        integrator.add_cluster(cluster, output_handler=PandasOutput(cluster, layout='wide'))
+        integrator.add_cluster(cluster, output_handler=FileOutput(cluster, tmp_path, header=True))
+        result, df, _ = integrator.evolve(1)
+
+        assert result.identifiers.tolist() == [2, 0]
+        assert result.states.shape == (6, 2, 7)
+        assert np.isnan(result.total_energy[1::2]).all()
+        assert not np.isnan(result.total_energy[0::2]).any()
+
+        assert 'star_1_x' not in df.columns
+        assert df['star_count'].tolist() == [2] * 6
+
+        header = (tmp_path / 'test.csv').read_text().splitlines()[0]
+        assert header.split(',')[2] == 'star_2_identifier'
+
+    def test_simulation_output_unknown_star(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.2)
+        with pytest.raises(ValueError):
+            integrator.add_cluster(cluster, output_policy=OutputPolicy(stars=[7]))
+
+    def test_simulation_output_memmap_subset(self, cluster, tmp_path):
+        integrator = BrutusIntegrator(time_step=0.2, backend='threads', output_policy=OutputPolicy(every=5, stars=[1]))
+        integrator.add_cluster(cluster, output_handler=MemmapOutput(cluster, tmp_path))
+        path, = integrator.evolve(1)
+
+        trajectory = open_trajectory(path)
+        assert trajectory.identifiers.tolist() == [1]
+        assert trajectory.time.tolist() == [0, 1]
+        assert trajectory.states.shape == (2, 1, 7)
+
+    @pytest.mark.parametrize('backend', ['threads', 'processes'])
+    def test_simulation_reports(self, backend):
+        # A circular binary keeps its separation and is in virial equilibrium
+        speed = 0.5 ** 0.5
+        binary = Cluster(name='binary', stars=[
+            Star(identifier=0, position=[0.5, 0, 0], velocity=[0, speed, 0], mass=1),
+            Star(identifier=1, position=[-0.5, 0, 0], velocity=[0, -speed, 0], mass=1),
+        ])
+        integrator = BrutusIntegrator(time_step=1, backend=backend, reports=True, output_policy=OutputPolicy(every=10))
+        integrator.add_cluster(binary)
+        integrator.evolve(3)
+
+        report, = integrator.reports
+        assert isinstance(report, SimulationReport)
+        assert report.steps > 3  # Every integrator step is covered, not only the outputs
+        assert report.max_energy_error < 1e-10
+        assert report.min_separation == pytest.approx(1)
+        assert 0 <= report.min_separation_time <= 3
+        assert report.virial_ratio == pytest.approx(1)
+        assert report.mean_virial_ratio == pytest.approx(1)
+
+    def test_simulation_reports_close_encounter(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads', reports=True)
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        result, = integrator.evolve(2)
+
+        report, = integrator.reports
+        distances = np.linalg.norm(result.positions[:, :, None] - result.positions[:, None, :], axis=-1)
+        closest_output = distances[distances > 0].min()
+
+        # The closest approach happens between two outputs
+        assert report.min_separation < closest_output
+        assert 0 < report.min_separation_time < 2
+
+    def test_simulation_reports_disabled(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads')
+        integrator.add_cluster(cluster)
+        integrator.evolve(1)
+        assert integrator.reports == [None]
+
+    def test_simulation_reports_events(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads', reports=True)
+        integrator.add_cluster(cluster)
+        finished = [event for event in integrator.iter_evolve(1) if isinstance(event, ClusterFinished)]
+        assert finished[0].report.steps > 0
+
+        asyncio.run(integrator.evolve_async(1))
+        assert integrator.reports[0] == finished[0].report
+
+    @pytest.mark.parametrize('backend', ['threads', 'processes'])
+    def test_simulation_counters(self, cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.5, backend=backend)
+        integrator.add_cluster(cluster)
+        integrator.evolve(1)
+
+        counters, = integrator.counters
+        assert isinstance(counters, PerformanceCounters)
+        assert counters.steps > 2  # The close encounter takes smaller steps than the time step
+        assert counters.force_evaluations > counters.steps
+        assert 2 <= counters.max_depth <= 32
+        assert 2 <= counters.mean_depth <= counters.max_depth
+        assert counters.integration_time > 0
+        assert counters.energy_time >= 0 and counters.output_time >= 0 and counters.diagnostics_time >= 0
+        assert counters.trace is None
+
+    def test_simulation_counters_trace(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads', trace=True)
+        integrator.add_cluster(cluster)
+        integrator.evolve(1)
+
+        counters, = integrator.counters
+        trace = counters.trace
+        assert isinstance(trace, StepTrace)
+        assert len(trace) == counters.steps
+        assert np.all(np.diff(trace.time) > 0)
+        assert trace.time[-1] == pytest.approx(1)
+        assert trace.time_step.sum() == pytest.approx(1)
+        assert trace.force_evaluations.sum() == counters.force_evaluations
+        assert trace.rejections.sum() == counters.rejections
+        assert trace.depth.max() == counters.max_depth
+
+    def test_simulation_counters_events(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads')
+        integrator.add_cluster(cluster)
+        finished = [event for event in integrator.iter_evolve(1) if isinstance(event, ClusterFinished)]
+        assert finished[0].counters.steps > 0
+
+        asyncio.run(integrator.evolve_async(1))
+        assert integrator.counters[0].steps == finished[0].counters.steps
+
+    def test_interface_counters(self, cluster):
+        interface = BrutusInterface()
+        handle = interface.init_cluster()
+        for star in cluster.stars:
+            interface.add_star(handle, star.identifier, star.mass, star.position, star.velocity)
+        interface.set_trace(handle, True)
+
+        buffer = np.zeros(Snapshot.size(3))
+        callback = interface.snapshot_callback_t(lambda: 0)
+        interface.evolve_snapshots(handle, 0.4, 0.2, buffer, callback)
+        counters = interface.get_counters(handle)
+        assert len(counters.trace) == counters.steps > 0
+
+        # The counters are those of the last evolve call
+        interface.set_trace(handle, False)
+        interface.evolve_snapshots(handle, 0.6, 0.2, buffer, callback)
+        last = interface.get_counters(handle)
+        assert last.trace is None
+        assert 0 < last.steps < counters.steps
+        interface.cleanup(handle)
+
+    @pytest.fixture
+    def escaping_cluster(self):
+        # A circular binary and a light star that leaves it at a speed well above the escape speed
+        speed = 0.5 ** 0.5
+        return Cluster(name='escape', stars=[
+            Star(identifier=0, position=[0.5, 0, 0], velocity=[0, speed, 0], mass=1),
+            Star(identifier=1, position=[-0.5, 0, 0], velocity=[0, -speed, 0], mass=1),
+            Star(identifier=2, position=[3, 0, 0], velocity=[3, 0, 0], mass=0.1),
+        ])
+
+    @pytest.mark.parametrize('backend', ['threads', 'processes'])
+    def test_simulation_stop_on_escape(self, escaping_cluster, backend):
+        integrator = BrutusIntegrator(time_step=0.5, backend=backend,
+                                      stopping_conditions=StoppingConditions(escape_radius=5))
+        integrator.add_cluster(escaping_cluster, output_handler=NumpyOutput(escaping_cluster))
+        result, = integrator.evolve(10)
+
+        assert integrator.stop_reasons == [StopReason.ESCAPE]
+        stop_time = float(integrator.checkpoints[0].time)
+        assert 0.5 < stop_time < 1
+
+        # The state the simulation stopped at is output last
+        assert result.time[-1] == pytest.approx(stop_time)
+        assert np.linalg.norm(result.positions[-1, 2]) > 5
+
+    def test_simulation_stop_on_encounter(self, cluster):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads',
+                                      stopping_conditions=StoppingConditions(encounter_distance=0.5))
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        result, = integrator.evolve(2)
+
+        assert integrator.stop_reasons == [StopReason.ENCOUNTER]
+        distances = np.linalg.norm(result.positions[-1, :, None] - result.positions[-1, None, :], axis=-1)
+        assert distances[np.triu_indices(3, 1)].min() < 0.5
+
+    @pytest.mark.parametrize('conditions, reason', [
+        (StoppingConditions(max_energy_error=1e-40), StopReason.ENERGY_ERROR),
+        (StoppingConditions(wall_time=1e-9), StopReason.WALL_TIME),
+        (StoppingConditions(escape_radius=100, encounter_distance=1e-6), StopReason.COMPLETED),
+    ])
+    def test_simulation_stop_reasons(self, cluster, conditions, reason):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads', stopping_conditions=conditions)
+        integrator.add_cluster(cluster)
+        integrator.evolve(1)
+
+        assert integrator.stop_reasons == [reason]
+        assert (float(integrator.checkpoints[0].time) == 1) == (reason == StopReason.COMPLETED)
+
+    def test_simulation_stop_reason_events(self, escaping_cluster):
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads',
+                                      stopping_conditions=StoppingConditions(escape_radius=5))
+        integrator.add_cluster(escaping_cluster)
+        finished = [event for event in integrator.iter_evolve(10) if isinstance(event, ClusterFinished)]
+        assert finished[0].stop_reason == StopReason.ESCAPE
+
+        asyncio.run(integrator.evolve_async(10))
+        assert integrator.stop_reasons == [StopReason.ESCAPE]
+
+    @pytest.mark.parametrize('backend', ['threads', 'processes'])
+    def test_simulation_force_threads(self, backend):
+        rng = np.random.default_rng(0)
+        stars = [Star(identifier=i, position=rng.normal(size=3).tolist(), velocity=(0.3 * rng.normal(size=3)).tolist(), mass=0.05)
+                 for i in range(20)]
+        cluster = Cluster(name='large', stars=stars)
+
+        states = {}
+        for threads in [None, 1, 3, 32]:
+            integrator = BrutusIntegrator(time_step=0.05, backend=backend, force_threads=threads)
+            integrator.add_cluster(cluster)
+            integrator.evolve(0.1)
+            states[threads] = integrator.checkpoints[0].state
+
+        # The partitioned loop gives exactly the same result whatever the number of threads
+        assert states[1] == states[3] == states[32]
+        np.testing.assert_allclose(np.array(states[None], dtype=float), np.array(states[1], dtype=float), rtol=1e-9, atol=1e-12)
+
+    def test_simulation_invalid_force_threads(self):
+        with pytest.raises(ValueError):
+            BrutusIntegrator(time_step=0.2, force_threads=0)
+
+
+class TestEnsemble:
+    @pytest.fixture
+    def systems(self):
+        rng = np.random.default_rng(0)
+        return np.ones((5, 3)), rng.normal(size=(5, 3, 3)), 0.3 * rng.normal(size=(5, 3, 3))
+
+    def cluster_trajectories(self, systems, time, **kwargs):
+        masses, positions, velocities = systems
+        integrator = BrutusIntegrator(time_step=0.1, backend='threads', **kwargs)
+        for system in range(len(masses)):
+            cluster = Cluster.from_arrays(np.arange(3), masses[system], positions[system], velocities[system],
+                                          name=f'system_{system}')
+            integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        return integrator.evolve(time)
+
+    @pytest.mark.parametrize('backend', ['threads', 'processes'])
+    def test_ensemble_matches_clusters(self, systems, backend):
+        integrator = BrutusIntegrator(time_step=0.1, backend=backend, workers=2)
+        integrator.add_ensemble(*systems, name='three_body', batch_size=2)
+        result, = integrator.evolve(0.2)
+
+        assert isinstance(result, EnsembleResult)
+        assert result.name == 'three_body'
+        assert len(result) == 5
+        assert result.time.tolist() == [0.2] * 5
+        assert result.identifiers.tolist() == [0, 1, 2]
+        assert result.stop_reasons.tolist() == [StopReason.COMPLETED] * 5
+        assert result.snapshots is None
+
+        # Each system is simulated exactly as a cluster would be
+        for system, trajectory in enumerate(self.cluster_trajectories(systems, 0.2)):
+            assert result.masses[system].tolist() == trajectory.masses[-1].tolist()
+            assert result.positions[system].tolist() == trajectory.positions[-1].tolist()
+            assert result.velocities[system].tolist() == trajectory.velocities[-1].tolist()
+
+    def test_ensemble_snapshots(self, systems):
+        integrator = BrutusIntegrator(time_step=0.1, backend='threads')
+        integrator.add_ensemble(*systems, snapshots=True)
+        integrator.add_ensemble(*systems, snapshots=True, output_policy=OutputPolicy(stars=(2, 0), energy_every=0))
+        result, selected = integrator.evolve(0.2)
+
+        snapshots = result.snapshots
+        assert snapshots.states.shape == (5, 3, 3, 7)
+        for system, trajectory in enumerate(self.cluster_trajectories(systems, 0.2)):
+            assert snapshots.time[system].tolist() == trajectory.time.tolist()
+            assert snapshots.states[system].tolist() == trajectory.states.tolist()
+            assert snapshots.total_energy[system].tolist() == trajectory.total_energy.tolist()
+
+        assert selected.snapshots.identifiers.tolist() == [2, 0]
+        assert selected.snapshots.star(0).tolist() == snapshots.states[:, :, 0].tolist()
+        assert np.isnan(selected.snapshots.total_energy).all()
+        # The final states still hold every star
+        assert selected.positions.tolist() == result.positions.tolist()
+
+    def test_ensemble_output_times(self, systems):
+        integrator = BrutusIntegrator(time_step=0.1, backend='threads')
+        integrator.add_ensemble(*systems)
+        integrator.add_ensemble(*systems, snapshots=True, output_policy=OutputPolicy(times=(0, 0.1)))
+        result, early_outputs = integrator.evolve(0.2)
+
+        # The final states are those at t = 0.2, even though the last output is at t = 0.1
+        assert early_outputs.snapshots.time[:, -1].tolist() == [0.1] * 5
+        assert early_outputs.positions.tolist() == result.positions.tolist()
+
+    def test_ensemble_stopping_conditions(self):
+        # Circular binaries, with a light star that escapes from the first one only
+        speed = 0.5 ** 0.5
+        masses = np.array([[1, 1, 0.1], [1, 1, 0.1]])
+        positions = np.array([[[0.5, 0, 0], [-0.5, 0, 0], [3, 0, 0]], [[0.5, 0, 0], [-0.5, 0, 0], [0, 50, 0]]])
+        velocities = np.array([[[0, speed, 0], [0, -speed, 0], [3, 0, 0]], [[0, speed, 0], [0, -speed, 0], [0, 0, 0]]])
+
+        integrator = BrutusIntegrator(time_step=0.5, backend='threads',
+                                      stopping_conditions=StoppingConditions(escape_radius=5))
+        integrator.add_ensemble(masses, positions, velocities, snapshots=True)
+        result, = integrator.evolve(2)
+
+        assert result.stop_reasons.tolist() == [StopReason.ESCAPE, StopReason.COMPLETED]
+        assert 0.5 < result.time[0] < 1
+        assert result.time[1] == 2
+        assert np.linalg.norm(result.positions[0, 2]) > 5
+
+        # The state the system stopped at is output last, and the outputs after it are NaN
+        time = result.snapshots.time[0]
+        assert time[2] == result.time[0]
+        assert np.isnan(time[3:]).all()
+
+    def test_ensemble_with_clusters(self):
+        masses, positions, velocities = np.ones((2, 2)), np.array([[[0, 0, 0], [1, 0, 0]]] * 2), np.zeros((2, 2, 3))
+        cluster = Cluster.from_arrays([0, 1], masses[0], positions[0], velocities[0], name='cluster')
+
+        integrator = BrutusIntegrator(time_step=0.1, backend='threads')
+        integrator.add_ensemble(masses, positions, velocities, identifiers=[4, 7])
+        integrator.add_cluster(cluster, output_handler=NumpyOutput(cluster))
+        trajectory, result = integrator.evolve(0.1)
+
+        # The results of the clusters come first, followed by those of the ensembles
+        assert isinstance(trajectory, Trajectory)
+        assert result.name == 'ensemble_0'
+        assert result.identifiers.tolist() == [4, 7]
+        assert result.positions[1].tolist() == trajectory.positions[-1].tolist()
+
+    @pytest.mark.parametrize('arrays', [
+        (np.ones(3), np.zeros((3, 3)), np.zeros((3, 3))),  # A single system
+        (np.ones((2, 3)), np.zeros((2, 2, 3)), np.zeros((2, 3, 3))),  # Missing star
+        (np.ones((2, 3)), np.zeros((2, 3, 3)), np.zeros((2, 3, 2))),  # 2D velocities
+        (np.zeros((2, 3)), np.zeros((2, 3, 3)), np.zeros((2, 3, 3))),  # Mass not positive
+    ])
+    def test_ensemble_invalid(self, arrays):
+        with pytest.raises(ValueError):
+            BrutusIntegrator(time_step=0.1).add_ensemble(*arrays)
+
+    def test_ensemble_invalid_settings(self, systems):
+        integrator = BrutusIntegrator(time_step=0.1)
+        with pytest.raises(ValueError):
+            integrator.add_ensemble(*systems, identifiers=[0, 0, 1])
+        with pytest.raises(ValueError):
+            integrator.add_ensemble(*systems, batch_size=0)
+        with pytest.raises(ValueError):
+            integrator.add_ensemble(*systems, snapshots=True, output_policy=OutputPolicy(stars=(3,)))
+
+    def test_ensemble_only_evolve(self, systems):
+        integrator = BrutusIntegrator(time_step=0.1, backend='threads')
+        integrator.add_ensemble(*systems)
+        with pytest.raises(ValueError):
+            next(integrator.iter_evolve(0.1))
+        with pytest.raises(ValueError):
+            asyncio.run(integrator.evolve_async(0.1))
+
+    def test_ensemble_not_converged(self, systems):
+        integrator = BrutusIntegrator(time_step=0.1, backend='threads')
+        integrator.add_ensemble(*systems, name='unstable', precision=Precision(tolerance=1e-40, word_length=32))
+        with pytest.raises(RuntimeError, match='system 0 of ensemble "unstable"'):
+            integrator.evolve(0.1)
+
+
+class TestCache:
+    @pytest.fixture
+    def clusters(self):
+        def cluster(name, offset=0.0):
+            return Cluster.from_arrays([0, 1, 2], [1, 1, 1], [[1 + offset, 0, 0], [-1, 0, 0], [0, 0.5, 0]],
+                                       [[0, 0.3, 0], [0, -0.3, 0], [0.1, 0, 0]], name=name)
+        return [cluster('a'), cluster('b'), cluster('c', offset=0.1), cluster('d')]
+
+    def evolve(self, clusters, output, time=1, **kwargs):
+        integrator = BrutusIntegrator(time_step=0.1, backend='threads', reports=True, **kwargs)
+        for cluster in clusters:
+            integrator.add_cluster(cluster, output_handler=output(cluster))
+        return integrator, integrator.evolve(time)
+
+    @pytest.mark.parametrize('output', [NumpyOutput, RawOutput])
+    def test_cache_replays_results(self, clusters, output, tmp_path):
+        reference, expected = self.evolve(clusters, output)
+        first, results = self.evolve(clusters, output, cache=tmp_path / 'cache')
+
+        # The duplicates of cluster a are replayed from its run, which is stored in the cache with that of cluster c
+        assert first.schedule_report.chunks in (((0, 2),), ((2, 0),), ((0,), (2,)), ((2,), (0,)))
+        assert [counters is None for counters in first.counters] == [False, True, False, True]
+        assert len(first.cache) == 2
+
+        second, cached = self.evolve(clusters, output, cache=first.cache)
+        assert second.schedule_report.chunks == ()
+        assert all(counters is None for counters in second.counters)
+
+        for integrator, values in [(first, results), (second, cached)]:
+            if output is NumpyOutput:
+                for result, expected_result in zip(values, expected):
+                    assert np.array_equal(result.time, expected_result.time)
+                    assert np.array_equal(result.states, expected_result.states)
+                    assert np.array_equal(result.total_energy, expected_result.total_energy)
+            else:
+                assert values == expected
+            assert integrator.checkpoints == reference.checkpoints
+            assert integrator.reports == reference.reports
+            assert integrator.stop_reasons == reference.stop_reasons
+
+    def test_cache_key_settings(self, clusters, tmp_path):
+        cache = ResultCache(tmp_path)
+        self.evolve(clusters[:1], NumpyOutput, cache=cache)
+        self.evolve(clusters[:1], NumpyOutput, time=2, cache=cache)
+        self.evolve(clusters[:1], NumpyOutput, cache=cache, bulirsch_stoer_tolerance=1e-10)
+        self.evolve(clusters[:1], NumpyOutput, cache=cache, output_policy=OutputPolicy(every=2))
+        assert len(cache) == 4
+
+        # Results that depend on the wall time are never cached
+        integrator, _ = self.evolve(clusters[:2], NumpyOutput, cache=cache,
+                                    stopping_conditions=StoppingConditions(wall_time=100))
+        assert len(cache) == 4
+        assert all(counters is not None for counters in integrator.counters)
+
+    def test_cache_output_policy(self, clusters, tmp_path):
+        policy = OutputPolicy(every=3, stars=[2], energy_every=0)
+        _, expected = self.evolve(clusters[:2], NumpyOutput, output_policy=policy)
+        _, results = self.evolve(clusters[:2], NumpyOutput, output_policy=policy, cache=tmp_path)
+
+        for result, expected_result in zip(results, expected):
+            assert np.array_equal(result.time, expected_result.time)
+            assert np.array_equal(result.states, expected_result.states, equal_nan=True)
+            assert np.array_equal(result.total_energy, expected_result.total_energy, equal_nan=True)
+
+    def test_cache_round_trip(self, tmp_path):
+        cache = ResultCache(tmp_path)
+        run = _CachedRun(snapshots=np.random.default_rng(0).normal(size=(3, Snapshot.size(2))),
+                         state='1 2 3',
+                         report=SimulationReport(steps=4, max_energy_error=1e-12, min_separation=0.5,
+                                                 min_separation_time=0.25, virial_ratio=1.0, mean_virial_ratio=0.9),
+                         stop_reason=StopReason.ESCAPE)
+        cache.store('key', run)
+
+        loaded = cache.load('key')
+        assert np.array_equal(loaded.snapshots, run.snapshots)
+        assert (loaded.state, loaded.report, loaded.stop_reason) == (run.state, run.report, run.stop_reason)
+        assert cache.load('other') is None
+
+        cache.clear()
+        assert len(cache) == 0 and cache.load('key') is None
+
+    def test_cache_eviction(self, tmp_path):
+        cache = ResultCache(tmp_path, max_size=2000)
+        run = _CachedRun(snapshots=np.zeros((2, 50)), state='0', report=None, stop_reason=StopReason.COMPLETED)
+        for index, key in enumerate(['a', 'b', 'c']):
+            cache.store(key, run)
+            os.utime(tmp_path / f'{key}.brc', (index, index))
+
+        # Loading b marks it as the most recently used, so the least recently used a and c are evicted
+        assert cache.load('b') is not None
+        cache.store('d', run)
+        assert len(cache) == 2 and cache.size <= 2000
+        assert cache.load('a') is None and cache.load('c') is None
+        assert cache.load('b') is not None and cache.load('d') is not None
+
+        # Results larger than the cache are not stored
+        cache.store('e', _CachedRun(snapshots=np.zeros((10, 50)), state='0', report=None,
+                                    stop_reason=StopReason.COMPLETED))
+        assert cache.load('e') is None and len(cache) == 2
+
+    def test_cache_max_age(self, tmp_path):
+        cache = ResultCache(tmp_path, max_age=60)
+        run = _CachedRun(snapshots=np.zeros((1, 13)), state='0', report=None, stop_reason=StopReason.COMPLETED)
+        cache.store('old', run)
+        os.utime(tmp_path / 'old.brc', (0, 0))
+        cache.store('new', run)
+
+        assert cache.load('old') is None
+        assert cache.load('new') is not None
+
+    @pytest.mark.parametrize('settings', [{'max_size': 0}, {'max_age': -1}])
+    def test_cache_invalid(self, settings, tmp_path):
+        with pytest.raises(ValueError):
+            ResultCache(tmp_path, **settings)
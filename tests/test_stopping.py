@@ -0,0 +1,23 @@
+import pytest
+from brutus import StoppingConditions, StopReason
+
+
+class TestStoppingConditions:
+    def test_stopping_conditions_defaults(self):
+        conditions = StoppingConditions()
+        assert conditions.escape_radius is None
+        assert conditions.encounter_distance is None
+        assert conditions.max_energy_error is None
+        assert conditions.wall_time is None
+
+    @pytest.mark.parametrize('name', ['escape_radius', 'encounter_distance', 'max_energy_error', 'wall_time'])
+    def test_stopping_conditions_invalid(self, name):
+        with pytest.raises(ValueError):
+            StoppingConditions(**{name: 0})
+
+        with pytest.raises(ValueError):
+            StoppingConditions(**{name: -1})
+
+    def test_stop_reason_codes(self):
+        assert StopReason(0) is StopReason.COMPLETED
+        assert StopReason.ESCAPE == 1